@@ -1,7 +1,35 @@
+"""
+Context Refiner — rewrites the introduction-style sections of a lab markdown file
+for the target industry.
+
+Run as a script it refines one file and exits. The worker imports it instead and
+calls refine_file() for every job on one event loop, sharing a RefinerClient so
+all refinements reuse pooled HTTP connections. In-process responses are streamed:
+each file is patched as soon as its last section arrives, and a stalled stream is
+abandoned rather than waited out.
+"""
+import asyncio
 import os
+import re
 import sys
 import json
-import requests
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+try:
+    from _factory.core import http_client
+    from _factory.core.gemini_rest import astream_gemini
+except ImportError:
+    http_client = astream_gemini = None
+
+try:
+    from _factory.core import llm_stream
+    from _factory.core import token_accounting
+    from _factory.core.rate_limiter import limiter
+except ImportError:
+    llm_stream = token_accounting = limiter = None
 
 try:
     import ollama
@@ -18,27 +46,112 @@ TARGET_KEYWORDS = {
 
 GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
 
+# Provider token counts of this process's call_llm calls, printed for the worker on exit
+USAGE = {"input_tokens": 0, "output_tokens": 0, "calls": 0, "exact": True}
+
+
+def _count_usage(usage):
+    USAGE["calls"] += 1
+    if usage is None:
+        USAGE["exact"] = False
+        return
+    USAGE["input_tokens"] += usage[0]
+    USAGE["output_tokens"] += usage[1]
+
+
 def call_llm(prompt):
     """Use Gemini REST if API key available, otherwise fall back to Ollama."""
     api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
     model = os.environ.get("REFINER_MODEL", "gemini-2.5-flash")
-    if api_key and not model.startswith("llama") and not model.startswith("qwen"):
+    tokens = token_accounting.local_count(prompt) if token_accounting else 0
+    if api_key and http_client is not None and not model.startswith("llama") and not model.startswith("qwen"):
         try:
             url = GEMINI_API_URL.format(model=model) + f"?key={api_key}"
             payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0.7, "maxOutputTokens": 4096}}
-            resp = requests.post(url, json=payload, timeout=90)
-            resp.raise_for_status()
-            return resp.json()["candidates"][0]["content"]["parts"][0]["text"]
+            data = http_client.post_json(url, payload, provider="gemini", timeout=90, model=model, tokens=tokens)
+            text = data["candidates"][0]["content"]["parts"][0]["text"]
+            usage = token_accounting.usage_from_gemini(data.get("usageMetadata")) if token_accounting else None
+            limiter().settle("gemini", model, tokens, usage)
+            _count_usage(usage)
+            return text
         except Exception as e:
             print(f"   → Gemini REST failed ({e}), falling back to Ollama")
     print("   → Using Ollama (local)")
     if ollama is None:
         print("   → Ollama not available, skipping refinement")
         return ""
+    if limiter is not None:
+        limiter().acquire("ollama", model, tokens)
     response = ollama.chat(model=model, messages=[{"role": "user", "content": prompt}])
+    usage = token_accounting.usage_from_ollama(response) if token_accounting else None
+    if limiter is not None:
+        limiter().settle("ollama", model, tokens, usage)
+    _count_usage(usage)
     return response["message"]["content"]
 
 
+class RefinerClient:
+    """
+    Async counterpart of call_llm for in-process refinement. One instance serves
+    every file refined on an event loop, so Gemini and Ollama requests reuse a
+    pooled set of keep-alive connections instead of a new TCP connection per file.
+    Gemini calls get the shared client's retries and circuit breaker. Every call
+    streams; on_metrics receives its StreamMetrics (time to first token, tokens/s).
+    """
+
+    def __init__(self, model=None, max_connections=8, on_metrics=None):
+        if http_client is None or llm_stream is None:
+            raise ImportError("_factory.core.http_client (httpx) is required for in-process refinement")
+        self.model = model or os.environ.get("REFINER_MODEL", "gemini-2.5-flash")
+        self.api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+        self.http = http_client.AsyncHttpClient(max_connections=max_connections, timeout=90)
+        self.on_metrics = on_metrics
+        self._ollama = None
+
+    async def stream(self, prompt):
+        """Yield the response as it is generated; Gemini falls back to Ollama if it fails before any text."""
+        if self.api_key and not self.model.startswith("llama") and not self.model.startswith("qwen"):
+            metrics = llm_stream.StreamMetrics("gemini", self.model)
+            started = False
+            try:
+                async for text in astream_gemini(prompt, model=self.model, client=self.http, metrics=metrics):
+                    started = True
+                    yield text
+                self._report(metrics)
+                return
+            except Exception:
+                if started:
+                    raise
+        if ollama is None:
+            return
+        if self._ollama is None:
+            self._ollama = ollama.AsyncClient()
+        metrics = llm_stream.StreamMetrics("ollama", self.model)
+        async for text in llm_stream.stream_ollama(self._ollama, self.model, prompt, metrics):
+            yield text
+        self._report(metrics)
+
+    async def call(self, prompt):
+        return "".join([text async for text in self.stream(prompt)])
+
+    def _report(self, metrics):
+        if self.on_metrics is not None:
+            self.on_metrics(metrics)
+
+    async def aclose(self):
+        await self.http.aclose()
+        if self._ollama is not None:
+            await self._ollama.close()
+
+
+def write_atomic(file_path, text):
+    """Replace file_path via a temp file so hardlinked build outputs are never edited in place."""
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, file_path)
+
+
 def extract_target_sections(content):
     """Return list of {heading, body} dicts for headings matching TARGET_KEYWORDS."""
     sections = []
@@ -106,7 +219,43 @@ def parse_refined_sections(llm_response):
     return sections
 
 
-def refine_intro_paragraph(content, industry_name, tone):
+TONE_INSTRUCTIONS = {
+    "Strategic & Analytical": "Use executive language: ROI, stakeholder outcomes, governance, risk-adjusted returns, strategic imperatives.",
+    "Technical & Precise":    "Use engineering register: system architecture, implementation details, performance characteristics, failure modes.",
+    "Practical & Applied":    "Use practitioner language: step-by-step workflows, real-world constraints, operational trade-offs.",
+    "Conversational & Accessible": "Use plain, approachable language: relatable analogies, jargon-free explanations, encourage curiosity.",
+}
+
+# Part of every section cache key: bump when the prompts change so cached rewrites are refreshed
+PROMPT_VERSION = "2"
+
+SECTION_ID = re.compile(r"^\[(f\d+:s\d+)\]\s*(.*)$")
+
+
+def sections_prompt(extracted_text, industry_name, tone, tagged=False):
+    """Rewrite instructions followed by the sections; tagged sections carry an [fN:sM] id before the heading."""
+    tone_instruction = TONE_INSTRUCTIONS.get(tone, TONE_INSTRUCTIONS["Practical & Applied"])
+    heading = "[<id>] <original heading>" if tagged else "<original heading>"
+    keep_ids = "\n5. Keep every [fN:sM] id exactly as given; sections come from several files" if tagged else ""
+    return f"""You are a technical curriculum expert rewriting sections for the {industry_name} industry.
+
+Tone: {tone}
+Tone guidance: {tone_instruction}
+
+Rewrite each section below. Rules:
+1. Replace generic analogies with {industry_name}-specific ones
+2. Keep all technical terms, commands, and code references identical
+3. Match the tone and vocabulary described above
+4. Return ONLY the rewritten sections in this exact format:
+   ## SECTION: {heading}
+   <rewritten body>
+   ## END_SECTION{keep_ids}
+
+Sections to rewrite:
+{extracted_text}"""
+
+
+async def refine_intro_paragraph(content, industry_name, tone, llm, cache=None, model=None):
     """Fallback: rewrite the first prose paragraph for industry specificity."""
     lines = content.splitlines()
     # Find first non-heading, non-empty paragraph after the title
@@ -142,92 +291,218 @@ def refine_intro_paragraph(content, industry_name, tone):
 Original:
 {original_para}"""
 
-    try:
-        rewritten = call_llm(prompt).strip()
+    key = cache.key("", original_para, industry_name, tone, _model(model), PROMPT_VERSION) if cache else None
+    rewritten = cache.get(key) if cache else None
+    if rewritten is None:
+        # A failed LLM call propagates so the caller can fail and retry the job
+        rewritten = (await llm(prompt)).strip()
         if not rewritten or len(rewritten) < 20 or rewritten.startswith("#"):
             return None
         # Remove any markdown fencing the LLM might add
         if rewritten.startswith("```"):
             rewritten = rewritten.split("```")[1].strip()
-        new_lines = list(lines)
-        new_lines[para_start:para_end+1] = [rewritten]
-        return "\n".join(new_lines)
-    except Exception:
-        return None
-
-
-def refine_markdown(file_path, industry_name, industry_slug):
-    """Surgically rewrite only Introduction/Business Value sections for the target industry."""
-    print(f"✨ Refining {os.path.basename(file_path)} for {industry_name}...")
-    tone = os.environ.get("REFINER_TONE", "Practical & Applied")
+        if cache:
+            cache.put(key, rewritten)
+    new_lines = list(lines)
+    new_lines[para_start:para_end+1] = [rewritten]
+    return "\n".join(new_lines)
+
+
+def _model(model):
+    return model or os.environ.get("REFINER_MODEL", "gemini-2.5-flash")
+
+
+async def refine_file(file_path, industry_name, industry_slug, llm, tone=None, log=print, cache=None, model=None,
+                      stream=None):
+    """
+    Surgically rewrite only Introduction/Business Value sections for the target industry.
+    llm is an async callable prompt -> text; progress messages go to log. A failed LLM
+    call is raised after it is logged, leaving the file unchanged. With a
+    SectionCache, sections refined before (same text, industry, tone and model) are
+    patched from the cache and only new sections are sent to the LLM. stream, an
+    async generator function prompt -> text chunks, is used for sections when given.
+    """
+    log(f"✨ Refining {os.path.basename(file_path)} for {industry_name}...")
+    tone = tone or os.environ.get("REFINER_TONE", "Practical & Applied")
 
     with open(file_path, "r") as f:
         content = f.read()
 
-    target_sections = extract_target_sections(content)
-    if not target_sections:
+    if not extract_target_sections(content):
         # Fallback: refine the first prose paragraph after the title
-        refined = refine_intro_paragraph(content, industry_name, tone)
+        refined = await refine_intro_paragraph(content, industry_name, tone, llm, cache, model)
         if refined and refined != content:
-            with open(file_path, "w") as f:
-                f.write(refined)
-            print(f"✅ Refined intro paragraph in {os.path.basename(file_path)}")
+            write_atomic(file_path, refined)
+            log(f"✅ Refined intro paragraph in {os.path.basename(file_path)}")
         else:
-            print(f"⚠️  No refinable sections in {os.path.basename(file_path)}, skipping.")
+            log(f"⚠️  No refinable sections in {os.path.basename(file_path)}, skipping.")
         return
 
-    extracted_text = "\n\n".join(
-        f"## SECTION: {s['heading']}\n{s['body']}\n## END_SECTION"
-        for s in target_sections
-    )
-
-    TONE_INSTRUCTIONS = {
-        "Strategic & Analytical": "Use executive language: ROI, stakeholder outcomes, governance, risk-adjusted returns, strategic imperatives.",
-        "Technical & Precise":    "Use engineering register: system architecture, implementation details, performance characteristics, failure modes.",
-        "Practical & Applied":    "Use practitioner language: step-by-step workflows, real-world constraints, operational trade-offs.",
-        "Conversational & Accessible": "Use plain, approachable language: relatable analogies, jargon-free explanations, encourage curiosity.",
-    }
-    tone_instruction = TONE_INSTRUCTIONS.get(tone, TONE_INSTRUCTIONS["Practical & Applied"])
-
-    prompt = f"""You are a technical curriculum expert rewriting sections for the {industry_name} industry.
-
-Tone: {tone}
-Tone guidance: {tone_instruction}
-
-Rewrite each section below. Rules:
-1. Replace generic analogies with {industry_name}-specific ones
-2. Keep all technical terms, commands, and code references identical
-3. Match the tone and vocabulary described above
-4. Return ONLY the rewritten sections in this exact format:
-   ## SECTION: <original heading>
-   <rewritten body>
-   ## END_SECTION
-
-Sections to rewrite:
-{extracted_text}"""
-
-    estimated_tokens = len(prompt) // 4
-    print(f"   → Sending ~{estimated_tokens} tokens to LLM (was ~750)")
-
     try:
-        llm_output = call_llm(prompt).strip()
+        await refine_batch([file_path], industry_name, industry_slug, llm, tone, log, cache, model, stream)
+    except Exception as e:
+        log(f"❌ Failed to refine {file_path}: {e}")
+        raise
 
-        refined_sections = parse_refined_sections(llm_output)
-        if not refined_sections:
-            print(f"⚠️  Could not parse LLM response for {file_path}, skipping write.")
+
+def estimate_section_tokens(file_path, estimator=None, key=None):
+    """
+    Prompt tokens the file's target sections add to a batch; 0 when it has none.
+    With a TokenEstimator the local count is scaled by key's calibrated factor;
+    without one it is the uncalibrated local count.
+    """
+    with open(file_path, "r") as f:
+        text = "\n".join(s["heading"] + "\n" + s["body"] for s in extract_target_sections(f.read()))
+    if not text:
+        return 0
+    if estimator is not None:
+        return estimator.estimate(text, key)
+    return token_accounting.local_count(text) if token_accounting else len(text) // 4
+
+
+def pack_batches(items, max_tokens):
+    """
+    Greedily group (key, tokens) items, in order, into batches of at most max_tokens.
+    A single item larger than max_tokens gets a batch of its own.
+    """
+    batches, current, used = [], [], 0
+    for key, tokens in items:
+        if current and used + tokens > max_tokens:
+            batches.append(current)
+            current, used = [], 0
+        current.append(key)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def refine_batch(file_paths, industry_name, industry_slug, llm, tone=None, log=print, cache=None, model=None,
+                       stream=None):
+    """
+    Refine the target sections of several files with one LLM call. Each section is
+    sent as "## SECTION: [fN:sM] <heading>" and patched back into file N by its id,
+    so the shared instructions and tone guidance are paid for once per batch.
+    Sections found in cache are patched without being sent; when every section is
+    cached no call is made. Files without target sections fall back to refine_file.
+
+    With stream, the response is parsed as it arrives and each file is written as
+    soon as its last section is in. If the stream breaks after some sections have
+    arrived, those are kept and the rest are left unchanged.
+
+    Returns:
+        dict: file_path -> number of sections patched
+    """
+    tone = tone or os.environ.get("REFINER_TONE", "Practical & Applied")
+    model = _model(model)
+    patched_counts = {path: 0 for path in file_paths}
+    contents, sections, keys, blocks, refined, no_sections = {}, {}, {}, [], {}, []
+    pending, written = {}, set()
+    for n, path in enumerate(file_paths, start=1):
+        with open(path, "r") as f:
+            contents[path] = f.read()
+        targets = extract_target_sections(contents[path])
+        if not targets:
+            no_sections.append(path)
+        for m, section in enumerate(targets, start=1):
+            key = cache.key(section["heading"], section["body"], industry_name, tone, model, PROMPT_VERSION) if cache else None
+            body = cache.get(key) if cache else None
+            if body is not None:
+                refined.setdefault(path, []).append({"heading": section["heading"], "body": body})
+                continue
+            section_id = f"f{n}:s{m}"
+            sections[section_id] = (path, section["heading"])
+            keys[section_id] = key
+            pending.setdefault(path, set()).add(section_id)
+            blocks.append(f"## SECTION: [{section_id}] {section['heading']}\n{section['body']}\n## END_SECTION")
+
+    def write(path):
+        written.add(path)
+        file_sections = refined.get(path, [])
+        patched = patch_sections(contents[path], file_sections)
+        if patched != contents[path] and ("# " in patched or "## " in patched):
+            write_atomic(path, patched)
+            patched_counts[path] = len(file_sections)
+            log(f"✅ Patched {len(file_sections)} section(s) in {os.path.basename(path)}")
+
+    def accept(section):
+        match = SECTION_ID.match(section["heading"])
+        if not match or match.group(1) not in sections:
+            return
+        section_id = match.group(1)
+        path, heading = sections[section_id]
+        if section_id not in pending[path]:
             return
+        # Patch under the original heading, whatever the model echoed back
+        refined.setdefault(path, []).append({"heading": heading, "body": section["body"]})
+        if cache:
+            cache.put(keys[section_id], section["body"])
+        pending[path].discard(section_id)
+        if not pending[path]:
+            write(path)
+
+    for path in no_sections:
+        await refine_file(path, industry_name, industry_slug, llm, tone, log, cache, model)
+
+    cached = sum(len(v) for v in refined.values())
+    # Files served entirely from cache need no LLM output
+    for path in list(refined):
+        if not pending.get(path):
+            write(path)
+    if blocks:
+        prompt = sections_prompt("\n\n".join(blocks), industry_name, tone, tagged=True)
+        log(f"   → Sending {len(blocks)} section(s) from {len(pending)} file(s) "
+            f"in one call (~{len(prompt) // 4} tokens); {cached} from cache")
+        if stream is not None:
+            parser = llm_stream.SectionStreamParser()
+            try:
+                async for text in stream(prompt):
+                    for section in parser.feed(text):
+                        accept(section)
+                for section in parser.close():
+                    accept(section)
+            except Exception as e:
+                received = len(blocks) - sum(len(ids) for ids in pending.values())
+                if not received:
+                    raise
+                log(f"⚠️  Stream ended early ({e}); keeping the {received} section(s) received.")
+        else:
+            for section in parse_refined_sections((await llm(prompt)).strip()):
+                accept(section)
+    elif cached:
+        log(f"   → All {cached} section(s) served from cache, no LLM call")
+
+    for path in refined:
+        if path not in written:
+            write(path)
+    missing = sum(len(ids) for ids in pending.values())
+    if missing:
+        log(f"⚠️  {missing} section(s) missing from the LLM response, left unchanged.")
+    return patched_counts
+
+
+def open_section_cache():
+    """The factory's SectionCache when this script runs inside the repo, else None."""
+    try:
+        from _factory.core.section_cache import SectionCache
+    except ImportError:
+        return None
+    return SectionCache(os.environ.get("SECTION_CACHE_DIR") or os.path.join(REPO_ROOT, "_factory", "cache"))
 
-        patched = patch_sections(content, refined_sections)
 
-        if "# " in patched or "## " in patched:
-            with open(file_path, "w") as f:
-                f.write(patched)
-            print(f"✅ Patched {len(refined_sections)} section(s) in {os.path.basename(file_path)}")
-        else:
-            print(f"⚠️  Patched output didn't look like markdown, skipping write.")
+def refine_markdown(file_path, industry_name, industry_slug):
+    """Script entry point: refine one file with the blocking call_llm."""
+    async def llm(prompt):
+        return call_llm(prompt)
 
-    except Exception as e:
-        print(f"❌ Failed to refine {file_path}: {e}")
+    cache = open_section_cache()
+    try:
+        asyncio.run(refine_file(file_path, industry_name, industry_slug, llm, cache=cache))
+    finally:
+        if cache is not None:
+            cache.close()
+        if token_accounting is not None:
+            print(token_accounting.USAGE_MARKER + json.dumps(USAGE))
 
 
 if __name__ == "__main__":
@@ -1,7 +1,17 @@
 import os
 import sys
 import json
-import requests
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+try:
+    from _factory.core.http_client import post_json
+    from _factory.core.rate_limiter import limiter
+    from _factory.core.token_accounting import local_count, usage_from_gemini, usage_from_ollama
+except ImportError:
+    post_json = limiter = None
 
 try:
     import ollama
@@ -14,25 +24,36 @@ def call_llm(prompt):
     """Use Gemini REST if API key available, otherwise fall back to Ollama."""
     api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
     model = os.environ.get("SYNTH_MODEL", "gemini-2.5-flash-lite")
-    if api_key and not model.startswith("llama") and not model.startswith("qwen"):
+    if api_key and post_json is not None and not model.startswith("llama") and not model.startswith("qwen"):
         try:
             url = GEMINI_API_URL.format(model=model) + f"?key={api_key}"
             payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0.7, "maxOutputTokens": 4096}}
-            resp = requests.post(url, json=payload, timeout=90)
-            resp.raise_for_status()
+            tokens = local_count(prompt)
+            data = post_json(url, payload, provider="gemini", timeout=90, model=model, tokens=tokens)
+            limiter().settle("gemini", model, tokens, usage_from_gemini(data.get("usageMetadata")))
             print("   → Using Gemini (cloud)")
-            return resp.json()["candidates"][0]["content"]["parts"][0]["text"]
+            return data["candidates"][0]["content"]["parts"][0]["text"]
         except Exception as e:
             print(f"   → Gemini REST failed ({e}), falling back to Ollama")
     print("   → Using Ollama (local)")
     if ollama is None:
         print("   → Ollama not available")
         return ""
+    if limiter is None:
+        response = ollama.chat(model=model, messages=[{'role': 'user', 'content': prompt}])
+        return response['message']['content']
+    tokens = local_count(prompt)
+    limiter().acquire("ollama", model, tokens)
     response = ollama.chat(model=model, messages=[{'role': 'user', 'content': prompt}])
+    limiter().settle("ollama", model, tokens, usage_from_ollama(response))
     return response['message']['content']
 
-def generate_dirty_data(slug, industry, columns=None, dirty_rate=0.15, row_count=50):
-    """Generate dirty CSV data for a specific industry."""
+def generate_dirty_data(slug, industry, columns=None, dirty_rate=0.15, row_count=50, target_dir=None):
+    """Generate dirty CSV data for a specific industry.
+
+    Writes into target_dir when given (the compiler passes a per-industry
+    directory), otherwise into the shared session 01 data template.
+    """
     print(f"🧬 Generating {row_count} rows of synthetic data for {industry}...")
 
     if columns:
@@ -58,7 +79,8 @@ START CSV NOW."""
                 csv_content = '\n'.join(lines[i:])
                 break
 
-        target_dir = os.path.join(os.path.dirname(__file__), "../../../_factory/templates/01_data_pipeline_automation/set_{{ industry_slug }}/data")
+        if target_dir is None:
+            target_dir = os.path.join(os.path.dirname(__file__), "../../../_factory/templates/01_data_pipeline_automation/set_{{ industry_slug }}/data")
         os.makedirs(target_dir, exist_ok=True)
 
         target_file = os.path.join(target_dir, "dirty_data.csv")
@@ -74,9 +96,10 @@ START CSV NOW."""
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("Usage: python3 data_synth.py <slug> <industry> [columns] [dirty_rate] [row_count]")
+        print("Usage: python3 data_synth.py <slug> <industry> [columns] [dirty_rate] [row_count] [target_dir]")
         sys.exit(1)
     _columns = sys.argv[3] if len(sys.argv) > 3 else None
     _dirty_rate = float(sys.argv[4]) if len(sys.argv) > 4 else 0.15
     _row_count = int(sys.argv[5]) if len(sys.argv) > 5 else 50
-    generate_dirty_data(sys.argv[1], sys.argv[2], _columns, _dirty_rate, _row_count)
+    _target_dir = sys.argv[6] if len(sys.argv) > 6 else None
+    generate_dirty_data(sys.argv[1], sys.argv[2], _columns, _dirty_rate, _row_count, _target_dir)
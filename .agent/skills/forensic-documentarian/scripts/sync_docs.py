@@ -87,6 +87,13 @@ def capture_output(cmd: list, cwd: str = None) -> str:
         return f"[ERROR: {e}]"
 
 
+def replace_atomic(path: str, write) -> None:
+    """Write path through a temp file and os.replace, so hardlinked build outputs are never edited in place."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
 def update_markdown(md_path: str, new_output: str, regex_pattern: str | None, proof_heading: str | None) -> bool:
     """Update the Proof of Work section in a markdown file."""
     if not os.path.exists(md_path):
@@ -111,8 +118,14 @@ def update_markdown(md_path: str, new_output: str, regex_pattern: str | None, pr
         return False
 
     new_content = pattern.sub(rf"\g<1>{new_output}\g<2>", content)
-    with open(md_path, "w", encoding="utf-8") as f:
-        f.write(new_content)
+    if new_content == content:
+        print(f"Unchanged: {md_path}")
+        return True
+
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(new_content)
+    replace_atomic(md_path, write)
     print(f"Updated: {md_path}")
     return True
 
@@ -129,7 +142,7 @@ def save_proof(output_text: str, title: str, output_dir: str) -> str:
     latest_path = os.path.join(output_dir, "latest.svg")
 
     console.save_svg(svg_path, title=title, theme=MONOKAI)
-    shutil.copy2(svg_path, latest_path)
+    replace_atomic(latest_path, lambda tmp_path: shutil.copy2(svg_path, tmp_path))
     print(f"Proof saved: {svg_path}")
     print(f"Latest:      {latest_path}")
     return svg_path
@@ -0,0 +1,130 @@
+"""
+Build Cache Benchmark — warm-build check cost per file
+Compares the original read-and-hash check (legacy_hash: template content plus the
+full context) against BuildCache.check() on its stat fast path, as Pass 1 calls it, over a synthetic template tree,
+then alternates two build namespaces to confirm neither evicts the other.
+
+Usage: python3 _factory/benchmark/cache_benchmark.py [file_count] [file_kb]
+"""
+
+import hashlib
+import json
+import os
+import sys
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core.cache import BuildCache
+
+DIVIDER = "=" * 70
+
+CONTEXT = {
+    "industry_name": "AI for Global Finance",
+    "industry_slug": "ai_for_global_finance",
+    "use_cases": ["Risk Modeling & Liquidity Prediction", "Quantitative Sentiment Swarms"],
+    "terminology": ["Liquidity", "Basel III", "VaR", "Stress Testing", "Alpha"],
+    "data_scenario": "Reconciling intraday trade ledgers against custodian feeds. " * 4,
+    "tone": "Strategic & Analytical",
+    "planned_sessions": [{"session_number": i, "title": f"Session {i}", "description": "x" * 200} for i in range(1, 9)],
+}
+VARIABLES = ["industry_name", "industry_slug"]
+
+
+def make_tree(root: str, file_count: int, file_kb: int) -> list[str]:
+    body = ("Lorem ipsum {{ industry_name }} dolor sit amet.\n" * 24)[:1024] * file_kb
+    paths = []
+    for i in range(file_count):
+        path = os.path.join(root, f"{i:02d}_session", f"lab_{i}.md")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(body)
+        paths.append(path)
+    return paths
+
+
+def legacy_hash(template_path: str, context: dict) -> str:
+    """The original cache key: SHA256 of the template source plus the whole context."""
+    with open(template_path, "r", encoding="utf-8", errors="ignore") as f:
+        file_content = f.read()
+    return hashlib.sha256((file_content + json.dumps(context, sort_keys=True)).encode("utf-8")).hexdigest()
+
+
+def bench_legacy(paths: list[str]) -> float:
+    hashes = {p: legacy_hash(p, CONTEXT) for p in paths}
+    t0 = time.perf_counter()
+    for p in paths:
+        # Original flow: is_cached() hashes once, mark_cached() would hash again on a miss
+        assert legacy_hash(p, CONTEXT) == hashes[p]
+    return time.perf_counter() - t0
+
+
+def bench_fast_path(paths: list[str], cache_dir: str) -> tuple[float, float]:
+    cache = BuildCache(cache_dir=cache_dir)
+    cache.begin_build(CONTEXT)
+    for p in paths:
+        cache.record(p, cache.check(p, p, VARIABLES)[1])
+    cache.save()
+
+    t0 = time.perf_counter()
+    warm = BuildCache(cache_dir=cache_dir)
+    load_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    warm.begin_build(CONTEXT)
+    for p in paths:
+        assert warm.check(p, p, VARIABLES)[0]
+    return load_time, time.perf_counter() - t0
+
+
+def bench_alternating(paths: list[str], cache_dir: str) -> dict:
+    """Build A, then B, then A again over the same rendered paths; count A's warm hits."""
+    for namespace, industry in (("finance", "AI for Global Finance"), ("healthcare", "AI for Healthcare")):
+        cache = BuildCache(cache_dir=cache_dir, namespace=namespace)
+        cache.begin_build(dict(CONTEXT, industry_name=industry))
+        for p in paths:
+            cache.record(p, cache.check(p, p, VARIABLES)[1])
+        cache.save()
+        cache.close()
+
+    again = BuildCache(cache_dir=cache_dir, namespace="finance")
+    again.begin_build(CONTEXT)
+    hits = sum(again.check(p, p, VARIABLES)[0] for p in paths)
+    return {"hits": hits, "namespaces": again.namespaces()}
+
+
+def main():
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    file_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    root = tempfile.mkdtemp(prefix="cache_bench_")
+    try:
+        paths = make_tree(os.path.join(root, "templates"), file_count, file_kb)
+
+        print(f"\n{'#' * 70}")
+        print(f"  BUILD CACHE BENCHMARK: {file_count} files x {file_kb} KB, warm build")
+        print(f"{'#' * 70}")
+
+        legacy = bench_legacy(paths)
+        load, fast = bench_fast_path(paths, os.path.join(root, "cache"))
+
+        print(f"\n  {'Check':<32} {'Total':>10} {'Per file':>12}")
+        print(f"  {'-'*32} {'-'*10} {'-'*12}")
+        print(f"  {'read + hash + full context':<32} {legacy * 1000:>8.1f}ms {legacy / file_count * 1e6:>9.1f}µs")
+        print(f"  {'stat fast path':<32} {fast * 1000:>8.1f}ms {fast / file_count * 1e6:>9.1f}µs")
+        print(f"  {'cache load (sqlite)':<32} {load * 1000:>8.1f}ms")
+        print(f"\n  Speedup: {legacy / fast:.1f}x per warm check")
+
+        alternating = bench_alternating(paths, os.path.join(root, "cache_ab"))
+        print(f"\n  Alternating builds (finance -> healthcare -> finance)")
+        print(f"  Namespaces: {alternating['namespaces']}")
+        print(f"  Finance warm hits after healthcare build: {alternating['hits']}/{file_count}")
+        print(DIVIDER)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Queue Benchmark — refinement queue throughput at 10k+ jobs
+Compares the original storage path (rollback journal, no indexes, one transaction
+per enqueue and per claim, stats() as a GROUP BY over every job) against
+RefinementQueue in WAL mode with its indexes: per-row enqueue()/claim_next(),
+then enqueue_many() and claim_batch(). Every run enqueues the same jobs into a
+queue already holding --history finished jobs from earlier builds, claims them
+all, and reads stats() after each claim batch as drain_queue's logging does.
+
+Usage: python3 _factory/benchmark/queue_benchmark.py [job_count] [--batch N] [--history N]
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core.refinement_queue import RefinementQueue
+
+DIVIDER = "=" * 70
+
+
+def make_jobs(job_count, prefix="lab"):
+    return [("retail", f"/tmp/build/{i // 8:04d}_session/{prefix}_{i}.md", "Retail") for i in range(job_count)]
+
+
+class LegacyQueue:
+    """The queue as it stood before WAL, indexes and bulk operations."""
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                industry_slug TEXT NOT NULL, file_path TEXT NOT NULL, industry_name TEXT NOT NULL,
+                status TEXT DEFAULT 'pending', created_at TEXT, completed_at TEXT, error TEXT,
+                lease_owner TEXT, lease_expires REAL, attempts INTEGER DEFAULT 0
+            )
+        """)
+        self.conn.commit()
+
+    def enqueue(self, industry_slug, file_path, industry_name):
+        existing = self.conn.execute(
+            "SELECT id FROM jobs WHERE industry_slug=? AND file_path=? AND status IN ('pending','in_progress')",
+            (industry_slug, file_path)
+        ).fetchone()
+        if existing:
+            return existing["id"]
+        cursor = self.conn.execute(
+            "INSERT INTO jobs (industry_slug, file_path, industry_name, status, created_at) VALUES (?,?,?,'pending',?)",
+            (industry_slug, file_path, industry_name, datetime.now().isoformat())
+        )
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def claim_next(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        row = self.conn.execute("SELECT id FROM jobs WHERE status='pending' ORDER BY id ASC LIMIT 1").fetchone()
+        if row is not None:
+            self.conn.execute(
+                "UPDATE jobs SET status='in_progress', lease_owner='bench', lease_expires=?, attempts=attempts+1 "
+                "WHERE id=? AND status='pending'", (time.time() + 120, row["id"])
+            )
+        self.conn.commit()
+        return None if row is None else dict(self.conn.execute("SELECT * FROM jobs WHERE id=?", (row["id"],)).fetchone())
+
+    def stats(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+def add_history(queue, history):
+    """Finished jobs from earlier builds (done jobs are cleared, failed ones stay)."""
+    queue.conn.executemany(
+        "INSERT INTO jobs (industry_slug, file_path, industry_name, status) VALUES (?,?,?,'failed')",
+        make_jobs(history, prefix="old")
+    )
+    queue.conn.commit()
+
+
+def bench(queue, jobs, bulk, batch):
+    t0 = time.perf_counter()
+    if bulk:
+        queue.enqueue_many(jobs)
+    else:
+        for job in jobs:
+            queue.enqueue(*job)
+    enqueue = time.perf_counter() - t0
+
+    claimed = 0
+    t0 = time.perf_counter()
+    while True:
+        got = queue.claim_batch(batch) if bulk else [job for job in [queue.claim_next()] if job]
+        if not got:
+            break
+        claimed += len(got)
+        if bulk or claimed % batch == 0:
+            queue.stats()
+    claim = time.perf_counter() - t0
+    assert claimed == len(jobs)
+    return enqueue, claim
+
+
+def main():
+    args = [a for a in sys.argv[1:2] if not a.startswith("--")]
+    job_count = int(args[0]) if args else 10000
+    batch = int(sys.argv[sys.argv.index("--batch") + 1]) if "--batch" in sys.argv else 16
+    history = int(sys.argv[sys.argv.index("--history") + 1]) if "--history" in sys.argv else 10000
+
+    root = tempfile.mkdtemp(prefix="queue_bench_")
+    try:
+        print(f"\n{'#' * 70}")
+        print(f"  QUEUE BENCHMARK: {job_count} jobs over {history} finished, claim batch {batch}")
+        print(f"{'#' * 70}")
+
+        jobs = make_jobs(job_count)
+        results = {}
+        for n, (label, make, bulk) in enumerate((
+            ("original", LegacyQueue, False),
+            ("wal + indexes", RefinementQueue, False),
+            ("bulk", RefinementQueue, True),
+        )):
+            queue = make(os.path.join(root, f"queue_{n}.db"))
+            add_history(queue, history)
+            results[label] = bench(queue, jobs, bulk, batch)
+            queue.conn.close()
+
+        print(f"\n  {'Path':<16} {'Enqueue':>10} {'Jobs/s':>10} {'Claim':>10} {'Jobs/s':>10}")
+        print(f"  {'-'*16} {'-'*10} {'-'*10} {'-'*10} {'-'*10}")
+        for label, (enqueue, claim) in results.items():
+            print(f"  {label:<16} {enqueue * 1000:>8.0f}ms {job_count / enqueue:>10.0f} "
+                  f"{claim * 1000:>8.0f}ms {job_count / claim:>10.0f}")
+        (old_enqueue, old_claim), (new_enqueue, new_claim) = results["original"], results["bulk"]
+        print(f"\n  Speedup: enqueue {old_enqueue / new_enqueue:.1f}x, claim {old_claim / new_claim:.1f}x")
+        print(DIVIDER)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
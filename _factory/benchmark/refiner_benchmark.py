@@ -0,0 +1,194 @@
+"""
+Refiner Benchmark — per-file Pass 2 overhead, subprocess vs in-process vs batched
+Drains the same refinement queue against a local stub Ollama server: with one
+context_refiner.py subprocess per file, with the refiner imported into the worker
+and sharing one pooled client, and in-process with several files packed into each
+prompt (token_budget.batch_tokens). The stub answers instantly (or after --latency
+ms), so the differences are interpreter startup, imports, connection setup and
+the number of LLM calls. A final rerun over freshly rendered files, one of them
+edited, shows the section cache sending only the changed section. In-process
+calls stream: the stub sends one section per chunk, spreading --latency across
+them, and the TTFT column is the average time to first token. Tokens is what the
+budget was charged: the stub's prompt_eval_count / eval_count, not an estimate.
+
+Usage: python3 _factory/benchmark/refiner_benchmark.py [file_count] [--latency ms] [--concurrency N] [--batch-tokens N]
+"""
+
+import asyncio
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core.refinement_queue import RefinementQueue
+from _factory.core.worker import drain_queue, open_refiner
+
+DIVIDER = "=" * 70
+REFINER_SCRIPT = os.path.join(os.path.dirname(__file__), "../../.agent/skills/factory/context_refiner.py")
+MODEL = "qwen2.5:0.5b"
+BUDGET = {"total_tokens": 10 ** 9, "defer_after_tokens": 10 ** 9}
+
+LAB = """# Lab {i}: Data Pipeline Automation
+
+## Introduction
+Every team collects data faster than it can clean it. In this lab you automate
+the clean-up for report {i} so its numbers can be trusted.
+
+## Step 1
+Run `python3 pipeline.py` and inspect the output.
+"""
+
+
+class QuietLogger:
+    def log(self, event, level="INFO", metadata=None):
+        pass
+
+
+def start_stub(latency_s):
+    """Stub of Ollama's /api/chat that rewrites every section it is sent (streamed as NDJSON when asked); counts calls."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            server.calls += 1
+            prompt = request["messages"][-1]["content"]
+            to_rewrite = prompt.split("Sections to rewrite:")[-1]
+            sections = [f"## SECTION: {heading}\nRefined for the benchmark industry.\n## END_SECTION\n"
+                        for heading in re.findall(r"^## SECTION: (.+)$", to_rewrite, re.M)]
+            if not request.get("stream"):
+                time.sleep(latency_s)
+                body = json.dumps({"model": MODEL, "message": {"role": "assistant", "content": "".join(sections)},
+                                   "done": True, "prompt_eval_count": len(prompt) // 4,
+                                   "eval_count": 12 * len(sections)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            chunks = [json.dumps({"model": MODEL, "message": {"role": "assistant", "content": text}, "done": False})
+                      for text in sections]
+            chunks.append(json.dumps({"model": MODEL, "message": {"role": "assistant", "content": ""}, "done": True,
+                                      "prompt_eval_count": len(prompt) // 4, "eval_count": 12 * len(sections)}))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in chunks:
+                time.sleep(latency_s / len(chunks))
+                data = (chunk + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.calls = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_files(root, file_count, edited=False):
+    paths = []
+    for i in range(file_count):
+        path = os.path.join(root, f"lab_{i:03d}.md")
+        text = LAB.format(i=i)
+        if edited and i == 0:
+            text = text.replace("can be trusted.", "can be trusted by auditors.")
+        with open(path, "w") as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+
+async def drain(queue, mode, concurrency, batch_tokens):
+    os.environ["REFINER_MODE"] = "subprocess" if mode == "subprocess" else "inprocess"
+    logger = QuietLogger()
+    async with open_refiner(REFINER_SCRIPT, MODEL, concurrency, logger) as refiner:
+        if mode != "subprocess" and refiner is None:
+            raise SystemExit("In-process refiner unavailable (httpx not importable)")
+        budget = dict(BUDGET, batch_tokens=batch_tokens if mode == "batched" else 0)
+        stats = await drain_queue(queue, "Benchmark Industry", REFINER_SCRIPT, MODEL, budget, logger,
+                                  concurrency=concurrency, refiner=refiner)
+        ttfts = [m["ttft_ms"] for m in (refiner.streams if refiner else []) if m["ttft_ms"] is not None]
+        return (sum(ttfts) / len(ttfts) if ttfts else None), stats
+
+
+def bench(root, label, mode, file_count, concurrency, batch_tokens, server, cache_dir, edited=False):
+    work = os.path.join(root, label)
+    os.makedirs(work)
+    os.environ["SECTION_CACHE_DIR"] = os.path.join(root, cache_dir)
+    paths = make_files(work, file_count, edited)
+    queue = RefinementQueue(os.path.join(work, "queue.db"))
+    for path in paths:
+        queue.enqueue("benchmark_industry", path, "Benchmark Industry")
+    calls_before = server.calls
+    t0 = time.perf_counter()
+    ttft, stats = asyncio.run(drain(queue, mode, concurrency, batch_tokens))
+    elapsed = time.perf_counter() - t0
+    refined = sum("Refined for the benchmark industry." in open(p).read() for p in paths)
+    failed = queue.stats()["failed"]
+    queue.conn.close()
+    return elapsed, refined, failed, server.calls - calls_before, ttft, stats["used"]
+
+
+def main():
+    args = [a for a in sys.argv[1:2] if not a.startswith("--")]
+    file_count = int(args[0]) if args else 48
+    latency = float(sys.argv[sys.argv.index("--latency") + 1]) / 1000 if "--latency" in sys.argv else 0.0
+    concurrency = int(sys.argv[sys.argv.index("--concurrency") + 1]) if "--concurrency" in sys.argv else 3
+    batch_tokens = int(sys.argv[sys.argv.index("--batch-tokens") + 1]) if "--batch-tokens" in sys.argv else 2000
+
+    server = start_stub(latency)
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.pop("GEMINI_API_KEY", None)
+    os.environ.pop("GOOGLE_API_KEY", None)
+    root = tempfile.mkdtemp(prefix="refiner_bench_")
+    try:
+        print(f"\n{'#' * 70}")
+        print(f"  REFINER BENCHMARK: {file_count} files, concurrency {concurrency}, stub latency {latency * 1000:.0f}ms, "
+              f"batches of {batch_tokens} tokens")
+        print(f"{'#' * 70}")
+
+        runs = (
+            ("subprocess", "subprocess", "cache_subprocess", False),
+            ("inprocess", "inprocess", "cache_inprocess", False),
+            ("batched", "batched", "cache_batched", False),
+            ("cached rerun", "batched", "cache_batched", True),
+        )
+        results = {label: bench(root, label.replace(" ", "_"), mode, file_count, concurrency, batch_tokens, server,
+                                cache_dir, edited)
+                   for label, mode, cache_dir, edited in runs}
+
+        print(f"\n  {'Mode':<14} {'Total':>10} {'Per file':>12} {'Refined':>9} {'Failed':>8} {'LLM calls':>10} "
+              f"{'TTFT':>9} {'Tokens':>8}")
+        print(f"  {'-'*14} {'-'*10} {'-'*12} {'-'*9} {'-'*8} {'-'*10} {'-'*9} {'-'*8}")
+        for mode, (elapsed, refined, failed, calls, ttft, tokens) in results.items():
+            ttft = "-" if ttft is None else f"{ttft:.1f}ms"
+            print(f"  {mode:<14} {elapsed * 1000:>8.0f}ms {elapsed / file_count * 1000:>10.1f}ms "
+                  f"{refined:>9} {failed:>8} {calls:>10} {ttft:>9} {tokens:>8}")
+        sub, inproc = results["subprocess"][0], results["inprocess"][0]
+        print(f"\n  Per-file overhead saved: {(sub - inproc) / file_count * 1000:.1f}ms ({sub / inproc:.1f}x faster)")
+        print(f"  Batching: {results['inprocess'][3]} -> {results['batched'][3]} LLM calls")
+        print(f"  Rerun with one edited file: {results['cached rerun'][3]} LLM call(s)")
+        print(DIVIDER)
+    finally:
+        server.shutdown()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Adaptive Concurrency — an AIMD limit on in-flight Pass 2 jobs.
+AdaptiveConcurrency is used like asyncio.Semaphore, but its size moves between a
+floor and a ceiling with what each finished job reports (observe): one slot is
+added after every `limit` healthy jobs in a row, and the limit is cut when the
+provider answers 429 (halved), when the recent error rate passes ERROR_RATE, or
+when latency per token (smoothed over the last few jobs) climbs past
+LATENCY_TOLERANCE times the best recently seen, the sign that the backend is
+queueing requests rather than serving them in parallel. Jobs that never reached the
+LLM (tokens=0, e.g. served from the section cache) give no latency sample, and the
+latency check waits for BASELINE_SAMPLES real ones. Jobs that started before
+a cut do not cut again, so one overloaded wave costs one decrease. A remote API
+climbs toward the ceiling; a laptop Ollama that serves one request at a time
+settles at two or three. Every change is logged to telemetry with its reason.
+"""
+import asyncio
+import time
+from collections import deque
+
+try:
+    from _factory.core.rate_limiter import limiter
+except ImportError:
+    from core.rate_limiter import limiter
+
+THROTTLE_BACKOFF = 0.5
+ERROR_BACKOFF = 0.75
+LATENCY_BACKOFF = 0.8
+LATENCY_TOLERANCE = 2.0
+# Weight of the newest job in the smoothed latency
+SMOOTHING = 0.3
+ERROR_RATE = 0.25
+# Latency samples needed before the best-seen baseline is trusted
+BASELINE_SAMPLES = 3
+# Recent job outcomes and latency samples the error rate and latency baseline are taken over
+WINDOW = 32
+
+
+class AdaptiveConcurrency:
+    def __init__(self, initial, floor=1, ceiling=None, logger=None):
+        self.floor = max(1, floor)
+        self.ceiling = max(self.floor, ceiling or initial)
+        self.limit = min(max(initial, self.floor), self.ceiling)
+        self.logger = logger
+        self.in_flight = 0
+        self.changes = []
+        self._waiters = deque()
+        self._healthy = 0
+        self._decreased_at = 0.0
+        self._outcomes = deque(maxlen=WINDOW)
+        self._latencies = deque(maxlen=WINDOW)
+        self._smoothed = None
+
+    @property
+    def adaptive(self):
+        return self.floor < self.ceiling
+
+    async def acquire(self):
+        while self.in_flight >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        free = self.limit - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def probe(self):
+        """Snapshot taken when a job starts calling the LLM; hand it back to observe()."""
+        return time.monotonic(), limiter().throttles
+
+    def observe(self, probe, tokens=0, failed=False):
+        """Adjust the limit for one finished job: its probe, tokens it was charged, and whether it failed."""
+        started, throttles = probe
+        latency = time.monotonic() - started
+        self._outcomes.append(failed)
+        if not self.adaptive:
+            return
+        stale = started < self._decreased_at
+        if limiter().throttles > throttles:
+            if not stale:
+                self._set(self.limit * THROTTLE_BACKOFF, "provider answered 429")
+            return
+        if failed:
+            error_rate = sum(self._outcomes) / len(self._outcomes)
+            if not stale and len(self._outcomes) >= self.limit and error_rate > ERROR_RATE:
+                self._set(self.limit * ERROR_BACKOFF, f"error rate {error_rate:.0%}")
+            return
+        if stale:
+            # Ran under the old limit: says nothing about the current one
+            return
+        if tokens <= 0:
+            # Never reached the LLM: its latency says nothing about the backend
+            return
+        sample = latency / max(tokens, 1)
+        self._latencies.append(sample)
+        self._smoothed = sample if self._smoothed is None else (1 - SMOOTHING) * self._smoothed + SMOOTHING * sample
+        ratio = self._smoothed / max(min(self._latencies), 1e-9)
+        if len(self._latencies) >= BASELINE_SAMPLES and ratio > LATENCY_TOLERANCE and self.limit > self.floor:
+            self._set(self.limit * LATENCY_BACKOFF, f"latency per token {ratio:.1f}x the best")
+            return
+        self._healthy += 1
+        if self._healthy >= self.limit and self.limit < self.ceiling:
+            self._set(self.limit + 1, f"{self._healthy} healthy jobs")
+
+    def _set(self, limit, reason):
+        limit = min(max(int(limit), self.floor), self.ceiling)
+        self._healthy = 0
+        if limit < self.limit:
+            self._decreased_at = time.monotonic()
+            # Judge the new limit on its own jobs, against the same best-seen baseline
+            self._smoothed = None
+        if limit == self.limit:
+            return
+        change = {"from": self.limit, "to": limit, "reason": reason, "in_flight": self.in_flight}
+        self.changes.append(change)
+        self.limit = limit
+        self._wake()
+        if self.logger is not None:
+            self.logger.log(f"Pass 2 concurrency {change['from']} -> {limit}: {reason}", metadata=change)
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "floor": self.floor,
+            "ceiling": self.ceiling,
+            "changes": len(self.changes),
+            "peak": max([self.limit] + [c["to"] for c in self.changes]),
+        }
@@ -0,0 +1,136 @@
+"""
+Blob Store — content-addressed storage for Pass 1 outputs.
+Rendered and copied files are written once under _factory/cache/blobs/<aa>/<digest> and
+linked into dist/<slug>: reflinked where the filesystem supports it, hardlinked otherwise,
+copied as a last resort. Outputs whose digest is unchanged are left untouched, so their
+mtimes stay stable. Blobs are read-only; anything that edits a dist file in place must
+replace it atomically (write a temp file, then os.replace) rather than write through a link.
+Files the labs themselves rewrite (their data/ directories) cannot promise that, so
+they are materialized with link=False: a private, writable copy of the blob.
+"""
+import hashlib
+import os
+import shutil
+import stat
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BLOB_DIR = os.path.join("_factory", "cache", "blobs")
+FICLONE = 0x40049409
+READ_ONLY = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _tmp_path(path):
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _reflink(src, dest):
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.unlink(dest)
+            raise
+
+
+class BlobStore:
+    def __init__(self, root=BLOB_DIR):
+        self.root = root
+        self.stats = {"written": 0, "unchanged": 0, "reflink": 0, "hardlink": 0, "copy": 0}
+        # Cleared after the first failed FICLONE so unsupported filesystems pay for it once
+        self._reflink_ok = fcntl is not None
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _store(self, digest, write):
+        """Create the blob for digest via write(tmp_path) unless it already exists."""
+        blob = self.path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp = _tmp_path(blob)
+            write(tmp)
+            os.chmod(tmp, READ_ONLY)
+            os.replace(tmp, blob)
+        return digest
+
+    def put_bytes(self, data):
+        """Store data and return its sha256 digest."""
+        digest = hashlib.sha256(data).hexdigest()
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(data)
+        return self._store(digest, write)
+
+    def put_file(self, src):
+        """Store a copy of src and return its sha256 digest."""
+        return self._store(file_digest(src), lambda tmp: shutil.copyfile(src, tmp))
+
+    def materialize(self, digest, dest, link=True):
+        """
+        Link the blob for digest to dest unless dest already holds those bytes.
+        With link=False dest is always a separate, writable copy, never the blob's inode.
+
+        Returns:
+            bool: True if dest was (re)written, False if it was already current.
+        """
+        blob = self.path(digest)
+        try:
+            st = os.stat(dest)
+        except FileNotFoundError:
+            st = None
+        if st is not None:
+            blob_st = os.stat(blob)
+            shared = (st.st_dev, st.st_ino) == (blob_st.st_dev, blob_st.st_ino)
+            if (shared and link) or (not shared and st.st_size == blob_st.st_size and file_digest(dest) == digest):
+                self.stats["unchanged"] += 1
+                return False
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = _tmp_path(dest)
+        if link:
+            self._link(blob, tmp)
+        else:
+            shutil.copyfile(blob, tmp)
+            self.stats["copy"] += 1
+        os.replace(tmp, dest)
+        self.stats["written"] += 1
+        return True
+
+    def _link(self, blob, dest):
+        if self._reflink_ok:
+            try:
+                _reflink(blob, dest)
+                self.stats["reflink"] += 1
+                return
+            except OSError:
+                self._reflink_ok = False
+        try:
+            os.link(blob, dest)
+            self.stats["hardlink"] += 1
+        except OSError:
+            # Cross-device, link-count limit or no hardlink support
+            shutil.copyfile(blob, dest)
+            self.stats["copy"] += 1
+
+    def write_bytes(self, data, dest, link=True):
+        """Store data and link (or copy) it to dest; returns True if dest changed."""
+        return self.materialize(self.put_bytes(data), dest, link)
+
+    def write_file(self, src, dest, link=True):
+        """Store src and link (or copy) it to dest; returns True if dest changed."""
+        return self.materialize(self.put_file(src), dest, link)
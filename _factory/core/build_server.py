@@ -0,0 +1,326 @@
+"""
+Build Server — resident local compile service for the control tower.
+Runs on localhost HTTP and keeps the Jinja Environment (with its bytecode cache), the
+template index and tool memory warm across builds. Jobs run concurrently on a worker
+pool; builds for the same industry are serialized, and Pass 1, which renders through
+the shared Environment and template index, runs for one build at a time. Each build
+refines only its own industry's queued jobs. Each job has a cancel Event that is
+checked between build stages and before each Pass 2 refinement starts.
+
+Endpoints (JSON):
+    GET  /health              server pid and job counts
+    GET  /jobs                every job, newest first
+    GET  /jobs/<id>           one job
+    POST /jobs                {"manifest": {...}, "mode": "local", "force": false, "jobs": 1}
+    POST /timeline            {"industry": "...", "mode": "local"}
+    POST /jobs/<id>/cancel    request cancellation
+
+Usage: python3 _factory/core/build_server.py [--port 8765] [--workers 2]
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from _factory.core.compiler import FactoryCompiler, TelemetryLogger
+    from _factory.core.template_cache import make_environment
+    from _factory.core.template_index import TemplateIndex
+    from _factory.core.tool_memory import ToolMemory
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from core.compiler import FactoryCompiler, TelemetryLogger
+    from core.template_cache import make_environment
+    from core.template_index import TemplateIndex
+    from core.tool_memory import ToolMemory
+
+HOST = "127.0.0.1"
+DEFAULT_PORT = int(os.environ.get("FACTORY_SERVER_PORT", "8765"))
+TERMINAL = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobLogger(TelemetryLogger):
+    """TelemetryLogger that also keeps the job's latest event for status polling."""
+
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+
+    def log(self, event, level="INFO", metadata=None):
+        super().log(event, level, metadata)
+        self.job["last_event"] = event
+        if level in ("WARNING", "ERROR"):
+            self.job["warnings"] += 1
+
+
+class BuildServer:
+    def __init__(self, workers=2):
+        self.template_dir = os.path.join("_factory", "templates")
+        self.env = make_environment(self.template_dir)
+        self.template_index = TemplateIndex(self.template_dir)
+        self.tool_memory = ToolMemory()
+        self.jobs = {}
+        self._cancel = {}
+        self._slug_locks = {}
+        self._lock = threading.Lock()
+        # The Environment's bytecode cache and the TemplateIndex are not safe to mutate concurrently
+        self._render_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="build")
+
+    # ── Job table ─────────────────────────────────────────────────────────────
+    def _new_job(self, kind, label, params):
+        job = {
+            "id": uuid.uuid4().hex[:8],
+            "kind": kind,
+            "label": label,
+            "params": params,
+            "status": "queued",
+            "stage": None,
+            "last_event": None,
+            "warnings": 0,
+            "error": None,
+            "result": None,
+            "submitted_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self.jobs[job["id"]] = job
+            self._cancel[job["id"]] = threading.Event()
+        return job
+
+    def list_jobs(self):
+        with self._lock:
+            return sorted((dict(j) for j in self.jobs.values()), key=lambda j: j["submitted_at"], reverse=True)
+
+    def get_job(self, job_id):
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        if job["status"] not in TERMINAL:
+            self._cancel[job_id].set()
+            if job["status"] == "queued":
+                self._finish(job, "cancelled")
+        return dict(job)
+
+    def _finish(self, job, status, error=None):
+        job.update(status=status, error=error, finished_at=datetime.now().isoformat())
+
+    def _run(self, job, work):
+        cancel = self._cancel[job["id"]]
+        if cancel.is_set():
+            return
+        job.update(status="running", started_at=datetime.now().isoformat())
+        try:
+            work(job, cancel)
+            self._finish(job, "done")
+        except JobCancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            self._finish(job, "failed", error=f"{type(e).__name__}: {e}")
+
+    # ── Work ──────────────────────────────────────────────────────────────────
+    def _compiler(self, job, manifest, mode):
+        compiler = FactoryCompiler(manifest, engine_mode=mode, env=self.env)
+        compiler.logger = JobLogger(job)
+        compiler.template_index = self.template_index
+        compiler.tool_memory = self.tool_memory
+        return compiler
+
+    def submit_build(self, manifest, mode="local", force=False, jobs=1):
+        job = self._new_job("build", manifest.get("industry", "Generic AI"),
+                            {"mode": mode, "force": force, "jobs": jobs})
+
+        def work(job, cancel):
+            compiler = self._compiler(job, manifest, mode)
+            with self._lock:
+                slug_lock = self._slug_locks.setdefault(compiler.slug, threading.Lock())
+            with slug_lock:
+                stages = (
+                    ("context", lambda: compiler.prepare_context(force=force)),
+                    ("pass1", lambda: self._render(compiler, jobs)),
+                    ("pass2", lambda: compiler.compile_pass2(cancel_event=cancel)),
+                    ("finish", compiler._finish_build),
+                )
+                for stage, run in stages:
+                    if cancel.is_set():
+                        raise JobCancelled()
+                    job["stage"] = stage
+                    run()
+            job["result"] = {"build_dir": compiler.build_dir}
+
+        self._pool.submit(self._run, job, work)
+        return dict(job)
+
+    def _render(self, compiler, jobs):
+        with self._render_lock:
+            compiler.compile_pass1(jobs=jobs)
+
+    def submit_timeline(self, industry, mode="local"):
+        job = self._new_job("timeline", industry, {"mode": mode})
+
+        def work(job, cancel):
+            compiler = self._compiler(job, {"industry": industry}, mode)
+            job["stage"] = "llm"
+            prompt = f"Generate a 2011-2026 AI evolution timeline for {industry}. Markdown table: Year | Milestone | Impact."
+            content = compiler.call_llm(prompt)
+            if not content:
+                raise RuntimeError("Failed to generate timeline.")
+            job["result"] = {"markdown": content}
+
+        self._pool.submit(self._run, job, work)
+        return dict(job)
+
+    def health(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"status": "ok", "pid": os.getpid(), "jobs": counts}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FactoryBuildServer/1.0"
+
+    @property
+    def builds(self):
+        return self.server.builds
+
+    def _send(self, payload, code=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts == ["health"]:
+            return self._send(self.builds.health())
+        if parts == ["jobs"]:
+            return self._send(self.builds.list_jobs())
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self.builds.get_job(parts[1])
+            return self._send(job) if job else self._send({"error": "unknown job"}, 404)
+        self._send({"error": "not found"}, 404)
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        try:
+            body = self._body()
+        except json.JSONDecodeError:
+            return self._send({"error": "invalid JSON"}, 400)
+        if parts == ["jobs"]:
+            if not isinstance(body.get("manifest"), dict):
+                return self._send({"error": "manifest object required"}, 400)
+            return self._send(self.builds.submit_build(
+                body["manifest"], body.get("mode", "local"),
+                bool(body.get("force", False)), int(body.get("jobs", 1))
+            ), 202)
+        if parts == ["timeline"]:
+            if not body.get("industry"):
+                return self._send({"error": "industry required"}, 400)
+            return self._send(self.builds.submit_timeline(body["industry"], body.get("mode", "local")), 202)
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            job = self.builds.cancel(parts[1])
+            return self._send(job) if job else self._send({"error": "unknown job"}, 404)
+        self._send({"error": "not found"}, 404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=DEFAULT_PORT, workers=2):
+    httpd = ThreadingHTTPServer((HOST, port), _Handler)
+    httpd.daemon_threads = True
+    httpd.builds = BuildServer(workers=workers)
+    print(f"[INFO] Build server listening on http://{HOST}:{port} ({workers} workers)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+# ── Client ────────────────────────────────────────────────────────────────────
+def _request(path, payload=None, port=DEFAULT_PORT, timeout=5):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(f"http://{HOST}:{port}{path}", data=data,
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def server_alive(port=DEFAULT_PORT):
+    try:
+        return _request("/health", port=port, timeout=1)["status"] == "ok"
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def ensure_server(port=DEFAULT_PORT, workers=2, timeout=15):
+    """Start a detached build server from the repo root unless one already answers on port."""
+    if server_alive(port):
+        return True
+    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    log_path = os.path.join(repo_root, "_factory", "logs", "build_server.log")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, "a") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--port", str(port), "--workers", str(workers)],
+            cwd=repo_root, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+        )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server_alive(port):
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def submit_build(manifest, mode="local", force=False, jobs=1, port=DEFAULT_PORT):
+    return _request("/jobs", {"manifest": manifest, "mode": mode, "force": force, "jobs": jobs}, port=port)
+
+
+def submit_timeline(industry, mode="local", port=DEFAULT_PORT):
+    return _request("/timeline", {"industry": industry, "mode": mode}, port=port)
+
+
+def job_status(job_id, port=DEFAULT_PORT):
+    """The job's status, or None when the job is unknown or the server is not answering."""
+    try:
+        return _request(f"/jobs/{job_id}", port=port)
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+
+def cancel_job(job_id, port=DEFAULT_PORT):
+    return _request(f"/jobs/{job_id}/cancel", {}, port=port)
+
+
+if __name__ == "__main__":
+    def _flag(name, default):
+        return int(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+    serve(port=_flag("--port", DEFAULT_PORT), workers=_flag("--workers", 2))
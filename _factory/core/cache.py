@@ -1,45 +1,153 @@
+"""
+Build Cache — per-output digests for incremental Pass 1 builds.
+Each entry is keyed by build namespace and rendered path and stores the output digest,
+the digest of the context values it depends on, and the source file's (size, mtime_ns,
+inode), so warm builds can confirm a hit from a single stat() without re-reading the
+template. Entries live in a shared SQLite database (WAL mode) so builds for different
+industries keep their own entries and can save concurrently.
+"""
 import os
 import json
 import hashlib
+import sqlite3
+
+DB_NAME = "build_cache.db"
+BUSY_TIMEOUT_MS = 30000
+# Bumped when the same template and context start producing different output bytes
+OUTPUT_FORMAT = 2
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
 class BuildCache:
-    def __init__(self, cache_dir="_factory/cache"):
-        self.cache_file = os.path.join(cache_dir, "hashes.json")
+    def __init__(self, cache_dir="_factory/cache", namespace="default"):
+        # Entries for this namespace: rel_path -> (digest, ctx_key, size, mtime_ns, inode)
+        self.namespace = namespace
+        self.db_path = os.path.join(cache_dir, DB_NAME)
         os.makedirs(cache_dir, exist_ok=True)
-        try:
-            with open(self.cache_file, "r") as f:
-                self.hashes = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.hashes = {}
-
-    def _compute_hash(self, template_path, context):
-        with open(template_path, "r", encoding="utf-8", errors="ignore") as f:
-            file_content = f.read()
-        context_str = json.dumps(context, sort_keys=True)
-        combined = file_content + context_str
-        return hashlib.sha256(combined.encode("utf-8")).hexdigest()
-
-    def is_cached(self, rel_path, template_path, context):
-        try:
-            computed = self._compute_hash(template_path, context)
-            return self.hashes.get(rel_path) == computed
-        except Exception:
-            return False
-
-    def mark_cached(self, rel_path, template_path, context):
-        try:
-            self.hashes[rel_path] = self._compute_hash(template_path, context)
-        except Exception:
-            pass
+        self.conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        self.conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                rel_path TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                ctx_key TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                PRIMARY KEY (namespace, rel_path)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+        self.hashes = {
+            row[0]: tuple(row[1:]) for row in self.conn.execute(
+                "SELECT rel_path, digest, ctx_key, size, mtime_ns, ino FROM entries WHERE namespace=?",
+                (namespace,)
+            )
+        }
+        self._dirty = set()
+        self._var_digests = {}
+        self._ctx_digests = {}
+        self._file_digests = {}
+
+    def begin_build(self, context):
+        """Digest every context value once; all checks in this build reuse the results."""
+        self._var_digests = {k: _sha256(json.dumps(v, sort_keys=True)) for k, v in context.items()}
+        self._ctx_digests = {}
+
+    def _context_digest(self, variables):
+        key = None if variables is None else tuple(variables)
+        digest = self._ctx_digests.get(key)
+        if digest is None:
+            names = sorted(self._var_digests) if variables is None else [v for v in variables if v in self._var_digests]
+            digest = _sha256(f"format={OUTPUT_FORMAT}|" + "|".join(f"{n}={self._var_digests[n]}" for n in names))
+            self._ctx_digests[key] = digest
+        return digest
+
+    @staticmethod
+    def _stat_key(path):
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def file_digest(self, path, stat_key=None):
+        """Content digest of path, memoized for the run while its stat is unchanged."""
+        stat_key = stat_key or self._stat_key(path)
+        memo = self._file_digests.get(path)
+        if memo and memo[0] == stat_key:
+            return memo[1]
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self._file_digests[path] = (stat_key, digest)
+        return digest
+
+    def check(self, rel_path, template_path, variables=None, dependencies=()):
+        """
+        Look up one output against the context set by begin_build().
+
+        Returns:
+            (hit, entry): entry is the record to pass to record() after the
+            output has been written. Unchanged stat + context is a hit without
+            reading the file; a stat-only change (e.g. touch) is re-verified by
+            content and refreshed in place.
+        """
+        stat_key = self._stat_key(template_path)
+        ctx_key = self._context_digest(variables)
+        if dependencies:
+            ctx_key = _sha256(ctx_key + "".join(self.file_digest(p) for p in dependencies))
+
+        stored = self.hashes.get(rel_path)
+        if stored and stored[1] == ctx_key and tuple(stored[2:]) == stat_key:
+            return True, stored
+
+        digest = _sha256(self.file_digest(template_path, stat_key) + ctx_key)
+        entry = (digest, ctx_key) + stat_key
+        if stored and stored[0] == digest:
+            self.record(rel_path, entry)
+            return True, entry
+        return False, entry
+
+    def record(self, rel_path, entry):
+        """Store an entry returned by check() once its output has been written."""
+        self.hashes[rel_path] = tuple(entry)
+        self._dirty.add(rel_path)
 
     def save(self):
-        with open(self.cache_file, "w") as f:
-            json.dump(self.hashes, f, indent=2)
+        """Upsert the entries changed since the last save in a single transaction."""
+        if not self._dirty:
+            return
+        rows = [(self.namespace, rel_path) + self.hashes[rel_path]
+                for rel_path in sorted(self._dirty) if rel_path in self.hashes]
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO entries (namespace, rel_path, digest, ctx_key, size, mtime_ns, ino)
+                VALUES (?,?,?,?,?,?,?)
+                ON CONFLICT (namespace, rel_path) DO UPDATE SET
+                    digest=excluded.digest, ctx_key=excluded.ctx_key,
+                    size=excluded.size, mtime_ns=excluded.mtime_ns, ino=excluded.ino
+            """, rows)
+        self._dirty.clear()
 
     def invalidate(self, rel_path=None):
-        if rel_path:
-            self.hashes.pop(rel_path, None)
-        else:
-            self.hashes = {}
-        self.save()
+        """Drop one entry, or every entry in this namespace; other namespaces are untouched."""
+        with self.conn:
+            if rel_path:
+                self.hashes.pop(rel_path, None)
+                self._dirty.discard(rel_path)
+                self.conn.execute("DELETE FROM entries WHERE namespace=? AND rel_path=?",
+                                  (self.namespace, rel_path))
+            else:
+                self.hashes = {}
+                self._dirty.clear()
+                self.conn.execute("DELETE FROM entries WHERE namespace=?", (self.namespace,))
+
+    def namespaces(self):
+        """Entry count per namespace across every build sharing this database."""
+        return dict(self.conn.execute("SELECT namespace, COUNT(*) FROM entries GROUP BY namespace"))
+
+    def close(self):
+        self.conn.close()
@@ -2,11 +2,12 @@ import asyncio
 import os
 import yaml
 import json
-import shutil
 import subprocess
 import sys
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from jinja2 import Environment, FileSystemLoader
 
 # Try importing LLM providers
 try:
@@ -15,12 +16,12 @@ except ImportError:
     ollama = None
 
 try:
-    from _factory.core.gemini_rest import call_gemini
+    from _factory.core.gemini_rest import call_gemini, astream_gemini, parse_json_text
 except ImportError:
     try:
-        from core.gemini_rest import call_gemini
+        from core.gemini_rest import call_gemini, astream_gemini, parse_json_text
     except ImportError:
-        call_gemini = None
+        call_gemini = astream_gemini = parse_json_text = None
 
 try:
     from _factory.core.cache import BuildCache
@@ -43,9 +44,11 @@ except ImportError:
     from core.model_router import ModelRouter
 
 try:
-    from _factory.core.worker import drain_queue
+    from _factory.core.worker import drain_queue, consume_stream, make_budget, open_refiner
+    from _factory.core.adaptive_concurrency import AdaptiveConcurrency
 except ImportError:
-    from core.worker import drain_queue
+    from core.worker import drain_queue, consume_stream, make_budget, open_refiner
+    from core.adaptive_concurrency import AdaptiveConcurrency
 
 try:
     from _factory.core.cost_tracker import CostTracker
@@ -57,14 +60,44 @@ try:
 except ImportError:
     from core.tool_memory import ToolMemory
 
+try:
+    from _factory.core.render_pool import run_tasks, iter_tasks
+    from _factory.core.blob_store import BlobStore
+    from _factory.core.template_cache import make_environment, compile_string, render_path
+    from _factory.core.template_index import TemplateIndex, session_of
+    from _factory.core.watcher import make_watcher
+    from _factory.core.stage_graph import StageGraph
+    from _factory.core.data_synth import synthesize
+    from _factory.core.data_spec import synthesize_from_spec
+    from _factory.core.llm_stream import StreamMetrics, stream_ollama
+    from _factory.core.token_accounting import default_estimator, local_count, usage_from_ollama
+    from _factory.core import rate_limiter
+except ImportError:
+    from core.render_pool import run_tasks, iter_tasks
+    from core.blob_store import BlobStore
+    from core.template_cache import make_environment, compile_string, render_path
+    from core.template_index import TemplateIndex, session_of
+    from core.watcher import make_watcher
+    from core.stage_graph import StageGraph
+    from core.data_synth import synthesize
+    from core.data_spec import synthesize_from_spec
+    from core.llm_stream import StreamMetrics, stream_ollama
+    from core.token_accounting import default_estimator, local_count, usage_from_ollama
+    from core import rate_limiter
+
 try:
     from _factory.core.persona_parser import load_persona
-    from _factory.core.session_planner import plan_sessions
-    from _factory.core.tool_researcher import research_tools
+    from _factory.core.session_planner import aplan_sessions
+    from _factory.core.tool_researcher import aresearch_tools
 except ImportError:
     from core.persona_parser import load_persona
-    from core.session_planner import plan_sessions
-    from core.tool_researcher import research_tools
+    from core.session_planner import aplan_sessions
+    from core.tool_researcher import aresearch_tools
+
+REFINER_SCRIPT = os.path.join(os.path.dirname(__file__), "../../.agent/skills/factory/context_refiner.py")
+DOCUMENTARIAN_SCRIPT = os.path.join(os.path.dirname(__file__), "../../.agent/skills/forensic-documentarian/scripts/sync_docs.py")
+DOCUMENTARIAN_SESSIONS = os.path.join(os.path.dirname(__file__), "../../.agent/skills/forensic-documentarian/sessions.yaml")
+
 
 class TelemetryLogger:
     def __init__(self, log_path="_factory/logs/events.jsonl"):
@@ -83,9 +116,21 @@ class TelemetryLogger:
         print(f"[{level}] {event}")
 
 class FactoryCompiler:
-    def __init__(self, manifest_path, engine_mode="local"):
-        with open(manifest_path, 'r') as f:
-            raw_manifest = yaml.safe_load(f)
+    # Template-relative paths of the files data synthesis generates per industry
+    SYNTH_OUTPUTS = (
+        os.path.join('01_data_pipeline_automation', 'set_{{ industry_slug }}', 'data', 'dirty_data.csv'),
+        os.path.join('01_data_pipeline_automation', 'set_{{ industry_slug }}', 'data', 'corporate_expenses.csv'),
+    )
+    # Directories whose files are rewritten in place, by the labs (data/) or by a generator script
+    # shipped with them (track_1_navigator/generate_base_guides.py): copied into dist, never linked
+    WRITABLE_DIRS = ('data', 'track_1_navigator')
+
+    def __init__(self, manifest_path, engine_mode="local", env=None):
+        if isinstance(manifest_path, dict):
+            raw_manifest = manifest_path
+        else:
+            with open(manifest_path, 'r') as f:
+                raw_manifest = yaml.safe_load(f)
 
         self.engine_mode = engine_mode
         self.logger = TelemetryLogger()
@@ -100,14 +145,22 @@ class FactoryCompiler:
         self.token_budget = self.manifest.get("token_budget")
         self.data_schema = self.manifest.get("data_schema")
         self.concurrency = self.manifest.get("concurrency", 3)
+        self.concurrency_floor = min(self.manifest.get("concurrency_floor", 1), self.concurrency)
+        self.concurrency_ceiling = max(self.manifest.get("concurrency_ceiling", 16), self.concurrency)
+        rate_limiter.configure(self.manifest.get("rate_limits"))
+        self._llm_slots = weakref.WeakKeyDictionary()
+        self._ollama_clients = weakref.WeakKeyDictionary()
 
         self.industry = self.manifest.get('industry', 'Generic AI')
         self.slug = self.industry.lower().replace(' ', '_').replace('&', 'and')
         self.build_dir = os.path.join('dist', self.slug)
         self.template_dir = os.path.join('_factory', 'templates')
+        self.data_dir = os.path.join('_factory', 'cache', 'data', self.slug)
+        self.context_cache_path = os.path.join('_factory', 'cache', f"{self.slug}_context.json")
         self.allowed_sessions = self.manifest.get('sessions', list(range(1, 9)))
 
-        self.env = Environment(loader=FileSystemLoader(self.template_dir))
+        self.env = env or make_environment(self.template_dir)
+        self.template_index = None
         self.context = {
             'industry_name': self.industry,
             'industry_slug': self.slug,
@@ -118,10 +171,12 @@ class FactoryCompiler:
             'compliance_framework': self.manifest.get('compliance_framework', 'None'),
             'region': self.manifest.get('region', 'Global'),
         }
-        self.cache = BuildCache()
-        self.refinement_queue = RefinementQueue()
+        self.cache = BuildCache(namespace=self.slug)
+        self.blobs = BlobStore()
+        self.refinement_queue = RefinementQueue(industries=(self.slug,))
         self.router = ModelRouter(engine_mode=self.engine_mode)
         self.cost_tracker = CostTracker()
+        self.token_estimator = default_estimator()
         self.tool_memory = ToolMemory()
 
         if self.engine_mode == "cloud":
@@ -152,12 +207,15 @@ class FactoryCompiler:
         else:
             try:
                 format_arg = 'json' if is_json else None
+                tokens = local_count(prompt)
+                rate_limiter.limiter().acquire("ollama", model, tokens)
                 response = ollama.chat(model=model, messages=[
                     {'role': 'user', 'content': prompt}
                 ], format=format_arg)
                 content = response['message']['content']
-                est_tokens = len(prompt + content) // 4
-                self.cost_tracker.record(task_type, model, est_tokens, est_tokens)
+                usage = usage_from_ollama(response)
+                rate_limiter.limiter().settle("ollama", model, tokens, usage)
+                self._record_usage(task_type, model, prompt, content, usage)
                 if is_json:
                     return json.loads(content)
                 return content
@@ -165,7 +223,81 @@ class FactoryCompiler:
                 self.logger.log(f"Ollama call failed: {e}", level="ERROR")
                 return None
 
+    async def acall_llm(self, prompt, is_json=False, task_type="general"):
+        """
+        Async call_llm: same routing, cost tracking and failure handling, without
+        blocking the event loop. At most `concurrency` calls are in flight per loop,
+        and local calls share one pooled Ollama client per loop, closed by _run when
+        the stage's loop finishes. Responses are streamed, so a stalled call is abandoned after LLM_STALL_TIMEOUT
+        seconds of silence, and each call logs its time to first token and tokens/s.
+        """
+        model = self.router.get_model(task_type)
+        self.logger.log(f"Using model: {model} for task: {task_type}", level="DEBUG")
+        cloud = self.engine_mode == "cloud"
+        metrics = StreamMetrics("gemini" if cloud else "ollama", model)
+        loop = asyncio.get_running_loop()
+        slots = self._llm_slots.setdefault(loop, asyncio.Semaphore(self.concurrency))
+        async with slots:
+            try:
+                if cloud:
+                    chunks = astream_gemini(prompt, model=model, is_json=is_json, metrics=metrics)
+                else:
+                    client = self._ollama_clients.get(loop)
+                    if client is None:
+                        client = self._ollama_clients[loop] = ollama.AsyncClient()
+                    chunks = stream_ollama(client, model, prompt, metrics, format='json' if is_json else None)
+                content = "".join([chunk async for chunk in chunks])
+            except Exception as e:
+                self.logger.log(f"{'Gemini' if cloud else 'Ollama'} call failed: {e}", level="ERROR")
+                return None
+
+        self.logger.log(f"LLM stream {metrics.summary()}", level="DEBUG", metadata=metrics.as_dict())
+        usage = None if metrics.output_tokens is None else (metrics.input_tokens or 0, metrics.output_tokens)
+        self._record_usage(task_type, model, prompt, content, usage)
+        if not is_json:
+            return content
+        try:
+            return parse_json_text(content) if cloud else json.loads(content)
+        except ValueError as e:
+            self.logger.log(f"{'Gemini' if cloud else 'Ollama'} returned invalid JSON: {e}", level="ERROR")
+            return None
+
+    def _record_usage(self, task_type, model, prompt, content, usage):
+        """Charge the provider's (input, output) token counts; estimate, flagged as such, only when it sent none."""
+        if usage:
+            self.token_estimator.observe(model, local_count(prompt) + local_count(content), sum(usage))
+            self.cost_tracker.record(task_type, model, *usage)
+        else:
+            self.cost_tracker.record(task_type, model, self.token_estimator.estimate(prompt, model),
+                                     self.token_estimator.estimate(content, model), exact=False)
+
+    def _run(self, coro):
+        """asyncio.run(coro) for one stage, then close the Ollama client its LLM calls shared."""
+        async def stage():
+            try:
+                return await coro
+            finally:
+                client = self._ollama_clients.pop(asyncio.get_running_loop(), None)
+                if client is not None:
+                    await client.close()
+
+        return asyncio.run(stage())
+
     def generate_llm_context(self):
+        """DNA alongside persona tools -> session plan, as concurrent LLM calls."""
+        self._run(self.agenerate_llm_context())
+
+    async def agenerate_llm_context(self):
+        async def persona():
+            if await self.aload_persona_tools():
+                await self.aplan_persona_sessions()
+
+        await asyncio.gather(self.agenerate_dna(), persona())
+
+    def generate_dna(self):
+        self._run(self.agenerate_dna())
+
+    async def agenerate_dna(self):
         self.logger.log(f"Generating DNA context for {self.industry} via {self.engine_mode}...")
         use_cases_str = ", ".join(self.context.get('use_cases', [])) or "general AI applications"
         prompt = f"""
@@ -186,7 +318,7 @@ class FactoryCompiler:
             "primary_color": "#HEXCODE"
         }}
         """
-        data = self.call_llm(prompt, is_json=True, task_type="json_context")
+        data = await self.acall_llm(prompt, is_json=True, task_type="json_context")
         if data:
             self.context.update(data)
             self.logger.log("DNA context generated successfully.")
@@ -199,172 +331,498 @@ class FactoryCompiler:
                 "primary_color": "#007bff"
             })
 
-        # Dynamic persona → tools → session planning
+    @property
+    def has_persona(self):
         persona_source = self.manifest.get("persona_source")
-        if persona_source and os.path.exists(persona_source):
-            self.logger.log(f"Loading persona from {persona_source}")
-            persona_data = load_persona(persona_source)
-            self.context["persona"] = persona_data
-
-            # Check tool memory before researching
-            use_cases = self.context.get("use_cases", [])
-            refresh_tools = self.manifest.get("refresh_tools", False)
-            cached_tools = None if refresh_tools else self.tool_memory.recall(self.industry, use_cases)
-            if cached_tools:
-                tools = cached_tools
-                mem_status = self.tool_memory.status(self.industry, use_cases)
-                self.logger.log(f"Tool memory hit ({mem_status}): {len(tools)} tools from cache")
-            else:
-                self.logger.log("Researching tools via SearXNG/Tavily + LLM...")
-                tools = research_tools(
-                    self.industry,
-                    use_cases,
-                    lambda p: self.call_llm(p, is_json=True, task_type="general")
-                )
-                self.tool_memory.remember(self.industry, use_cases, tools)
-            self.context["tools"] = tools
-            self.manifest["tools"] = tools
-
-            self.logger.log("Planning dynamic sessions...")
-            session_plan = plan_sessions(
-                persona_data,
-                tools,
-                lambda p: self.call_llm(p, is_json=True, task_type="general")
+        return bool(persona_source and os.path.exists(persona_source))
+
+    def load_persona_tools(self):
+        return self._run(self.aload_persona_tools())
+
+    async def aload_persona_tools(self):
+        """Dynamic persona → tools. Returns False when the manifest has no persona."""
+        if not self.has_persona:
+            return False
+        persona_source = self.manifest["persona_source"]
+        self.logger.log(f"Loading persona from {persona_source}")
+        persona_data = load_persona(persona_source)
+        self.context["persona"] = persona_data
+
+        # Check tool memory before researching
+        use_cases = self.context.get("use_cases", [])
+        refresh_tools = self.manifest.get("refresh_tools", False)
+        cached_tools = None if refresh_tools else self.tool_memory.recall(self.industry, use_cases)
+        if cached_tools:
+            tools = cached_tools
+            mem_status = self.tool_memory.status(self.industry, use_cases)
+            self.logger.log(f"Tool memory hit ({mem_status}): {len(tools)} tools from cache")
+        else:
+            self.logger.log(f"Researching tools via SearXNG/Tavily + LLM ({len(use_cases) or 1} searches)...")
+            tools = await aresearch_tools(
+                self.industry,
+                use_cases,
+                lambda p: self.acall_llm(p, is_json=True, task_type="general"),
+                concurrency=self.concurrency
             )
-            self.context["planned_sessions"] = session_plan.get("sessions", [])
-            self.manifest["planned_sessions"] = session_plan.get("sessions", [])
-            self.context["total_sessions"] = session_plan.get("total_sessions", 8)
+            self.tool_memory.remember(self.industry, use_cases, tools)
+        self.context["tools"] = tools
+        self.manifest["tools"] = tools
+        return True
+
+    def plan_persona_sessions(self):
+        self._run(self.aplan_persona_sessions())
+
+    async def aplan_persona_sessions(self):
+        self.logger.log("Planning dynamic sessions...")
+        session_plan = await aplan_sessions(
+            self.context["persona"],
+            self.context["tools"],
+            lambda p: self.acall_llm(p, is_json=True, task_type="general")
+        )
+        self.context["planned_sessions"] = session_plan.get("sessions", [])
+        self.manifest["planned_sessions"] = session_plan.get("sessions", [])
+        self.context["total_sessions"] = session_plan.get("total_sessions", 8)
+
+    def prepare_context(self, force=False):
+        """Load cached DNA context on warm builds; otherwise generate it and synthesize data."""
+        os.makedirs(os.path.dirname(self.context_cache_path), exist_ok=True)
+
+        if force:
+            self.logger.log("Force rebuild: cache cleared")
+            self.cache.invalidate()
+            self.generate_llm_context()
+            self.save_context()
+            self.run_data_synth()
+        elif self.warm_context_available():
+            self.load_cached_context()
+        else:
+            self.logger.log("Cold build: generating LLM context and data")
+            self.generate_llm_context()
+            self.save_context()
+            self.run_data_synth()
+
+    def warm_context_available(self):
+        return os.path.exists(self.context_cache_path) and len(self.cache.hashes) > 0
+
+    def load_cached_context(self):
+        self.logger.log("Warm build: loading cached context, skipping data synthesis")
+        with open(self.context_cache_path) as f:
+            self.context.update(json.load(f))
+
+    def save_context(self):
+        with open(self.context_cache_path, "w") as f:
+            json.dump(self.context, f)
 
     def run_data_synth(self):
-        self.logger.log(f"Initiating data synthesis agent for {self.industry}...")
-        synth_script = os.path.join(os.path.dirname(__file__), "../../.agent/skills/factory/data_synth.py")
+        schema = self.data_schema
+        mode = schema.get("mode", "rows")
+        self.logger.log(f"Initiating data synthesis for {self.industry} ({schema['row_count']} rows, {mode} mode)...")
         try:
-            columns = ",".join(self.data_schema["columns"])
-            dirty_rate = str(self.data_schema["dirty_rate"])
-            row_count = str(self.data_schema["row_count"])
-            env = os.environ.copy()
-            env["SYNTH_MODEL"] = self.router.get_model("data_synth")
-            subprocess.run([
-                sys.executable, synth_script,
-                self.slug, self.industry, columns, dirty_rate, row_count
-            ], env=env, check=True)
-            self.logger.log("Data synthesis agent completed.")
+            if mode == "spec":
+                result = synthesize_from_spec(
+                    self.slug, self.industry, schema["columns"], schema["dirty_rate"], schema["row_count"],
+                    self.data_dir, lambda prompt: self.call_llm(prompt, is_json=True, task_type="data_synth"),
+                    seed=schema.get("seed")
+                )
+                source = "cached spec" if result["spec_cached"] else "new spec"
+                self.logger.log(f"Data synthesis completed: {result['rows']} rows from {source} ({result['engine']}).",
+                                metadata=result)
+                return
+            result = synthesize(
+                self.slug, self.industry, schema["columns"], schema["dirty_rate"], schema["row_count"],
+                self.data_dir, lambda prompt: self.call_llm(prompt, task_type="data_synth"),
+                chunk_rows=schema.get("chunk_rows")
+            )
+            if not result["rows"]:
+                self.logger.log("Data synthesis produced no rows.", level="ERROR")
+                return
+            self.logger.log(f"Data synthesis completed: {result['rows']} rows in {result['chunks']} chunks.",
+                            metadata=result)
         except Exception as e:
             self.logger.log(f"Data synthesis failed: {e}", level="ERROR")
 
     def run_context_refiner(self, dest_path):
-        refiner_script = os.path.join(os.path.dirname(__file__), "../../.agent/skills/factory/context_refiner.py")
         try:
-            env = os.environ.copy()
+            env = rate_limiter.child_env()
             env["REFINER_MODEL"] = self.router.get_model("md_refine")
             env["REFINER_TONE"] = self.context.get('tone', 'Practical & Applied')
-            subprocess.run([sys.executable, refiner_script, dest_path, self.industry, self.slug], env=env, check=True)
+            subprocess.run([sys.executable, REFINER_SCRIPT, dest_path, self.industry, self.slug], env=env, check=True)
         except Exception as e:
             self.logger.log(f"Linguistic refinement failed for {os.path.basename(dest_path)}", level="WARNING")
 
-    def compile_pass1(self):
+    def _plan_pass1(self, only=None):
+        """
+        Build Pass 1 tasks from the template index in a stable order.
+        only="static" keeps files that are copied verbatim and need no LLM context
+        (no Jinja, not synthesized data); only="dynamic" keeps the rest.
+        """
+        if self.template_index is None:
+            self.template_index = TemplateIndex(self.template_dir)
+        if self.template_index.rebuilt:
+            for skipped in self.template_index.skipped_dirs:
+                self.logger.log(f"Skipping technical dir: {skipped}", level="DEBUG")
+            self.logger.log(f"Template index rebuilt: {len(self.template_index.entries)} files")
+            self.template_index.rebuilt = False
+
+        # Snapshot: DAG builds plan static files while DNA stages are still filling in the context
+        context = dict(self.context)
+        self.cache.begin_build(context)
+        tasks = []
+        for entry in self.template_index.select(self.allowed_sessions):
+            rel_path = entry["path"]
+            if only is not None:
+                static = not entry["has_jinja"] and rel_path not in self.SYNTH_OUTPUTS
+                if static != (only == "static"):
+                    continue
+            rendered_rel_path = render_path(self.env, rel_path, context)
+            src = self._synth_source(rel_path) or os.path.join(self.template_dir, rel_path)
+            variables, dep_paths = self.template_index.dependencies(entry)
+            try:
+                hit, cache_entry = self.cache.check(
+                    rendered_rel_path, src, variables,
+                    [os.path.join(self.template_dir, p) for p in dep_paths]
+                )
+            except OSError:
+                hit, cache_entry = False, None
+            tasks.append({
+                "slug": self.slug,
+                "rel_path": rel_path,
+                "rendered_rel_path": rendered_rel_path,
+                "src": src,
+                "dest": os.path.join(self.build_dir, rendered_rel_path),
+                "render": entry["has_jinja"],
+                "link": not self._writable(rel_path),
+                "refine": rel_path.endswith('.md') and 'node_modules' not in rel_path and '.agent' not in rel_path,
+                "hit": hit and os.path.exists(os.path.join(self.build_dir, rendered_rel_path)),
+                "cache_entry": cache_entry,
+            })
+        return tasks
+
+    def _writable(self, rel_path):
+        """True for outputs a lab may write to, e.g. cleaner.py saving data/flagged_expenses.csv."""
+        return any(part in self.WRITABLE_DIRS for part in rel_path.split(os.sep)[:-1])
+
+    def _synth_source(self, rel_path):
+        """Return this industry's synthesized copy of a data template, if one exists."""
+        if rel_path not in self.SYNTH_OUTPUTS:
+            return None
+        path = os.path.join(self.data_dir, os.path.basename(rel_path))
+        return path if os.path.exists(path) else None
+
+    def _start_pass1(self):
         if not os.path.exists(self.build_dir):
             os.makedirs(self.build_dir)
         self.logger.log(f"Incremental build: cache active for {self.industry}")
         self.logger.log(f"Mission Start: Compiling {self.industry} to {self.build_dir}")
 
-        queued_count = 0
-        for root, dirs, files in os.walk(self.template_dir):
-            rel_root = os.path.relpath(root, self.template_dir)
-            parts = rel_root.split(os.sep)
-            if len(parts) >= 1 and parts[0] != '.':
-                dir_name = parts[0]
-                if len(dir_name) >= 2 and dir_name[:2].isdigit():
-                    session_num = int(dir_name[:2])
-                    if session_num not in self.allowed_sessions:
-                        dirs[:] = []
-                        continue
-            original_dirs = list(dirs)
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ('.venv', '__pycache__', 'node_modules', 'libs')]
-            for skipped in [d for d in original_dirs if d not in dirs]:
-                self.logger.log(f"Skipping technical dir: {skipped}", level="DEBUG")
-
-            for file in files:
-                if file.startswith('.'): continue
-
-                rel_path = os.path.relpath(os.path.join(root, file), self.template_dir)
-                rendered_rel_path = self.env.from_string(rel_path).render(self.context)
-                dest_path = os.path.join(self.build_dir, rendered_rel_path)
-                full_template_path = os.path.join(root, file)
-
-                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    def _finish_pass1(self, results, requeue_unchanged=True, on_enqueue=None, extras=True):
+        """
+        Apply Pass 1 task results in order.
 
-                if self.cache.is_cached(rendered_rel_path, full_template_path, self.context):
-                    self.logger.log(f"CACHE HIT: skipping {rendered_rel_path}", level="DEBUG")
-                    continue
+        Records output digests, enqueues markdown for refinement and writes the
+        build extras. results may be a live iterator. on_enqueue(job_id) is called
+        as each markdown file is queued; without it, markdown is enqueued in one
+        transaction at the end. With requeue_unchanged=False, markdown whose output
+        bytes did not change is not re-enqueued (watch mode). extras=False skips
+        the README and portable tests.
+        """
+        queued_count = 0
+        to_queue = []
+        written = 0
+        rendered = 0
+        bytecode = {"hits": 0, "misses": 0, "compile_ms": 0.0, "saved_ms": 0.0}
+        for result in results:
+            for key, value in (result.get("bytecode") or {}).items():
+                bytecode[key] += value
+            rel_path = result["rel_path"]
+            rendered_rel_path = result["rendered_rel_path"]
+            if result["status"] == "hit":
+                self.logger.log(f"CACHE HIT: skipping {rendered_rel_path}", level="DEBUG")
+                continue
+            if result["status"] == "error":
+                self.logger.log(f"Render error {rel_path}: {result['error']}", level="ERROR")
+                continue
+            if result["cache_entry"] is not None:
+                self.cache.record(rendered_rel_path, result["cache_entry"])
+            rendered += 1
+            written += result["changed"]
 
-                if file.endswith(('.md', '.py', '.txt', '.json', '.yaml', '.sh')):
-                    try:
-                        template = self.env.get_template(rel_path)
-                        rendered = template.render(self.context)
-                        with open(dest_path, 'w') as f:
-                            f.write(rendered)
-                        self.cache.mark_cached(rendered_rel_path, full_template_path, self.context)
-
-                        if file.endswith('.md') and 'node_modules' not in rel_path and '.agent' not in rel_path:
-                            self.refinement_queue.enqueue(self.slug, dest_path, self.industry)
-                            queued_count += 1
-                            self.logger.log(f"Queued for refinement: {file}")
-
-                    except Exception as e:
-                        self.logger.log(f"Render error {rel_path}: {e}", level="ERROR")
-                        shutil.copy2(os.path.join(root, file), dest_path)
+            if result["refine"] and (result["changed"] or requeue_unchanged):
+                if on_enqueue is not None:
+                    on_enqueue(self.refinement_queue.enqueue(self.slug, result["dest"], self.industry))
                 else:
-                    shutil.copy2(os.path.join(root, file), dest_path)
-                    self.cache.mark_cached(rendered_rel_path, full_template_path, self.context)
+                    to_queue.append((self.slug, result["dest"], self.industry))
+                queued_count += 1
+                self.logger.log(f"Queued for refinement: {os.path.basename(rel_path)}")
+        self.refinement_queue.enqueue_many(to_queue)
 
+        if bytecode["hits"] or bytecode["misses"]:
+            self.logger.log(
+                f"Template bytecode cache: {bytecode['hits']} loaded, {bytecode['misses']} compiled, "
+                f"~{bytecode['saved_ms']:.0f}ms compile time saved",
+                metadata={k: round(v, 3) for k, v in bytecode.items()}
+            )
+        self.logger.log(f"Blob store: {written} outputs rewritten, {rendered - written} unchanged")
         self.logger.log(f"Mission Successful: {self.industry} build complete.")
-        self.generate_readme()
-        self.generate_build_tests()
+        if extras:
+            self.generate_readme()
+            self.generate_build_tests()
         self.cache.save()
         self.logger.log(f"Cache saved: {len(self.cache.hashes)} entries indexed.")
         self.logger.log(f"Pass 1 complete. {queued_count} files queued for LLM refinement.")
 
-    def compile_pass2(self):
-        self.logger.log(f"Pass 2: draining queue ({self.refinement_queue.pending_count()} jobs) with {self.concurrency} workers...")
-        refiner_script = os.path.join(
-            os.path.dirname(__file__),
-            "../../.agent/skills/factory/context_refiner.py"
-        )
+    def compile_pass1(self, jobs=1):
+        self._start_pass1()
+        tasks = self._plan_pass1()
+        if jobs > 1:
+            self.logger.log(f"Pass 1 render pool: {jobs} workers for {len(tasks)} files")
+        results = run_tasks(tasks, self.env, {self.slug: self.context}, self.template_dir,
+                            jobs=jobs, blobs=self.blobs)
+        self._finish_pass1(results)
+
+    def compile_pass2(self, cancel_event=None, courses=None, on_session=None):
+        """
+        Refine this build's queued jobs; with courses (compilers sharing the queue
+        database), refine all of theirs through this build's workers and budget,
+        and add each course's share of the tokens to that course's cost report.
+        on_session(session), with session an id like "03", is called as soon as
+        none of that session's files is left to refine.
+        """
+        queue = self.refinement_queue
+        if courses is not None:
+            queue = RefinementQueue(queue.db_path, industries=[course.slug for course in courses])
+        self.logger.log(f"Pass 2: draining queue ({queue.pending_count()} jobs) with {self.concurrency} workers "
+                        f"(adapting between {self.concurrency_floor} and {self.concurrency_ceiling})...")
+        try:
+            asyncio.run(self._drain_pass2(cancel_event, queue, courses or [self], on_session))
+        finally:
+            if queue is not self.refinement_queue:
+                queue.conn.close()
+
+    def _pass2_concurrency(self):
+        """Pass 2 starts at `concurrency` jobs in flight and adapts between the manifest's floor and ceiling."""
+        return AdaptiveConcurrency(self.concurrency, floor=self.concurrency_floor,
+                                   ceiling=self.concurrency_ceiling, logger=self.logger)
+
+    def _session_tracker(self, queue, on_session):
+        """
+        Call on_session for sessions with nothing queued now, and return an on_result
+        hook that calls it for each other session once its last job has a result.
+        """
+        open_jobs = {}
+        for job in queue.open_jobs():
+            if job["industry_slug"] == self.slug:
+                session = session_of(os.path.relpath(job["file_path"], self.build_dir))
+                if session is not None:
+                    open_jobs.setdefault(session, set()).add(job["id"])
+        for session in self.allowed_sessions:
+            if session not in open_jobs:
+                on_session(f"{session:02d}")
+
+        def on_result(result):
+            # A deferred job is still unrefined: its session waits for the end of Pass 2
+            if result["status"] == "deferred":
+                return
+            for session, ids in open_jobs.items():
+                if result["job_id"] in ids:
+                    ids.discard(result["job_id"])
+                    if not ids:
+                        on_session(f"{session:02d}")
+                    return
+        return on_result
+
+    async def _drain_pass2(self, cancel_event, queue, courses, on_session=None):
         model = self.router.get_model("md_refine")
-        asyncio.run(drain_queue(
-            queue=self.refinement_queue,
-            industry_name=self.industry,
-            refiner_script=refiner_script,
-            model=model,
-            token_budget_config=self.token_budget,
-            logger=self.logger,
-            concurrency=self.concurrency
-        ))
-
-    def run_forensic_documentarian(self):
-        self.logger.log(f"Running Forensic Documentarian for {self.industry}...")
-        synth_script = os.path.join(
-            os.path.dirname(__file__),
-            "../../.agent/skills/forensic-documentarian/scripts/sync_docs.py"
-        )
+        budget = make_budget(self.token_budget)
+        on_result = self._session_tracker(queue, on_session) if on_session is not None else None
+        async with open_refiner(REFINER_SCRIPT, model, self.concurrency_ceiling, self.logger) as refiner:
+            await drain_queue(
+                queue=queue,
+                industry_name=self.industry,
+                refiner_script=REFINER_SCRIPT,
+                model=model,
+                token_budget_config=self.token_budget,
+                logger=self.logger,
+                concurrency=self._pass2_concurrency(),
+                cancel_event=cancel_event,
+                budget=budget,
+                refiner=refiner,
+                on_result=on_result
+            )
+        for course in courses:
+            course._record_pass2_usage(model, budget)
+
+    def _record_pass2_usage(self, model, budget):
+        """Add this build's Pass 2 tokens to its cost report: provider counts, plus any estimates in their place."""
+        usage = budget.usage_for(self.slug)
+        if usage["input"] or usage["output"]:
+            self.cost_tracker.record("md_refine", model, usage["input"], usage["output"])
+        if usage["estimated"]:
+            self.cost_tracker.record("md_refine", model, usage["estimated"], 0, exact=False)
+
+    def compile_pipelined(self, jobs=1, cancel_event=None):
+        """Pass 1 and Pass 2 overlapped: refinement starts on each markdown file as soon as it is written."""
+        asyncio.run(self._pipeline(jobs, cancel_event))
+
+    async def _pipeline(self, jobs, cancel_event):
+        loop = asyncio.get_running_loop()
+        job_ids = asyncio.Queue()
+        # The producer thread keeps self.refinement_queue; the consumer gets its own connection
+        consumer_queue = RefinementQueue(self.refinement_queue.db_path, self.refinement_queue.industries)
+        model = self.router.get_model("md_refine")
+        budget = make_budget(self.token_budget)
+        concurrency = self._pass2_concurrency()
+
+        def produce():
+            try:
+                self._start_pass1()
+                tasks = self._plan_pass1()
+                self.logger.log(f"Pipelined build: refining with {concurrency.limit} workers while rendering {len(tasks)} files")
+                results = iter_tasks(tasks, self.env, {self.slug: self.context}, self.template_dir,
+                                     jobs=jobs, blobs=self.blobs)
+                self._finish_pass1(results, on_enqueue=lambda job_id: loop.call_soon_threadsafe(job_ids.put_nowait, job_id))
+            finally:
+                loop.call_soon_threadsafe(job_ids.put_nowait, None)
+
+        async with open_refiner(REFINER_SCRIPT, model, self.concurrency_ceiling, self.logger) as refiner:
+            started = time.perf_counter()
+            consumer = asyncio.create_task(consume_stream(
+                job_ids, consumer_queue, self.industry, REFINER_SCRIPT, model, budget, self.logger,
+                concurrency=concurrency, cancel_event=cancel_event, refiner=refiner
+            ))
+            try:
+                await loop.run_in_executor(None, produce)
+            finally:
+                streamed = await consumer
+            self.logger.log(f"Pipeline: {streamed} files refined alongside rendering in {time.perf_counter() - started:.1f}s")
+            # Jobs left pending by earlier runs or deferred above go through the regular drain
+            await drain_queue(
+                queue=consumer_queue,
+                industry_name=self.industry,
+                refiner_script=REFINER_SCRIPT,
+                model=model,
+                token_budget_config=self.token_budget,
+                logger=self.logger,
+                concurrency=concurrency,
+                cancel_event=cancel_event,
+                budget=budget,
+                refiner=refiner
+            )
+        consumer_queue.conn.close()
+        self._record_pass2_usage(model, budget)
+
+    def run_forensic_documentarian(self, session=None):
+        """Run and document every lab, or only session (e.g. "03") when given."""
+        scope = f" session {session}" if session else ""
+        self.logger.log(f"Running Forensic Documentarian for {self.industry}{scope}...")
+        args = [sys.executable, DOCUMENTARIAN_SCRIPT] + (["--session", session] if session else [])
         try:
             env = os.environ.copy()
             env["TARGET_INDUSTRY"] = self.slug
-            subprocess.run([sys.executable, synth_script], check=True, env=env)
+            subprocess.run(args, check=True, env=env)
             self.logger.log("Lab execution and documentation sync complete.")
         except Exception as e:
             self.logger.log(f"Forensic Documentarian failed: {e}", level="WARNING")
 
-    def compile(self):
-        self.compile_pass1()
-        self.compile_pass2()
+    def compile(self, jobs=1, pipeline=False):
+        if pipeline:
+            self.compile_pipelined(jobs=jobs)
+        else:
+            self.compile_pass1(jobs=jobs)
+            self.compile_pass2()
+        self._finish_build()
+
+    def _finish_build(self):
+        self.write_build_report()
+        self.run_forensic_documentarian()
+
+    def write_build_report(self):
         self.logger.log(f"Model usage stats: {self.router.get_stats()}")
         report_path = os.path.join(self.build_dir, "cost_report.json")
         self.cost_tracker.save(report_path)
+        self.token_estimator.save()
         report = self.cost_tracker.report()
-        self.logger.log(f"Build cost: ${report['total_cost_usd']:.4f} | Tokens: {report['total_tokens']} | Calls: {report['total_calls']}")
-        self.run_forensic_documentarian()
+        self.logger.log(f"Build cost: ${report['total_cost_usd']:.4f} | Tokens: {report['total_tokens']} "
+                        f"({report['estimated_tokens']} estimated) | Calls: {report['total_calls']}")
+        limits = rate_limiter.limiter().stats()
+        if limits["waits"] or limits["throttled"]:
+            self.logger.log(f"Rate limits: {limits['waits']} calls waited {limits['waited_s']:.1f}s, "
+                            f"{limits['throttled']} throttled (429)", metadata=limits)
+
+    def documented_sessions(self):
+        """Forensic Documentarian session ids ("01", ...) that this build includes."""
+        try:
+            with open(DOCUMENTARIAN_SESSIONS) as f:
+                configured = (yaml.safe_load(f) or {}).get("sessions", {})
+        except OSError:
+            return []
+        return sorted(sid for sid in configured if int(sid) in self.allowed_sessions)
+
+    def compile_dag(self, force=False, jobs=1):
+        """
+        Context preparation and both passes as a StageGraph: independent stages run
+        concurrently and a critical-path timing report is logged at the end.
+
+        Cold builds split DNA, persona tools and session planning into stages, and
+        data synthesis runs alongside them. Static assets are copied while the LLM
+        stages run. Pass 2 emits refined_NN as the last file of session NN is
+        refined, so the Forensic Documentarian stage for that session starts then
+        instead of waiting for all of Pass 2.
+        """
+        os.makedirs(os.path.dirname(self.context_cache_path), exist_ok=True)
+        graph = StageGraph(max_workers=max(4, self.concurrency))
+        if force:
+            self.logger.log("Force rebuild: cache cleared")
+            self.cache.invalidate()
+
+        if not force and self.warm_context_available():
+            graph.add("context", self.load_cached_context, outputs=("context", "data"))
+        else:
+            self.logger.log("Cold build: generating LLM context and data as stages")
+            dna_inputs = ("dna",)
+            graph.add("dna", self.generate_dna, outputs=("dna",))
+            if self.has_persona:
+                graph.add("tools", self.load_persona_tools, outputs=("tools",))
+                graph.add("plan", self.plan_persona_sessions, inputs=("tools",), outputs=("plan",))
+                dna_inputs += ("plan",)
+            graph.add("context", self.save_context, inputs=dna_inputs, outputs=("context",))
+            graph.add("synth", self.run_data_synth, outputs=("data",))
+
+        static_results = []
+
+        def pass1_static():
+            tasks = self._plan_pass1(only="static")
+            static_results.extend(run_tasks(tasks, self.env, {self.slug: dict(self.context)}, self.template_dir,
+                                            jobs=jobs, blobs=self.blobs))
+
+        def pass1():
+            self._start_pass1()
+            tasks = self._plan_pass1(only="dynamic")
+            results = run_tasks(tasks, self.env, {self.slug: self.context}, self.template_dir,
+                                jobs=jobs, blobs=self.blobs)
+            self._finish_pass1(static_results + results)
+
+        graph.add("pass1_static", pass1_static, outputs=("static_assets",))
+        graph.add("pass1", pass1, inputs=("context", "data", "static_assets"), outputs=("markdown",))
+        documented = self.documented_sessions()
+
+        def session_refined(session):
+            if session in documented:
+                graph.emit(f"refined_{session}")
+
+        graph.add("pass2", lambda: self.compile_pass2(on_session=session_refined), inputs=("markdown",),
+                  outputs=("refined",) + tuple(f"refined_{session}" for session in documented))
+        for session in documented:
+            graph.add(f"docs_{session}", lambda s=session: self.run_forensic_documentarian(s),
+                      inputs=(f"refined_{session}",), outputs=(f"proof_{session}",))
+        graph.add("report", self.write_build_report, inputs=("refined",), outputs=("build_report",))
+
+        try:
+            graph.run()
+        finally:
+            report = graph.report()
+            self.logger.log("Stage timings:\n" + StageGraph.format_report(report), metadata=report)
+        return report
 
     def generate_readme(self):
         self.logger.log("Generating Factory Manual (README)...")
@@ -388,13 +846,12 @@ This repository contains a localized, generative AI curriculum focused on **{{ i
 ---
 *Created by the Learning Velocity Curriculum Factory (Engine: {{ engine_mode }}).*
 """
-        template = self.env.from_string(readme_content)
+        template = compile_string(self.env, readme_content)
         # Add engine_mode to context for the README
         current_context = self.context.copy()
         current_context['engine_mode'] = self.engine_mode
         rendered = template.render(current_context)
-        with open(os.path.join(self.build_dir, "README.md"), 'w') as f:
-            f.write(rendered)
+        self.blobs.write_bytes(rendered.encode("utf-8"), os.path.join(self.build_dir, "README.md"))
 
     def generate_build_tests(self):
         self.logger.log("Generating Portable Guardian...")
@@ -421,5 +878,151 @@ if __name__ == "__main__":
     else:
         print("🚨 BUILD STATUS: WARNING")
 """
-        with open(os.path.join(self.build_dir, "tests.py"), 'w') as f:
-            f.write(test_content)
+        self.blobs.write_bytes(test_content.encode("utf-8"), os.path.join(self.build_dir, "tests.py"))
+
+
+def manifest_from_course(course):
+    """Translate a catalog course entry into a manifest dict."""
+    manifest = {
+        "industry": course["industry"],
+        "use_cases": course.get("use_cases", []),
+        "tracks": course.get("default_tracks", ["navigator", "builder", "architect"]),
+        "sessions": course.get("default_sessions", list(range(1, 9))),
+        "tone": course.get("tone", "Practical & Applied"),
+        "compliance_framework": (course.get("compliance") or ["None"])[0],
+        "region": course.get("region", "Global"),
+    }
+    for key in ("audience", "persona_source", "concurrency", "concurrency_floor", "concurrency_ceiling",
+                "token_budget", "rate_limits", "data_schema"):
+        if key in course:
+            manifest[key] = course[key]
+    return manifest
+
+
+def load_catalog(catalog_path, course_ids=None):
+    """Return manifest dicts for the catalog courses, optionally filtered by id."""
+    with open(catalog_path) as f:
+        courses = (yaml.safe_load(f) or {}).get("courses", [])
+    if course_ids:
+        courses = [c for c in courses if c.get("id") in course_ids]
+    return [manifest_from_course(c) for c in courses]
+
+
+def _prepare_builds(manifests, engine_mode, env, force=False, manifest_wins=False):
+    """
+    Create compilers over a shared Environment, ToolMemory and TemplateIndex and
+    prepare their contexts concurrently. With manifest_wins, values taken straight
+    from the manifest override the cached DNA context (used when a watched
+    manifest is edited).
+    """
+    compilers = [FactoryCompiler(m, engine_mode=engine_mode, env=env) for m in manifests]
+    if not compilers:
+        return []
+    lead = compilers[0]
+    tool_memory = ToolMemory()
+    template_index = TemplateIndex(os.path.join('_factory', 'templates'))
+    for compiler in compilers:
+        compiler.tool_memory = tool_memory
+        compiler.template_index = template_index
+
+    def prepare(compiler):
+        base = dict(compiler.context)
+        compiler.prepare_context(force=force)
+        if manifest_wins:
+            compiler.context.update(base)
+
+    with ThreadPoolExecutor(max_workers=lead.concurrency) as pool:
+        list(pool.map(prepare, compilers))
+    return compilers
+
+
+def _render_pass1(compilers, env, jobs=1, requeue_unchanged=True):
+    """Run Pass 1 for every build, template-major so each compiled template stays hot across contexts."""
+    lead = compilers[0]
+    tasks = []
+    for compiler in compilers:
+        compiler._start_pass1()
+        tasks.extend(compiler._plan_pass1())
+    order = {c.slug: i for i, c in enumerate(compilers)}
+    tasks.sort(key=lambda t: (t["rel_path"], order[t["slug"]]))
+    if jobs > 1:
+        lead.logger.log(f"Pass 1 render pool: {jobs} workers for {len(tasks)} files")
+    results = run_tasks(tasks, env, {c.slug: c.context for c in compilers}, lead.template_dir,
+                        jobs=jobs, blobs=lead.blobs)
+    for compiler in compilers:
+        compiler._finish_pass1([r for r in results if r["slug"] == compiler.slug], requeue_unchanged)
+    return results
+
+
+def compile_many(manifests, engine_mode="local", jobs=1, force=False):
+    """
+    Compile several manifests in one process.
+
+    All builds share one Jinja Environment, so each template is parsed once and
+    rendered once per context. DNA generation runs across builds under the first
+    manifest's concurrency, and Pass 2 drains every build's jobs through a single
+    worker pool and token budget.
+
+    Returns:
+        List of FactoryCompiler instances, one per manifest.
+    """
+    env = make_environment(os.path.join('_factory', 'templates'))
+    compilers = _prepare_builds(manifests, engine_mode, env, force=force)
+    if not compilers:
+        return []
+    lead = compilers[0]
+    lead.logger.log(f"Catalog build: {len(compilers)} courses, concurrency {lead.concurrency}")
+
+    _render_pass1(compilers, env, jobs=jobs)
+
+    # Pass 2 — the queue holds every course's jobs; drain them under one budget
+    lead.compile_pass2(courses=compilers)
+    for compiler in compilers:
+        compiler._finish_build()
+    return compilers
+
+
+def watch_builds(load_manifests, manifest_paths, engine_mode="local", jobs=1, force=False, poll_interval=0.5):
+    """
+    Keep builds warm and re-run Pass 1 whenever templates or manifests change.
+
+    load_manifests() returns the manifests (paths or dicts) to build and is called
+    again when any of manifest_paths changes. The Environment, contexts, template
+    index and caches persist between rebuilds, so an edit re-renders only the
+    templates whose digests changed, and only markdown whose output bytes changed
+    is re-enqueued for refinement. Runs until interrupted.
+    """
+    template_dir = os.path.join('_factory', 'templates')
+    env = make_environment(template_dir)
+    compilers = _prepare_builds(load_manifests(), engine_mode, env, force=force)
+    if not compilers:
+        return []
+    _render_pass1(compilers, env, jobs=jobs)
+
+    manifest_set = {os.path.abspath(p) for p in manifest_paths}
+    watcher = make_watcher([template_dir], manifest_paths, poll_interval=poll_interval)
+    logger = compilers[0].logger
+    logger.log(f"Watching {template_dir} ({watcher.kind}) for {len(compilers)} build(s). Ctrl+C to stop.")
+    try:
+        while True:
+            changes = watcher.changes()
+            if not changes:
+                continue
+            started = time.perf_counter()
+            if manifest_set & changes.keys():
+                logger.log("Manifest changed: reloading builds")
+                compilers = _prepare_builds(load_manifests(), engine_mode, env, manifest_wins=True) or compilers
+            elif any(kind != "modified" for kind in changes.values()):
+                compilers[0].template_index.rebuild()
+            results = _render_pass1(compilers, env, jobs=jobs, requeue_unchanged=False)
+            changed = sum(r["changed"] for r in results)
+            logger.log(
+                f"Watch rebuild: {len(changes)} file event(s), {changed} output(s) updated "
+                f"in {(time.perf_counter() - started) * 1000:.0f}ms",
+                metadata={"events": sorted(os.path.relpath(p) for p in changes)}
+            )
+    except KeyboardInterrupt:
+        logger.log("Watch stopped")
+    finally:
+        watcher.close()
+    return compilers
@@ -1,6 +1,8 @@
 """
 Cost Tracker — records per-call token usage and cost across the build pipeline.
-Produces cost_report.json at end of build.
+Produces cost_report.json at end of build. Calls are charged the provider's own token
+counts; calls recorded from estimates are flagged so the report shows how much of
+the total is exact.
 """
 import json
 import os
@@ -30,7 +32,7 @@ class CostTracker:
             pricing = self.PRICING["gemini-2.0-flash"]
         return (input_tokens * pricing["input"] + output_tokens * pricing["output"]) / 1_000_000
 
-    def record(self, task_type, model, input_tokens, output_tokens):
+    def record(self, task_type, model, input_tokens, output_tokens, exact=True):
         cost = self._cost(model, input_tokens, output_tokens)
         self.calls.append({
             "task_type": task_type,
@@ -38,6 +40,7 @@ class CostTracker:
             "input_tokens": input_tokens,
             "output_tokens": output_tokens,
             "cost": cost,
+            "exact": exact,
         })
 
     def total_cost(self):
@@ -51,8 +54,9 @@ class CostTracker:
         for c in self.calls:
             t = c["task_type"]
             if t not in by_task:
-                by_task[t] = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+                by_task[t] = {"calls": 0, "estimated_calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
             by_task[t]["calls"] += 1
+            by_task[t]["estimated_calls"] += 0 if c.get("exact", True) else 1
             by_task[t]["input_tokens"] += c["input_tokens"]
             by_task[t]["output_tokens"] += c["output_tokens"]
             by_task[t]["cost_usd"] += c["cost"]
@@ -63,6 +67,8 @@ class CostTracker:
             "build_time": str(datetime.now() - self.start_time),
             "total_calls": len(self.calls),
             "total_tokens": self.total_tokens(),
+            "estimated_tokens": sum(c["input_tokens"] + c["output_tokens"] for c in self.calls
+                                    if not c.get("exact", True)),
             "total_cost_usd": round(total_usd, 6),
             "total_cost_inr": round(total_usd * self.USD_TO_INR, 4),
             "by_task": by_task,
@@ -0,0 +1,253 @@
+"""
+Data Spec — schema-then-vectorized synthetic data.
+One LLM call describes each data_schema column (type, distribution, vocabulary,
+realistic range); the spec is cached per industry, and rows are generated locally
+from it with a seed, so rebuilds make no LLM calls for data and produce the same
+table. NumPy generates columns and applies the dirty_rate corruption as masks when
+installed; otherwise the same spec is sampled row by row with the random module.
+"""
+import json
+import os
+import random
+import zlib
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+    _HAS_NUMPY = hasattr(np, "strings") and hasattr(np.strings, "slice")
+except ImportError:
+    _HAS_NUMPY = False
+
+try:
+    from _factory.core.data_synth import DIRTY_KINDS, OUTPUT_FILES, inject_dirty, is_id_column, write_csv
+except ImportError:
+    from core.data_synth import DIRTY_KINDS, OUTPUT_FILES, inject_dirty, is_id_column, write_csv
+
+SPEC_DIR = os.path.join("_factory", "cache", "data_specs")
+TYPES = ("id", "int", "float", "date", "category", "text")
+DISTRIBUTIONS = ("uniform", "normal", "lognormal")
+
+
+def guess_type(column):
+    if is_id_column(column):
+        return "id"
+    name = column.lower()
+    if "date" in name or "time" in name:
+        return "date"
+    if any(k in name for k in ("amount", "value", "price", "cost", "total", "revenue", "rate", "score")):
+        return "float"
+    if any(k in name for k in ("count", "qty", "quantity", "age", "units")):
+        return "int"
+    if any(k in name for k in ("status", "category", "type", "region", "level", "tier")):
+        return "category"
+    return "text"
+
+
+def _number(value, default):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else default
+
+
+def _iso(value, default):
+    try:
+        return date.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        return default
+
+
+def _strings(values):
+    return [str(v).strip() for v in values if str(v).strip()] if isinstance(values, list) else []
+
+
+def normalize_spec(columns, raw):
+    """
+    A complete spec for every column, whatever the LLM returned.
+    Unknown types fall back to a guess from the column name; missing or invalid
+    fields get safe defaults.
+    """
+    raw = raw if isinstance(raw, dict) else {}
+    spec = {}
+    for column in columns:
+        entry = raw.get(column) if isinstance(raw.get(column), dict) else {}
+        kind = entry.get("type") if entry.get("type") in TYPES else guess_type(column)
+        col = {"type": kind}
+        if kind == "id":
+            col["prefix"] = str(entry.get("prefix") or "")
+        elif kind in ("int", "float"):
+            low, high = _number(entry.get("min"), 0), _number(entry.get("max"), 1000)
+            col["min"], col["max"] = min(low, high), max(low, high)
+            dist = entry.get("distribution")
+            col["distribution"] = dist if dist in DISTRIBUTIONS else "uniform"
+            col["decimals"] = 0 if kind == "int" else int(_number(entry.get("decimals"), 2))
+        elif kind == "date":
+            col["start"] = _iso(entry.get("start"), "2023-01-01")
+            col["end"] = max(col["start"], _iso(entry.get("end"), "2024-12-31"))
+        else:
+            values = _strings(entry.get("values"))
+            if not values:
+                values = ["Open", "Closed", "Pending"] if kind == "category" else [f"{column} entry"]
+            col["values"] = values
+            weights = entry.get("weights")
+            if (isinstance(weights, list) and len(weights) == len(values)
+                    and all(isinstance(w, (int, float)) and w >= 0 for w in weights) and sum(weights) > 0):
+                col["weights"] = [w / sum(weights) for w in weights]
+        spec[column] = col
+    return spec
+
+
+def _spec_prompt(industry, columns):
+    return f"""Describe realistic synthetic data for the {industry} industry.
+Return a JSON object with one key per column: {', '.join(columns)}
+Each value is an object with a "type" of: id, int, float, date, category or text.
+- id: optional "prefix" (e.g. "INV-")
+- int / float: "min", "max", "distribution" (uniform, normal or lognormal), "decimals"
+- date: "start" and "end" as YYYY-MM-DD
+- category: "values" (3-8 realistic labels) and optional "weights" summing to 1
+- text: "values" (8-20 short realistic phrases)
+Use ranges and vocabulary a {industry} professional would recognize. Return ONLY the JSON."""
+
+
+def load_or_create_spec(slug, industry, columns, llm_caller, spec_dir=SPEC_DIR):
+    """
+    The cached spec for this industry and column list, asking the LLM only on a miss.
+    llm_caller takes a prompt and returns parsed JSON (or None, in which case the
+    spec is guessed from the column names).
+
+    Returns:
+        (spec, cached)
+    """
+    path = os.path.join(spec_dir, f"{slug}.json")
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                stored = json.load(f)
+            if stored.get("columns") == list(columns):
+                return normalize_spec(columns, stored["spec"]), True
+        except (OSError, ValueError, KeyError):
+            pass
+    raw = llm_caller(_spec_prompt(industry, columns))
+    spec = normalize_spec(columns, raw)
+    if not isinstance(raw, dict):
+        # Name-based guesses only; ask again on the next build rather than caching them
+        return spec, False
+    os.makedirs(spec_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"industry": industry, "columns": list(columns), "spec": spec}, f, indent=2)
+    os.replace(tmp_path, path)
+    return spec, False
+
+
+# ── NumPy: column vectors and corruption masks ────────────────────────────────
+def _np_column(col, n, rng):
+    kind = col["type"]
+    if kind == "id":
+        return np.char.add(col["prefix"], np.arange(1, n + 1).astype(str))
+    if kind in ("int", "float"):
+        low, high = col["min"], col["max"]
+        if col["distribution"] == "normal":
+            values = rng.normal((low + high) / 2, (high - low) / 6 or 1, n)
+        elif col["distribution"] == "lognormal":
+            values = low + rng.lognormal(0, 0.75, n) * (high - low) / 4
+        else:
+            values = rng.uniform(low, high, n)
+        values = np.clip(values, low, high)
+        return np.char.mod(f"%.{col['decimals']}f", values)
+    if kind == "date":
+        start, end = np.datetime64(col["start"]), np.datetime64(col["end"])
+        days = rng.integers(0, (end - start).astype(int) + 1, n)
+        return np.datetime_as_string(start + days, unit="D")
+    return rng.choice(np.array(col["values"]), n, p=col.get("weights"))
+
+
+def _np_format_error(values, kind, rng):
+    s = np.strings
+    if kind == "date":
+        y, m, d = s.slice(values, 0, 4), s.slice(values, 5, 7), s.slice(values, 8, 10)
+        return np.where(rng.random(len(values)) < 0.5, m + "/" + d + "/" + y, d + "." + m + "." + y)
+    if kind in ("int", "float"):
+        return np.where(rng.random(len(values)) < 0.5, "$" + values, "N/A")
+    return s.upper(values)
+
+
+def _np_misspell(values):
+    s = np.strings
+    return s.slice(values, 0, 1) + s.slice(values, 2, 3) + s.slice(values, 1, 2) + s.slice(values, 3, None)
+
+
+def _generate_numpy(spec, columns, row_count, dirty_rate, seed):
+    rng = np.random.default_rng(seed)
+    table = [_np_column(spec[c], row_count, rng).astype(np.dtypes.StringDType()) for c in columns]
+    editable = [j for j, c in enumerate(columns) if spec[c]["type"] != "id"] or list(range(len(columns)))
+    textual = [j for j in editable if spec[columns[j]]["type"] in ("category", "text")] or editable
+
+    dirty_rows = rng.permutation(row_count)[:round(row_count * dirty_rate)]
+    groups = dict(zip(DIRTY_KINDS, np.array_split(dirty_rows, len(DIRTY_KINDS))))
+
+    # Duplicates first so the other corruptions never get copied over
+    rows = groups["duplicate"]
+    sources = rng.integers(0, row_count, len(rows))
+    for col in table:
+        col[rows] = col[sources]
+
+    for kind in ("null", "format", "misspelling"):
+        rows = groups[kind]
+        targets = textual if kind == "misspelling" else editable
+        picks = np.array(targets)[rng.integers(0, len(targets), len(rows))]
+        for j in targets:
+            hit = rows[picks == j]
+            if not len(hit):
+                continue
+            if kind == "null":
+                table[j][hit] = ""
+            elif kind == "format":
+                table[j][hit] = _np_format_error(table[j][hit], spec[columns[j]]["type"], rng)
+            else:
+                table[j][hit] = _np_misspell(table[j][hit])
+
+    rows = np.stack(table, axis=1).tolist() if table else []
+    return rows, {kind: len(groups[kind]) for kind in DIRTY_KINDS}
+
+
+# ── Pure Python fallback ──────────────────────────────────────────────────────
+def _py_value(col, index, rng):
+    kind = col["type"]
+    if kind == "id":
+        return f"{col['prefix']}{index + 1}"
+    if kind in ("int", "float"):
+        low, high = col["min"], col["max"]
+        if col["distribution"] == "normal":
+            value = rng.gauss((low + high) / 2, (high - low) / 6 or 1)
+        elif col["distribution"] == "lognormal":
+            value = low + rng.lognormvariate(0, 0.75) * (high - low) / 4
+        else:
+            value = rng.uniform(low, high)
+        return f"{min(max(value, low), high):.{col['decimals']}f}"
+    if kind == "date":
+        start, end = date.fromisoformat(col["start"]), date.fromisoformat(col["end"])
+        return (start + timedelta(days=rng.randint(0, (end - start).days))).isoformat()
+    return rng.choices(col["values"], weights=col.get("weights"))[0]
+
+
+def _generate_python(spec, columns, row_count, dirty_rate, seed):
+    rng = random.Random(seed)
+    rows = [[_py_value(spec[c], i, rng) for c in columns] for i in range(row_count)]
+    id_index = next((j for j, c in enumerate(columns) if spec[c]["type"] == "id"), -1)
+    return rows, inject_dirty(rows, dirty_rate, seed=seed, id_index=id_index)
+
+
+def synthesize_from_spec(slug, industry, columns, dirty_rate, row_count, target_dir, llm_caller,
+                         seed=None, spec_dir=SPEC_DIR):
+    """
+    Write the industry's lab datasets into target_dir from its (cached) column spec.
+
+    Returns:
+        dict: {"rows", "dirty": {kind: count}, "spec_cached": bool, "engine": "numpy" | "python"}
+    """
+    spec, cached = load_or_create_spec(slug, industry, columns, llm_caller, spec_dir)
+    seed = zlib.crc32(slug.encode("utf-8")) if seed is None else seed
+    generate = _generate_numpy if _HAS_NUMPY else _generate_python
+    rows, dirty = generate(spec, columns, row_count, dirty_rate, seed)
+    for name in OUTPUT_FILES:
+        write_csv(os.path.join(target_dir, name), columns, rows)
+    return {"rows": len(rows), "dirty": dirty, "spec_cached": cached,
+            "engine": "numpy" if _HAS_NUMPY else "python"}
@@ -0,0 +1,205 @@
+"""
+Data Synth — in-process, chunked synthetic dataset generation for lab data.
+row_count is split into chunks that are generated concurrently against the same
+column schema, each chunk owning a disjoint id range and sized so its CSV fits the
+model's output token limit. Rows cut short by a truncated response are dropped and
+regenerated. Chunks are merged under the
+schema header with duplicate ids reconciled, and dirty rows (nulls, duplicates,
+format errors, misspellings) are injected in a final deterministic pass so the
+dirty rate holds for the whole table rather than per LLM response.
+"""
+import asyncio
+import csv
+import io
+import os
+import random
+import re
+import zlib
+
+# Upper bound on rows per chunk; wide schemas get fewer (rows_per_chunk)
+CHUNK_ROWS = 100
+# maxOutputTokens of the generate calls (gemini_rest), with headroom for the header and drift
+OUTPUT_TOKEN_LIMIT = 4096
+OUTPUT_HEADROOM = 0.75
+# Estimated output tokens per CSV cell, separator included
+TOKENS_PER_CELL = 5
+# Extra rounds that regenerate rows missing after the first pass
+TOP_UP_ROUNDS = 3
+MAX_CONCURRENCY = 8
+OUTPUT_FILES = ("dirty_data.csv", "corporate_expenses.csv")
+
+DIRTY_KINDS = ("null", "duplicate", "format", "misspelling")
+
+
+def rows_per_chunk(columns, chunk_rows=None):
+    """Rows one LLM response can hold for this schema, capped at chunk_rows (default CHUNK_ROWS)."""
+    fitted = int(OUTPUT_TOKEN_LIMIT * OUTPUT_HEADROOM) // (TOKENS_PER_CELL * max(len(columns), 1))
+    return max(1, min(chunk_rows or CHUNK_ROWS, fitted))
+
+
+def chunk_ranges(row_count, chunk_rows=CHUNK_ROWS):
+    """[(first_id, rows), ...] covering ids 1..row_count."""
+    return [(start + 1, min(chunk_rows, row_count - start)) for start in range(0, row_count, chunk_rows)]
+
+
+def is_id_column(column):
+    name = column.lower()
+    return name == "id" or name.endswith(("_id", " id"))
+
+
+def id_index(columns):
+    """Position of the first id column, or -1 when the schema has none."""
+    return next((i for i, c in enumerate(columns) if is_id_column(c)), -1)
+
+
+def _chunk_prompt(industry, columns, first_id, rows):
+    index = id_index(columns)
+    numbering = (f"Number the {columns[index]} column sequentially from {first_id} to {first_id + rows - 1}.\n"
+                 if index >= 0 else "")
+    return f"""Generate {rows} rows of CSV data for the {industry} industry.
+Use EXACTLY these columns in this order: {', '.join(columns)}
+{numbering}All values must be clean and realistic: no blanks, no duplicates, consistent formats.
+Return ONLY the CSV starting with the header row. No preamble, no explanation.
+START CSV NOW."""
+
+
+def parse_chunk(text, columns):
+    """
+    Rows from one LLM response, cut to len(columns) cells.
+    Code fences, preamble lines, repeated header rows and rows with fewer cells
+    than the schema (a response truncated mid-row) are dropped.
+    """
+    header = [c.strip().lower() for c in columns]
+    rows = []
+    for row in csv.reader(io.StringIO(text or "")):
+        cells = [c.strip() for c in row]
+        if len(cells) < len(columns) or cells[0].startswith("```"):
+            continue
+        if [c.lower() for c in cells[:len(header)]] == header:
+            continue
+        rows.append(cells[:len(columns)])
+    return rows
+
+
+def reconcile_ids(rows, id_index=0):
+    """Give every row a unique id, keeping the model's id unless it was already used."""
+    seen = set()
+    numeric = [int(r[id_index]) for r in rows if r[id_index].isdigit()]
+    next_id = max(numeric, default=0) + 1
+    for row in rows:
+        value = row[id_index]
+        if value and value not in seen:
+            seen.add(value)
+            continue
+        while str(next_id) in seen:
+            next_id += 1
+        row[id_index] = str(next_id)
+        seen.add(row[id_index])
+        next_id += 1
+    return rows
+
+
+def _misspell(value, rng):
+    letters = [i for i in range(len(value) - 1) if value[i].isalpha() and value[i + 1].isalpha()]
+    if not letters:
+        return None
+    i = rng.choice(letters)
+    return value[:i] + value[i + 1] + value[i] + value[i + 2:]
+
+
+def _format_error(value, rng):
+    date = re.fullmatch(r"(\d{4})-(\d{2})-(\d{2})", value)
+    if date:
+        y, m, d = date.groups()
+        return rng.choice([f"{m}/{d}/{y}", f"{d}.{m}.{y}", f"{y}{m}{d}"])
+    try:
+        number = float(value.replace(",", ""))
+    except ValueError:
+        return value.upper() if value.lower() != value.upper() else None
+    return rng.choice([f"${number:,.2f}", f"{number:.0f} units", "N/A", str(-abs(number))])
+
+
+def inject_dirty(rows, dirty_rate, seed=0, id_index=0):
+    """
+    Corrupt round(len(rows) * dirty_rate) distinct rows in place.
+    A duplicate replaces the chosen row with a copy of another one, so the row
+    count is unchanged. Returns {kind: count}.
+    """
+    rng = random.Random(seed)
+    counts = dict.fromkeys(DIRTY_KINDS, 0)
+    targets = rng.sample(range(len(rows)), min(len(rows), round(len(rows) * dirty_rate)))
+    for n, index in enumerate(targets):
+        kind = DIRTY_KINDS[n % len(DIRTY_KINDS)]
+        row = rows[index]
+        cells = [i for i in range(len(row)) if i != id_index and row[i]]
+        if kind == "duplicate" and len(rows) > 1:
+            source = (index + rng.randrange(1, len(rows))) % len(rows)
+            rows[index] = list(rows[source])
+        elif cells:
+            i = rng.choice(cells)
+            if kind == "null":
+                row[i] = ""
+            else:
+                corrupt = _misspell if kind == "misspelling" else _format_error
+                row[i] = corrupt(row[i], rng) or ""
+        counts[kind] += 1
+    return counts
+
+
+def write_csv(path, columns, rows):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+async def generate_rows(industry, columns, row_count, llm_caller, chunk_rows=None, concurrency=MAX_CONCURRENCY):
+    """
+    Generate clean rows chunk by chunk, at most `concurrency` LLM calls in flight.
+    llm_caller is a blocking callable prompt -> text; it runs on worker threads.
+    Rows missing after the first pass are regenerated for up to TOP_UP_ROUNDS more
+    rounds; nothing is retried when every chunk came back empty.
+    """
+    chunk_rows = rows_per_chunk(columns, chunk_rows)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(first_id, rows):
+        async with semaphore:
+            text = await asyncio.to_thread(llm_caller, _chunk_prompt(industry, columns, first_id, rows))
+        return parse_chunk(text, columns)[:rows]
+
+    chunks = await asyncio.gather(*(one(first, rows) for first, rows in chunk_ranges(row_count, chunk_rows)))
+    merged = [row for chunk in chunks for row in chunk]
+    for _ in range(TOP_UP_ROUNDS):
+        shortfall = row_count - len(merged)
+        if not 0 < shortfall < row_count:
+            break
+        top_up = await asyncio.gather(*(one(row_count - shortfall + first, rows)
+                                        for first, rows in chunk_ranges(shortfall, chunk_rows)))
+        merged.extend(row for chunk in top_up for row in chunk)
+    merged = merged[:row_count]
+    index = id_index(columns)
+    return reconcile_ids(merged, index) if index >= 0 else merged
+
+
+def synthesize(slug, industry, columns, dirty_rate, row_count, target_dir, llm_caller,
+               chunk_rows=None, concurrency=MAX_CONCURRENCY):
+    """
+    Write the industry's lab datasets into target_dir.
+
+    Returns:
+        dict: {"rows": int, "chunks": int, "dirty": {kind: count}}; rows is 0 when
+        every chunk failed, in which case nothing is written.
+    """
+    chunk_rows = rows_per_chunk(columns, chunk_rows)
+    rows = asyncio.run(generate_rows(industry, columns, row_count, llm_caller, chunk_rows, concurrency))
+    if not rows:
+        return {"rows": 0, "chunks": len(chunk_ranges(row_count, chunk_rows)), "dirty": {}}
+    # Seeded by slug so a rebuild corrupts the same rows of the same data
+    dirty = inject_dirty(rows, dirty_rate, seed=zlib.crc32(slug.encode("utf-8")), id_index=id_index(columns))
+    for name in OUTPUT_FILES:
+        write_csv(os.path.join(target_dir, name), columns, rows)
+    return {"rows": len(rows), "chunks": len(chunk_ranges(row_count, chunk_rows)), "dirty": dirty}
@@ -1,28 +1,40 @@
 """
 Lightweight Gemini REST client — no SDK required.
-Returns content + token usage metadata for cost tracking.
+Returns content + token usage metadata for cost tracking. Requests go through the
+shared pooled client, which retries 429/5xx responses and trips the "gemini"
+circuit breaker when the API keeps failing. astream_gemini streams the response
+(streamGenerateContent over server-sent events) for callers on an event loop.
+Both wait on the shared rate limiter with the prompt's local token count and then
+settle it against the usageMetadata Gemini returns.
 """
 import json
 import os
-import requests
 
+try:
+    from _factory.core.http_client import post_json, AsyncHttpClient, HttpError
+    from _factory.core.llm_stream import StreamMetrics, stall_guard
+    from _factory.core.rate_limiter import limiter
+    from _factory.core.token_accounting import local_count
+except ImportError:
+    from core.http_client import post_json, AsyncHttpClient, HttpError
+    from core.llm_stream import StreamMetrics, stall_guard
+    from core.rate_limiter import limiter
+    from core.token_accounting import local_count
 
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
 
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+GEMINI_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent"
 
-def call_gemini(prompt, model="gemini-2.0-flash", is_json=False):
-    """
-    Call Gemini via REST API.
 
-    Returns:
-        dict: {"content": parsed result, "input_tokens": int, "output_tokens": int}
-        None on failure.
-    """
+def _request(prompt, model, is_json, stream=False):
     api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
     if not api_key:
         raise EnvironmentError("GEMINI_API_KEY not set")
 
-    url = GEMINI_API_URL.format(model=model) + f"?key={api_key}"
+    if stream:
+        url = GEMINI_STREAM_URL.format(model=model) + f"?alt=sse&key={api_key}"
+    else:
+        url = GEMINI_API_URL.format(model=model) + f"?key={api_key}"
 
     payload = {
         "contents": [{"parts": [{"text": prompt}]}],
@@ -34,31 +46,45 @@ def call_gemini(prompt, model="gemini-2.0-flash", is_json=False):
 
     if is_json:
         payload["generationConfig"]["responseMimeType"] = "application/json"
+    return url, payload
+
+
+def parse_json_text(text):
+    """Decode a JSON response, tolerating a markdown code fence around it."""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0].strip()
+    return json.loads(text)
+
+
+def _result(data, is_json):
+    text = data["candidates"][0]["content"]["parts"][0]["text"]
+    usage = data.get("usageMetadata", {})
+
+    return {
+        "content": parse_json_text(text) if is_json else text,
+        "input_tokens": usage.get("promptTokenCount", 0),
+        "output_tokens": usage.get("candidatesTokenCount", 0),
+    }
 
+
+def call_gemini(prompt, model="gemini-2.0-flash", is_json=False):
+    """
+    Call Gemini via REST API.
+
+    Returns:
+        dict: {"content": parsed result, "input_tokens": int, "output_tokens": int}
+        None on failure.
+    """
+    url, payload = _request(prompt, model, is_json)
+    tokens = local_count(prompt)
     try:
-        resp = requests.post(url, json=payload, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()
-
-        text = data["candidates"][0]["content"]["parts"][0]["text"]
-        usage = data.get("usageMetadata", {})
-
-        parsed = text
-        if is_json:
-            if "```json" in text:
-                text = text.split("```json")[1].split("```")[0].strip()
-            elif "```" in text:
-                text = text.split("```")[1].split("```")[0].strip()
-            parsed = json.loads(text)
-
-        return {
-            "content": parsed,
-            "input_tokens": usage.get("promptTokenCount", 0),
-            "output_tokens": usage.get("candidatesTokenCount", 0),
-        }
-
-    except requests.exceptions.HTTPError as e:
-        print(f"[GEMINI ERROR] HTTP {e.response.status_code}: {e.response.text[:200]}")
+        result = _result(post_json(url, payload, provider="gemini", timeout=60, model=model, tokens=tokens), is_json)
+        limiter().settle("gemini", model, tokens, (result["input_tokens"], result["output_tokens"]))
+        return result
+    except HttpError as e:
+        print(f"[GEMINI ERROR] HTTP {e.status}: {e.body[:200]}")
         return None
     except (json.JSONDecodeError, KeyError, IndexError) as e:
         print(f"[GEMINI ERROR] Parse error: {e}")
@@ -66,3 +92,36 @@ def call_gemini(prompt, model="gemini-2.0-flash", is_json=False):
     except Exception as e:
         print(f"[GEMINI ERROR] {e}")
         return None
+
+
+async def astream_gemini(prompt, model="gemini-2.0-flash", is_json=False, client=None, metrics=None,
+                         stall_timeout=None):
+    """
+    Yield response text chunks as Gemini generates them. Token counts from the final
+    usageMetadata are recorded on metrics. Failures raise (StreamStalled when the
+    stream goes quiet): the caller decides what a partial response is worth. Pass an
+    AsyncHttpClient to share its connection pool; without one a short-lived client is used.
+    """
+    url, payload = _request(prompt, model, is_json, stream=True)
+    metrics = metrics or StreamMetrics("gemini", model)
+    http = client or AsyncHttpClient()
+    usage = {}
+    tokens = local_count(prompt)
+    try:
+        lines = http.stream_lines(url, payload, provider="gemini", timeout=60, model=model, tokens=tokens)
+        async for line in stall_guard(lines, stall_timeout, label=f"gemini/{model}"):
+            if not line.startswith("data:"):
+                continue
+            data = json.loads(line[len("data:"):])
+            usage = data.get("usageMetadata", usage)
+            candidates = data.get("candidates") or [{}]
+            text = "".join(part.get("text", "") for part in candidates[0].get("content", {}).get("parts", []))
+            if text:
+                metrics.token(text)
+                yield text
+        metrics.finish(usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+        if usage:
+            limiter().settle("gemini", model, tokens, (metrics.input_tokens or 0, metrics.output_tokens or 0))
+    finally:
+        if client is None:
+            await http.aclose()
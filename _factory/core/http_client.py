@@ -0,0 +1,268 @@
+"""
+HTTP Client — pooled, retrying JSON POSTs shared by every LLM REST call site.
+Built on httpx: one keep-alive connection pool per process (HTTP/2 when the h2
+package is installed), exponential backoff with full jitter on 429/5xx and
+transport errors, Retry-After honoured when the server sends it, and a
+per-provider circuit breaker that fails fast after repeated failures instead of
+letting every queued call wait out its own retries. Every attempt first waits
+its turn on the shared rate limiter and a 429 slows the limiter down; an attempt
+that fails gives its tokens back, so a request is charged once however often it
+is retried.
+"""
+import asyncio
+import email.utils
+import importlib.util
+import random
+import threading
+import time
+
+import httpx
+
+try:
+    from _factory.core.rate_limiter import limiter
+except ImportError:
+    from core.rate_limiter import limiter
+
+HTTP2 = importlib.util.find_spec("h2") is not None
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class HttpError(Exception):
+    def __init__(self, status, body, retry_after=None):
+        super().__init__(f"HTTP {status}: {body[:200]}")
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy:
+    def __init__(self, attempts=4, base_delay=0.5, max_delay=30.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """Full-jitter backoff for the given retry (0-based); a Retry-After hint wins when present."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures; open -> half-open
+    after reset_after seconds, when one trial request is let through; its success
+    closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_after=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(provider):
+    with _breakers_lock:
+        return _breakers.setdefault(provider, CircuitBreaker())
+
+
+def _limits(max_connections):
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+
+def _check(response):
+    """Return the decoded JSON body, or raise HttpError carrying any Retry-After hint."""
+    if response.status_code >= 400:
+        raise HttpError(response.status_code, response.text,
+                        parse_retry_after(response.headers.get("Retry-After")))
+    return response.json()
+
+
+def _attempt_failed(error, provider, model, tokens):
+    """Refund the tokens a failed attempt took from the rate limiter, and feed a 429 back to it."""
+    limiter().settle(provider, model, tokens, (0, 0))
+    if isinstance(error, HttpError) and error.status == 429:
+        limiter().throttled(provider, model, error.retry_after)
+
+
+def _retryable(error):
+    return isinstance(error, httpx.TransportError) or (
+        isinstance(error, HttpError) and error.status in RETRY_STATUSES)
+
+
+class HttpClient:
+    """Thread-safe pooled client; share one per process (see post_json)."""
+
+    def __init__(self, retry=None, max_connections=16, timeout=60.0):
+        self.retry = retry or RetryPolicy()
+        self.client = httpx.Client(http2=HTTP2, limits=_limits(max_connections), timeout=timeout)
+
+    def post_json(self, url, payload, provider="default", timeout=None, model=None, tokens=0):
+        """POST payload; model and tokens (an estimate) select and charge the rate limits the call runs under."""
+        circuit = breaker(provider)
+        for attempt in range(self.retry.attempts):
+            if not circuit.allow():
+                raise CircuitOpenError(f"{provider} circuit open after {circuit.failures} failures")
+            limiter().acquire(provider, model, tokens)
+            try:
+                data = _check(self.client.post(url, json=payload, timeout=timeout or self.client.timeout))
+            except (httpx.TransportError, HttpError) as e:
+                _attempt_failed(e, provider, model, tokens)
+                if not _retryable(e):
+                    # The provider answered; the request itself was rejected
+                    circuit.record_success()
+                    raise
+                circuit.record_failure()
+                if attempt == self.retry.attempts - 1:
+                    raise
+                time.sleep(self.retry.delay(attempt, getattr(e, "retry_after", None)))
+                continue
+            circuit.record_success()
+            limiter().succeeded(provider, model)
+            return data
+
+    def close(self):
+        self.client.close()
+
+
+class AsyncHttpClient:
+    """Pooled client for one event loop; create it inside the loop and aclose() it there."""
+
+    def __init__(self, retry=None, max_connections=16, timeout=60.0):
+        self.retry = retry or RetryPolicy()
+        self.client = httpx.AsyncClient(http2=HTTP2, limits=_limits(max_connections), timeout=timeout)
+
+    async def post_json(self, url, payload, provider="default", timeout=None, model=None, tokens=0):
+        circuit = breaker(provider)
+        for attempt in range(self.retry.attempts):
+            if not circuit.allow():
+                raise CircuitOpenError(f"{provider} circuit open after {circuit.failures} failures")
+            await limiter().aacquire(provider, model, tokens)
+            try:
+                data = _check(await self.client.post(url, json=payload, timeout=timeout or self.client.timeout))
+            except (httpx.TransportError, HttpError) as e:
+                _attempt_failed(e, provider, model, tokens)
+                if not _retryable(e):
+                    # The provider answered; the request itself was rejected
+                    circuit.record_success()
+                    raise
+                circuit.record_failure()
+                if attempt == self.retry.attempts - 1:
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt, getattr(e, "retry_after", None)))
+                continue
+            circuit.record_success()
+            limiter().succeeded(provider, model)
+            return data
+
+    async def stream_lines(self, url, payload, provider="default", timeout=None, model=None, tokens=0):
+        """
+        POST payload and yield the response body line by line as it arrives. Retries
+        and the circuit breaker cover the request up to the response status; once
+        lines have been yielded a broken stream is raised, not replayed.
+        """
+        circuit = breaker(provider)
+        for attempt in range(self.retry.attempts):
+            if not circuit.allow():
+                raise CircuitOpenError(f"{provider} circuit open after {circuit.failures} failures")
+            await limiter().aacquire(provider, model, tokens)
+            streaming = False
+            try:
+                async with self.client.stream("POST", url, json=payload,
+                                              timeout=timeout or self.client.timeout) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                        _check(response)
+                    circuit.record_success()
+                    limiter().succeeded(provider, model)
+                    streaming = True
+                    async for line in response.aiter_lines():
+                        yield line
+                return
+            except (httpx.TransportError, HttpError) as e:
+                if streaming:
+                    circuit.record_failure()
+                    raise
+                _attempt_failed(e, provider, model, tokens)
+                if not _retryable(e):
+                    circuit.record_success()
+                    raise
+                circuit.record_failure()
+                if attempt == self.retry.attempts - 1:
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt, getattr(e, "retry_after", None)))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_client():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = HttpClient()
+        return _shared
+
+
+def post_json(url, payload, provider="default", timeout=None, model=None, tokens=0):
+    """POST payload as JSON through the process-wide pooled client and return the JSON response."""
+    return shared_client().post_json(url, payload, provider=provider, timeout=timeout, model=model, tokens=tokens)
@@ -0,0 +1,179 @@
+"""
+LLM Stream — incremental LLM responses with per-call timing.
+Streaming callers get text as it is generated instead of after the full response:
+StreamMetrics records time-to-first-token and generation speed for each call,
+stall_guard aborts a stream that goes quiet for LLM_STALL_TIMEOUT seconds instead
+of waiting out the 60-90s request timeout, and SectionStreamParser hands back each
+"## SECTION: ... ## END_SECTION" block the moment it is complete.
+"""
+import asyncio
+import os
+import time
+
+try:
+    from _factory.core.rate_limiter import limiter
+    from _factory.core.token_accounting import local_count
+except ImportError:
+    from core.rate_limiter import limiter
+    from core.token_accounting import local_count
+
+STALL_TIMEOUT = float(os.environ.get("LLM_STALL_TIMEOUT", "20"))
+
+SECTION_START = "## SECTION:"
+SECTION_END = "## END_SECTION"
+
+
+class StreamStalled(Exception):
+    pass
+
+
+class StreamMetrics:
+    def __init__(self, provider, model):
+        self.provider = provider
+        self.model = model
+        self.started = time.monotonic()
+        self.first_token_at = None
+        self.finished_at = None
+        self.chunks = 0
+        self.chars = 0
+        self.input_tokens = None
+        self.output_tokens = None
+
+    def token(self, text):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.chunks += 1
+        self.chars += len(text)
+
+    def finish(self, input_tokens=None, output_tokens=None):
+        self.finished_at = time.monotonic()
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+    @property
+    def ttft(self):
+        """Seconds from request to first token, or None if nothing arrived."""
+        return None if self.first_token_at is None else self.first_token_at - self.started
+
+    @property
+    def tokens_per_second(self):
+        """
+        Output tokens over the generation phase (first chunk to last), or over the whole
+        call when everything arrived in one chunk; estimated when the provider sends no count.
+        """
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        tokens = self.output_tokens if self.output_tokens is not None else self.chars // 4
+        since = self.first_token_at if self.chunks > 1 else self.started
+        return tokens / max(self.finished_at - since, 1e-3)
+
+    def as_dict(self):
+        duration = (self.finished_at or time.monotonic()) - self.started
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "ttft_ms": None if self.ttft is None else round(self.ttft * 1000, 1),
+            "duration_ms": round(duration * 1000, 1),
+            "tokens_per_second": None if self.tokens_per_second is None else round(self.tokens_per_second, 1),
+            "chunks": self.chunks,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+    def summary(self):
+        m = self.as_dict()
+        ttft = "-" if m["ttft_ms"] is None else f"{m['ttft_ms']:.0f}ms"
+        tps = "-" if m["tokens_per_second"] is None else f"{m['tokens_per_second']:.1f} tok/s"
+        return f"{self.provider}/{self.model}: first token {ttft}, {tps}, {m['duration_ms']:.0f}ms total"
+
+
+async def stall_guard(chunks, stall_timeout=None, label="LLM"):
+    """Re-yield an async iterator, raising StreamStalled when no item arrives within stall_timeout seconds."""
+    stall_timeout = stall_timeout or STALL_TIMEOUT
+    iterator = chunks.__aiter__()
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(iterator.__anext__(), stall_timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise StreamStalled(f"{label} stream stalled: nothing received for {stall_timeout:.0f}s") from None
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def stream_ollama(client, model, prompt, metrics, format=None, stall_timeout=None):
+    """Yield text chunks from an ollama.AsyncClient chat; token counts come from the final chunk."""
+    tokens = local_count(prompt)
+    await limiter().aacquire("ollama", model, tokens)
+    parts = await client.chat(model=model, messages=[{"role": "user", "content": prompt}],
+                              format=format, stream=True)
+    async for part in stall_guard(parts, stall_timeout, label=f"ollama/{model}"):
+        text = part["message"]["content"]
+        if text:
+            metrics.token(text)
+            yield text
+        if part.get("done"):
+            metrics.finish(part.get("prompt_eval_count"), part.get("eval_count"))
+    if metrics.finished_at is None:
+        metrics.finish()
+    if metrics.output_tokens is not None:
+        limiter().settle("ollama", model, tokens, (metrics.input_tokens or 0, metrics.output_tokens))
+
+
+def _block(text):
+    """{heading, body} for the text between a SECTION marker and its END_SECTION, or None."""
+    block = text.strip()
+    newline_idx = block.find("\n")
+    if newline_idx == -1:
+        return None
+    return {"heading": block[:newline_idx].strip(), "body": block[newline_idx:].strip()}
+
+
+class SectionStreamParser:
+    """
+    Incremental parse_refined_sections: feed() text as it streams in and get back the
+    sections completed by it. A section completes at its END_SECTION marker, or when
+    the next SECTION marker starts; close() returns whatever is left at end of stream.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        sections = []
+        while True:
+            start = self.buffer.find(SECTION_START)
+            if start == -1:
+                # Keep a tail that could be the start of a split marker
+                self.buffer = self.buffer[-len(SECTION_START):]
+                return sections
+            body_start = start + len(SECTION_START)
+            end = self.buffer.find(SECTION_END, body_start)
+            following = self.buffer.find(SECTION_START, body_start)
+            if end != -1 and (following == -1 or end < following):
+                cut, resume = end, end + len(SECTION_END)
+            elif following != -1:
+                cut, resume = following, following
+            else:
+                self.buffer = self.buffer[start:]
+                return sections
+            section = _block(self.buffer[body_start:cut])
+            if section:
+                sections.append(section)
+            self.buffer = self.buffer[resume:]
+
+    def close(self):
+        sections = []
+        start = self.buffer.find(SECTION_START)
+        if start != -1:
+            section = _block(self.buffer[start + len(SECTION_START):])
+            if section:
+                sections.append(section)
+        self.buffer = ""
+        return sections
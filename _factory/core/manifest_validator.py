@@ -28,15 +28,19 @@ class ManifestValidator:
         "planned_sessions": [],
         "tools": [],
         "concurrency": 3,
+        "concurrency_floor": 1,
+        "concurrency_ceiling": 16,
         "token_budget": {
             "total_tokens": 100000,
-            "tokens_per_minute": 1000,
-            "defer_after_tokens": 100000
+            "defer_after_tokens": 100000,
+            "batch_tokens": 0
         },
+        "rate_limits": {},
         "data_schema": {
             "columns": ["id", "date", "category", "value", "notes", "status"],
             "dirty_rate": 0.15,
-            "row_count": 50
+            "row_count": 50,
+            "mode": "rows"
         }
     }
 
@@ -60,17 +64,47 @@ class ManifestValidator:
         else:
             self.warnings.append("'tracks' not specified, using default: navigator, builder, architect.")
 
+        # Pass 2 starts at concurrency and adapts between floor and ceiling
+        bounds = {key: self.raw.get(key, self.DEFAULTS[key])
+                  for key in ("concurrency", "concurrency_floor", "concurrency_ceiling")}
+        for key, val in bounds.items():
+            if not isinstance(val, int) or val < 1:
+                self.errors.append(f"{key} must be a positive integer, got: {val}")
+        if all(isinstance(val, int) for val in bounds.values()) and \
+                bounds["concurrency_floor"] > bounds["concurrency_ceiling"]:
+            self.errors.append(f"concurrency_floor ({bounds['concurrency_floor']}) must be <= "
+                               f"concurrency_ceiling ({bounds['concurrency_ceiling']}).")
+
         # token_budget optional validation
         tb = self.raw.get("token_budget")
         if tb is not None:
-            for key in ("total_tokens", "tokens_per_minute", "defer_after_tokens"):
+            for key in ("total_tokens", "defer_after_tokens"):
                 val = tb.get(key)
                 if val is not None and (not isinstance(val, int) or val <= 0):
                     self.errors.append(f"token_budget.{key} must be a positive integer, got: {val}")
+            if "tokens_per_minute" in tb:
+                self.warnings.append("token_budget.tokens_per_minute is ignored; set provider limits under 'rate_limits' instead.")
             total = tb.get("total_tokens", self.DEFAULTS["token_budget"]["total_tokens"])
             defer = tb.get("defer_after_tokens", self.DEFAULTS["token_budget"]["defer_after_tokens"])
             if isinstance(total, int) and isinstance(defer, int) and defer > total:
                 self.errors.append(f"token_budget.defer_after_tokens ({defer}) must be <= total_tokens ({total}).")
+            batch = tb.get("batch_tokens")
+            if batch is not None and (not isinstance(batch, int) or batch < 0):
+                self.errors.append(f"token_budget.batch_tokens must be a non-negative integer (0 disables batching), got: {batch}")
+
+        # rate_limits optional validation: {"gemini": {"rpm": 1000, "tpm": 1000000}, "gemini/<model>": {...}}
+        rl = self.raw.get("rate_limits")
+        if rl is not None:
+            if not isinstance(rl, dict):
+                self.errors.append("rate_limits must map a provider or provider/model to {rpm, tpm}.")
+            else:
+                for key, spec in rl.items():
+                    if not isinstance(spec, dict) or not spec or set(spec) - {"rpm", "tpm"}:
+                        self.errors.append(f"rate_limits.{key} must set rpm and/or tpm, got: {spec}")
+                        continue
+                    for name, val in spec.items():
+                        if not isinstance(val, int) or val <= 0:
+                            self.errors.append(f"rate_limits.{key}.{name} must be a positive integer, got: {val}")
 
         # data_schema optional validation
         ds = self.raw.get("data_schema")
@@ -81,9 +115,20 @@ class ManifestValidator:
             dr = ds.get("dirty_rate")
             if dr is not None and (not isinstance(dr, (int, float)) or not (0.0 <= dr <= 1.0)):
                 self.errors.append(f"data_schema.dirty_rate must be a float between 0.0 and 1.0, got: {dr}")
+            mode = ds.get("mode", "rows")
+            if mode not in ("rows", "spec"):
+                self.errors.append(f"data_schema.mode must be 'rows' or 'spec', got: {mode}")
+            # spec mode generates rows locally, so only the LLM-per-row mode needs a tight cap
+            max_rows = 100000 if mode == "spec" else 5000
             rc = ds.get("row_count")
-            if rc is not None and (not isinstance(rc, int) or not (10 <= rc <= 500)):
-                self.errors.append(f"data_schema.row_count must be an integer between 10 and 500, got: {rc}")
+            if rc is not None and (not isinstance(rc, int) or not (10 <= rc <= max_rows)):
+                self.errors.append(f"data_schema.row_count must be an integer between 10 and {max_rows}, got: {rc}")
+            seed = ds.get("seed")
+            if seed is not None and not isinstance(seed, int):
+                self.errors.append(f"data_schema.seed must be an integer, got: {seed}")
+            cr = ds.get("chunk_rows")
+            if cr is not None and (not isinstance(cr, int) or not (10 <= cr <= 100)):
+                self.errors.append(f"data_schema.chunk_rows must be an integer between 10 and 100, got: {cr}")
 
         # Plan 08 fields — warn on invalid, don't error (they have safe defaults)
         audience = self.raw.get("audience")
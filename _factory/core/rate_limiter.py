@@ -0,0 +1,256 @@
+"""
+Rate Limiter — one process-wide request and token throttle in front of every LLM call.
+Limits are keyed by provider ("gemini") and by provider/model ("gemini/gemini-2.5-pro"),
+each with a requests-per-minute and a tokens-per-minute token bucket. A call waits
+until every bucket covering it has room for one request and its estimated tokens,
+and is squared up against the provider's real count once it finishes (settle).
+
+The limiter tunes itself: a 429 halves the rates of the buckets the call ran under
+and pauses them for the Retry-After delay; after a quiet minute each success wins
+back 10% until the configured rate is reached again, so a build settles just under
+the quota it actually has. Limits come from DEFAULT_LIMITS, the LLM_RATE_LIMITS
+environment variable (JSON) and the manifest's rate_limits, applied with configure();
+refiner subprocesses are started with child_env(), which hands them the same limits.
+Reapplying unchanged limits keeps what the buckets learned from 429s. Providers without
+limits (local Ollama by default) are not throttled.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+LIMITS_ENV = "LLM_RATE_LIMITS"
+# Gemini paid tier 1 quotas for the flash models; lower them in the manifest for the free tier
+DEFAULT_LIMITS = {"gemini": {"rpm": 1000, "tpm": 1000000}}
+# Share of a minute's rate a full bucket holds; refill runs at the remainder, so no 60s window exceeds the limit
+BURST = 0.1
+BACKOFF = 0.5
+RECOVERY = 1.1
+# Seconds without a 429 before rates start recovering
+RECOVER_AFTER = 60.0
+# Pause applied on a 429 that came without a Retry-After header
+DEFAULT_PAUSE = 1.0
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.limit = float(per_minute)
+        self.rate = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def capacity(self):
+        return max(1.0, self.rate * BURST)
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * (1 - BURST) / 60)
+        self.updated = now
+
+    def wait(self, amount, now):
+        """Seconds until amount can be taken; an amount above capacity only needs a full bucket."""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) * 60 / (self.rate * (1 - BURST))
+
+    def take(self, amount):
+        # May go negative: an oversized call is paid off by the calls after it
+        self.level -= amount
+
+    def slow_down(self):
+        self.rate = max(1.0, self.rate * BACKOFF)
+        self.level = min(self.level, 0.0)
+
+    def recover(self):
+        self.rate = min(self.limit, self.rate * RECOVERY)
+
+
+class Limit:
+    """The request and token buckets of one provider or provider/model key."""
+
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+        self.throttled_at = None
+
+    def wait(self, tokens, now):
+        waits = [self.paused_until - now]
+        if self.requests is not None:
+            waits.append(self.requests.wait(1, now))
+        if self.tokens is not None and tokens:
+            waits.append(self.tokens.wait(tokens, now))
+        return max(waits)
+
+    def take(self, tokens):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+
+class RateLimiter:
+    def __init__(self, limits=None):
+        self._lock = threading.Lock()
+        self.limits = {}
+        self.specs = {}
+        self.calls = 0
+        self.waits = 0
+        self.waited = 0.0
+        self.throttles = 0
+        self.configure(limits or {})
+
+    def configure(self, limits):
+        """
+        Set limits: {key: {"rpm": int, "tpm": int}}, key a provider or "provider/model".
+        A key whose rpm and tpm are unchanged keeps its buckets and their throttled state.
+        """
+        with self._lock:
+            for key, spec in (limits or {}).items():
+                spec = {"rpm": spec.get("rpm"), "tpm": spec.get("tpm")}
+                if self.specs.get(key) == spec and key in self.limits:
+                    continue
+                self.specs[key] = spec
+                self.limits[key] = Limit(spec["rpm"], spec["tpm"])
+
+    def configured(self):
+        """The configured (not the currently throttled) limits, in configure()'s format."""
+        with self._lock:
+            return {key: dict(spec) for key, spec in self.specs.items()}
+
+    def _covering(self, provider, model):
+        keys = (provider, f"{provider}/{model}") if model else (provider,)
+        return [self.limits[key] for key in keys if key in self.limits]
+
+    def _try_take(self, provider, model, tokens):
+        """Take one request and tokens from every covering bucket, or return the seconds to wait first."""
+        with self._lock:
+            limits = self._covering(provider, model)
+            now = time.monotonic()
+            wait = max([limit.wait(tokens, now) for limit in limits], default=0.0)
+            if wait > 0:
+                return wait
+            for limit in limits:
+                limit.take(tokens)
+            self.calls += 1
+            return 0.0
+
+    def acquire(self, provider, model=None, tokens=0):
+        """Block until a call of about tokens tokens fits provider's and model's limits."""
+        waited = 0.0
+        while True:
+            wait = self._try_take(provider, model, tokens)
+            if wait <= 0:
+                break
+            time.sleep(wait)
+            waited += wait
+        self._count_wait(waited)
+
+    async def aacquire(self, provider, model=None, tokens=0):
+        """acquire without blocking the event loop."""
+        waited = 0.0
+        while True:
+            wait = self._try_take(provider, model, tokens)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+            waited += wait
+        self._count_wait(waited)
+
+    def _count_wait(self, waited):
+        if waited:
+            with self._lock:
+                self.waits += 1
+                self.waited += waited
+
+    def settle(self, provider, model, reserved, usage):
+        """
+        Correct the tokens taken at acquire: usage is the call's (input, output) counts
+        from the provider, or None to keep the estimate. A call the provider refused
+        settles with (0, 0).
+        """
+        if usage is None:
+            return
+        difference = sum(usage) - reserved
+        with self._lock:
+            for limit in self._covering(provider, model):
+                if limit.tokens is not None:
+                    limit.tokens.take(difference)
+
+    def throttled(self, provider, model=None, retry_after=None):
+        """The provider answered 429: slow down every bucket the call ran under and pause them."""
+        with self._lock:
+            self.throttles += 1
+            limits = self._covering(provider, model)
+            if not limits:
+                # Unlimited provider: at least honour the pause
+                limits = [self.limits.setdefault(provider, Limit())]
+            now = time.monotonic()
+            for limit in limits:
+                limit.paused_until = max(limit.paused_until, now + (DEFAULT_PAUSE if retry_after is None else retry_after))
+                limit.throttled_at = now
+                for bucket in limit.buckets():
+                    bucket.slow_down()
+
+    def succeeded(self, provider, model=None):
+        with self._lock:
+            now = time.monotonic()
+            for limit in self._covering(provider, model):
+                if limit.throttled_at is not None and now - limit.throttled_at >= RECOVER_AFTER:
+                    for bucket in limit.buckets():
+                        bucket.recover()
+                    if all(bucket.rate >= bucket.limit for bucket in limit.buckets()):
+                        limit.throttled_at = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "waits": self.waits,
+                "waited_s": round(self.waited, 2),
+                "throttled": self.throttles,
+                "rates": {key: {"rpm": None if limit.requests is None else round(limit.requests.rate),
+                                "tpm": None if limit.tokens is None else round(limit.tokens.rate)}
+                          for key, limit in self.limits.items() if limit.buckets()},
+            }
+
+
+def _initial_limits():
+    limits = dict(DEFAULT_LIMITS)
+    try:
+        limits.update(json.loads(os.environ.get(LIMITS_ENV) or "{}"))
+    except ValueError:
+        print(f"[RATE LIMIT] Ignoring invalid {LIMITS_ENV}")
+    return limits
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def limiter():
+    """Process-wide limiter shared by every LLM call site."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(_initial_limits())
+        return _limiter
+
+
+def configure(limits):
+    """Apply limits (a manifest's rate_limits) to the process limiter."""
+    if limits:
+        limiter().configure(limits)
+
+
+def child_env(env=None):
+    """A copy of env (default os.environ) that passes the process limiter's limits on to a child process."""
+    env = dict(os.environ if env is None else env)
+    env[LIMITS_ENV] = json.dumps(limiter().configured())
+    return env
@@ -1,14 +1,97 @@
-import sqlite3
+"""
+Refinement Queue — SQLite-backed Pass 2 jobs, claimed under leases.
+A worker claims a job atomically and holds it under a lease it renews with
+heartbeat() while the refinement runs; results are written the moment each job
+finishes. If the process dies, its jobs stay in_progress only until their lease
+runs out (or, on this host, until its pid is seen to be gone): opening the queue
+reclaims them as pending, so an interrupted Pass 2 resumes with the files it had
+not finished and never repeats the ones it had.
+
+The database runs in WAL mode so the Pass 1 producer and Pass 2 workers do not
+block each other. Pass 1 enqueues in bulk (enqueue_many, one transaction),
+workers claim several jobs in one UPDATE ... RETURNING (claim_batch), and
+triggers keep per-industry, per-status counts in job_counts so stats() never
+scans the jobs. A queue opened with industries only claims, counts and clears
+those industries' jobs, so concurrent builds sharing the database never refine
+(or charge their budgets for) each other's files.
+"""
 import os
+import socket
+import sqlite3
+import time
+import uuid
 from datetime import datetime
 
+# Seconds a claim stays valid without a heartbeat
+LEASE_SECONDS = 120
+HOSTNAME = socket.gethostname()
+BUSY_TIMEOUT_MS = 30000
+STATUSES = ("pending", "in_progress", "done", "failed")
+# UPDATE ... RETURNING needs SQLite 3.35; older builds claim inside an immediate transaction
+RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS job_counts (
+        industry_slug TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (industry_slug, status)
+    );
+    CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+    CREATE INDEX IF NOT EXISTS jobs_industry ON jobs (industry_slug, status, id);
+    CREATE INDEX IF NOT EXISTS jobs_file ON jobs (industry_slug, file_path);
+    CREATE TRIGGER IF NOT EXISTS jobs_count_insert AFTER INSERT ON jobs BEGIN
+        INSERT OR IGNORE INTO job_counts VALUES (NEW.industry_slug, NEW.status, 0);
+        UPDATE job_counts SET count = count + 1 WHERE industry_slug = NEW.industry_slug AND status = NEW.status;
+    END;
+    CREATE TRIGGER IF NOT EXISTS jobs_count_update AFTER UPDATE OF status ON jobs
+    WHEN OLD.status IS NOT NEW.status BEGIN
+        INSERT OR IGNORE INTO job_counts VALUES (NEW.industry_slug, NEW.status, 0);
+        UPDATE job_counts SET count = count - 1 WHERE industry_slug = OLD.industry_slug AND status = OLD.status;
+        UPDATE job_counts SET count = count + 1 WHERE industry_slug = NEW.industry_slug AND status = NEW.status;
+    END;
+    CREATE TRIGGER IF NOT EXISTS jobs_count_delete AFTER DELETE ON jobs BEGIN
+        UPDATE job_counts SET count = count - 1 WHERE industry_slug = OLD.industry_slug AND status = OLD.status;
+    END;
+"""
+SCHEMA_OBJECTS = ("job_counts", "jobs_status", "jobs_industry", "jobs_file", "jobs_count_insert",
+                  "jobs_count_update", "jobs_count_delete")
+# job_counts was first keyed by status alone; such a table and its triggers are replaced
+DROP_STATUS_COUNTS = """
+    DROP TRIGGER IF EXISTS jobs_count_insert;
+    DROP TRIGGER IF EXISTS jobs_count_update;
+    DROP TRIGGER IF EXISTS jobs_count_delete;
+    DROP TABLE IF EXISTS job_counts;
+"""
+
+
+def _owner_alive(owner):
+    """False when owner ("host:pid:token") was a process on this host that no longer exists."""
+    host, _, rest = owner.partition(":")
+    pid = rest.partition(":")[0]
+    if host != HOSTNAME or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
 
 class RefinementQueue:
-    def __init__(self, db_path="_factory/queue.db"):
+    def __init__(self, db_path="_factory/queue.db", industries=None):
         self.db_path = db_path
+        self.industries = tuple(industries) if industries else None
+        self.owner = f"{HOSTNAME}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self.conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
         self.conn.execute("""
             CREATE TABLE IF NOT EXISTS jobs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -18,69 +101,224 @@ class RefinementQueue:
                 status TEXT DEFAULT 'pending',
                 created_at TEXT,
                 completed_at TEXT,
-                error TEXT
+                error TEXT,
+                lease_owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER DEFAULT 0
             )
         """)
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        for column, ddl in (("lease_owner", "TEXT"), ("lease_expires", "REAL"), ("attempts", "INTEGER DEFAULT 0")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {ddl}")
         self.conn.commit()
+        self._create_schema()
+        self.reclaimed = self.reclaim_expired()
 
-    def enqueue(self, industry_slug, file_path, industry_name):
-        existing = self.conn.execute(
-            "SELECT id FROM jobs WHERE industry_slug=? AND file_path=? AND status IN ('pending','in_progress')",
-            (industry_slug, file_path)
-        ).fetchone()
-        if existing:
+    def _create_schema(self):
+        """
+        Indexes and the trigger-maintained job_counts. Once they exist, opening the
+        queue only reads; job_counts is filled from jobs just once, when it is created.
+        """
+        present = self.conn.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({','.join('?' * len(SCHEMA_OBJECTS))})",
+            SCHEMA_OBJECTS
+        ).fetchone()[0]
+        count_columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(job_counts)")}
+        if present == len(SCHEMA_OBJECTS) and "industry_slug" in count_columns:
             return
-        self.conn.execute(
-            "INSERT INTO jobs (industry_slug, file_path, industry_name, status, created_at) VALUES (?,?,?,'pending',?)",
-            (industry_slug, file_path, industry_name, datetime.now().isoformat())
-        )
-        self.conn.commit()
+        migrate = DROP_STATUS_COUNTS if count_columns and "industry_slug" not in count_columns else ""
+        self.conn.executescript(
+            "BEGIN IMMEDIATE;" + migrate + SCHEMA + """
+            INSERT INTO job_counts (industry_slug, status, count)
+                SELECT industry_slug, status, COUNT(*) FROM jobs WHERE NOT EXISTS (SELECT 1 FROM job_counts)
+                GROUP BY industry_slug, status;
+            COMMIT;
+        """)
+
+    def _scope(self, keyword="AND"):
+        """SQL condition (and its parameters) limiting a statement to this queue's industries."""
+        if not self.industries:
+            return "", ()
+        return f" {keyword} industry_slug IN ({','.join('?' * len(self.industries))})", self.industries
+
+    def enqueue(self, industry_slug, file_path, industry_name):
+        """Add a pending job and return its id; an already pending or running job for the file is reused."""
+        return self.enqueue_many([(industry_slug, file_path, industry_name)])[0]
+
+    def enqueue_many(self, jobs):
+        """
+        Add (industry_slug, file_path, industry_name) jobs in one transaction and return
+        their ids in order; as with enqueue, a file already pending or running is reused.
+        """
+        created_at = datetime.now().isoformat()
+        ids, seen = [], {}
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for industry_slug, file_path, industry_name in jobs:
+                key = (industry_slug, file_path)
+                if key not in seen:
+                    existing = self.conn.execute(
+                        "SELECT id FROM jobs WHERE industry_slug=? AND file_path=? AND status IN ('pending','in_progress')",
+                        key
+                    ).fetchone()
+                    seen[key] = existing["id"] if existing else self.conn.execute(
+                        "INSERT INTO jobs (industry_slug, file_path, industry_name, status, created_at) "
+                        "VALUES (?,?,?,'pending',?)",
+                        (industry_slug, file_path, industry_name, created_at)
+                    ).lastrowid
+                ids.append(seen[key])
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return ids
 
     def next_job(self):
+        scope, scope_params = self._scope()
         row = self.conn.execute(
-            "SELECT * FROM jobs WHERE status='pending' ORDER BY id ASC LIMIT 1"
+            f"SELECT * FROM jobs WHERE status='pending'{scope} ORDER BY id ASC LIMIT 1", scope_params
         ).fetchone()
         return dict(row) if row else None
 
-    def mark_in_progress(self, job_id):
-        self.conn.execute("UPDATE jobs SET status='in_progress' WHERE id=?", (job_id,))
+    def claim_next(self, lease=LEASE_SECONDS):
+        """Atomically claim the oldest pending job under a lease and return it, or None when none is pending."""
+        jobs = self.claim_batch(1, lease)
+        return jobs[0] if jobs else None
+
+    def claim_batch(self, count, lease=LEASE_SECONDS):
+        """
+        Atomically claim up to count of the oldest pending jobs (of this queue's
+        industries, when set) under one lease; returns them oldest first.
+        """
+        if count < 1:
+            return []
+        scope, scope_params = self._scope()
+        pending = f"SELECT id FROM jobs WHERE status='pending'{scope} ORDER BY id ASC LIMIT ?"
+        params = (self.owner, time.time() + lease)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if RETURNING:
+                rows = self.conn.execute(
+                    "UPDATE jobs SET status='in_progress', lease_owner=?, lease_expires=?, attempts=attempts+1 "
+                    f"WHERE id IN ({pending}) RETURNING *",
+                    params + scope_params + (count,)
+                ).fetchall()
+            else:
+                ids = [row["id"] for row in self.conn.execute(pending, scope_params + (count,))]
+                self.conn.execute(
+                    "UPDATE jobs SET status='in_progress', lease_owner=?, lease_expires=?, attempts=attempts+1 "
+                    f"WHERE id IN ({','.join('?' * len(ids))})",
+                    params + tuple(ids)
+                )
+                rows = self.conn.execute(
+                    f"SELECT * FROM jobs WHERE id IN ({','.join('?' * len(ids))})", ids
+                ).fetchall()
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return sorted((dict(row) for row in rows), key=lambda job: job["id"])
+
+    def claim(self, job_id, lease=LEASE_SECONDS):
+        """Move a pending job to in_progress and return it, or None if another worker already has it."""
+        cursor = self._lease(job_id, lease)
         self.conn.commit()
+        if cursor.rowcount != 1:
+            return None
+        return self._get(job_id)
 
-    def mark_done(self, job_id):
-        self.conn.execute(
-            "UPDATE jobs SET status='done', completed_at=? WHERE id=?",
-            (datetime.now().isoformat(), job_id)
+    def _lease(self, job_id, lease):
+        return self.conn.execute(
+            "UPDATE jobs SET status='in_progress', lease_owner=?, lease_expires=?, attempts=attempts+1 "
+            "WHERE id=? AND status='pending'",
+            (self.owner, time.time() + lease, job_id)
+        )
+
+    def _get(self, job_id):
+        return dict(self.conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone())
+
+    def heartbeat(self, lease=LEASE_SECONDS):
+        """Extend the lease of every job this queue instance holds; returns how many were renewed."""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET lease_expires=? WHERE lease_owner=? AND status='in_progress'",
+            (time.time() + lease, self.owner)
         )
         self.conn.commit()
+        return cursor.rowcount
 
-    def mark_failed(self, job_id, error_message):
+    def reclaim_expired(self):
+        """
+        Return to pending every in_progress job whose lease has expired, whose owner
+        died on this host, or that predates leases. Returns the number reclaimed.
+        """
+        owners = [row["lease_owner"] for row in self.conn.execute(
+            "SELECT DISTINCT lease_owner FROM jobs WHERE status='in_progress' AND lease_owner IS NOT NULL"
+        )]
+        dead = [owner for owner in owners if owner != self.owner and not _owner_alive(owner)]
+        where = f"""status='in_progress'
+                  AND (lease_expires IS NULL OR lease_expires < ?
+                       OR lease_owner IN ({','.join('?' * len(dead))}))"""
+        params = [time.time()] + dead
+        # Check before writing, so opening a queue with nothing to reclaim never takes the write lock
+        if self.conn.execute(f"SELECT 1 FROM jobs WHERE {where} LIMIT 1", params).fetchone() is None:
+            return 0
+        cursor = self.conn.execute(
+            f"UPDATE jobs SET status='pending', lease_owner=NULL, lease_expires=NULL WHERE {where}", params
+        )
+        self.conn.commit()
+        return cursor.rowcount
+
+    def mark_in_progress(self, job_id):
         self.conn.execute(
-            "UPDATE jobs SET status='failed', error=? WHERE id=?",
-            (error_message, job_id)
+            "UPDATE jobs SET status='in_progress', lease_owner=?, lease_expires=? WHERE id=?",
+            (self.owner, time.time() + LEASE_SECONDS, job_id)
         )
         self.conn.commit()
 
+    def mark_done(self, job_id):
+        """Record a job this instance holds as done; False (and nothing written) if its lease was lost."""
+        return self._release(job_id, "status='done', completed_at=?", (datetime.now().isoformat(),))
+
+    def mark_failed(self, job_id, error_message):
+        """Record a held job as failed with error_message; False if its lease was lost."""
+        return self._release(job_id, "status='failed', error=?", (error_message,))
+
     def reset_to_pending(self, job_id):
-        self.conn.execute(
-            "UPDATE jobs SET status='pending', error=NULL WHERE id=?", (job_id,)
+        """Return a held job to pending; False if its lease was lost."""
+        return self._release(job_id, "status='pending', error=NULL", ())
+
+    def _release(self, job_id, assignments, params):
+        # A worker whose lease expired and was reclaimed must not overwrite the new holder's result
+        cursor = self.conn.execute(
+            f"UPDATE jobs SET {assignments}, lease_owner=NULL, lease_expires=NULL WHERE id=? AND lease_owner=?",
+            params + (job_id, self.owner)
         )
         self.conn.commit()
+        return cursor.rowcount == 1
+
+    def open_jobs(self):
+        """Pending and in-progress jobs (id, industry_slug, file_path), oldest first."""
+        scope, scope_params = self._scope()
+        return [dict(row) for row in self.conn.execute(
+            f"SELECT id, industry_slug, file_path FROM jobs WHERE status IN ('pending','in_progress'){scope} "
+            "ORDER BY id", scope_params
+        )]
 
     def pending_count(self):
-        return self.conn.execute(
-            "SELECT COUNT(*) FROM jobs WHERE status='pending'"
-        ).fetchone()[0]
+        return self.stats()["pending"]
 
     def stats(self):
-        rows = self.conn.execute(
-            "SELECT status, COUNT(*) as cnt FROM jobs GROUP BY status"
-        ).fetchall()
-        result = {"pending": 0, "done": 0, "failed": 0, "in_progress": 0, "total": 0}
-        for row in rows:
-            result[row["status"]] = row["cnt"]
-            result["total"] += row["cnt"]
+        """Job counts per status, read from the trigger-maintained job_counts rather than the jobs table."""
+        scope, scope_params = self._scope("WHERE")
+        result = dict.fromkeys(STATUSES, 0)
+        for row in self.conn.execute(f"SELECT status, SUM(count) AS count FROM job_counts{scope} GROUP BY status",
+                                     scope_params):
+            result[row["status"]] = row["count"]
+        result["total"] = sum(result.values())
         return result
 
     def clear_done(self):
-        self.conn.execute("DELETE FROM jobs WHERE status='done'")
+        scope, scope_params = self._scope()
+        self.conn.execute(f"DELETE FROM jobs WHERE status='done'{scope}", scope_params)
         self.conn.commit()
@@ -0,0 +1,86 @@
+"""
+Render Pool — executes Pass 1 render/write tasks inline or across a process pool.
+Cache checks happen in the parent before dispatch, so hits never reach a worker.
+Each task only touches its own output file; cache updates and refinement enqueues
+are returned to the parent so results are applied in a stable order. Outputs go
+through the content-addressed BlobStore and are linked into the build directory.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from _factory.core.template_cache import make_environment, bytecode_stats
+    from _factory.core.blob_store import BlobStore
+except ImportError:
+    from core.template_cache import make_environment, bytecode_stats
+    from core.blob_store import BlobStore
+
+_worker = {}
+
+
+def _init_worker(template_dir, contexts, blob_root):
+    _worker["env"] = make_environment(template_dir)
+    _worker["contexts"] = contexts
+    _worker["blobs"] = BlobStore(blob_root)
+
+
+def _run_in_worker(task):
+    return run_task(task, _worker["env"], _worker["contexts"][task["slug"]], _worker["blobs"])
+
+
+def run_task(task, env, context, blobs):
+    """
+    Render or copy a single template into the build directory.
+    Tasks flagged "render" go through Jinja; everything else is copied verbatim.
+    Tasks with "link" False get a private copy of their blob instead of a link.
+
+    Returns:
+        dict: the task plus "status" (hit | rendered | copied | error),
+        "changed" (whether dest was rewritten), "error" (message or None)
+        and "bytecode" (bytecode cache counters for this task, or None).
+    """
+    result = dict(task, status="hit", changed=False, error=None, bytecode=None)
+    if task.get("hit"):
+        return result
+
+    link = task.get("link", True)
+    if task["render"]:
+        before = bytecode_stats(env)
+        try:
+            rendered = env.get_template(task["rel_path"]).render(context)
+            result.update(status="rendered", changed=blobs.write_bytes(rendered.encode("utf-8"), task["dest"], link))
+        except Exception as e:
+            result.update(status="error", error=str(e), changed=blobs.write_file(task["src"], task["dest"], link))
+        if before is not None:
+            result["bytecode"] = env.bytecode_cache.delta(before)
+    else:
+        result.update(status="copied", changed=blobs.write_file(task["src"], task["dest"], link))
+    return result
+
+
+def iter_tasks(tasks, env, contexts, template_dir, jobs=1, blobs=None):
+    """
+    Execute tasks and yield each result, in task order, as soon as it is ready.
+
+    contexts maps each task's "slug" to its render context, so one call can
+    render the same templates for several builds. jobs <= 1 renders inline
+    with the caller's Environment; otherwise each pool worker builds its own
+    Environment and BlobStore over the same directories.
+    """
+    blobs = blobs or BlobStore()
+    pending = [task for task in tasks if not task.get("hit")]
+    if jobs <= 1 or len(pending) <= 1:
+        for task in tasks:
+            yield run_task(task, env, contexts[task["slug"]], blobs)
+        return
+
+    chunksize = max(1, len(pending) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(template_dir, contexts, blobs.root)) as pool:
+        done = pool.map(_run_in_worker, pending, chunksize=chunksize)
+        for task in tasks:
+            yield run_task(task, env, None, blobs) if task.get("hit") else next(done)
+
+
+def run_tasks(tasks, env, contexts, template_dir, jobs=1, blobs=None):
+    """Execute tasks and return every result in task order (see iter_tasks)."""
+    return list(iter_tasks(tasks, env, contexts, template_dir, jobs=jobs, blobs=blobs))
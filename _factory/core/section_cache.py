@@ -0,0 +1,73 @@
+"""
+Section Cache — refined markdown sections keyed by what produced them.
+A key is the SHA256 of the section heading and body plus the industry, tone, model
+and refiner prompt version, so an unchanged section is never sent to the LLM twice
+while any change to its text or to how it would be refined is a miss. Entries live
+in a shared SQLite database (WAL mode) so the in-process worker and refiner
+subprocesses can read and write it concurrently.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+DB_NAME = "section_cache.db"
+BUSY_TIMEOUT_MS = 30000
+
+
+def section_key(heading, body, industry, tone, model, prompt_version):
+    payload = json.dumps([heading.strip(), body.strip(), industry, tone, model, prompt_version])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SectionCache:
+    def __init__(self, cache_dir=None):
+        # SECTION_CACHE_DIR points refiners at a separate cache (benchmarks, experiments)
+        cache_dir = cache_dir or os.environ.get("SECTION_CACHE_DIR", "_factory/cache")
+        self.db_path = os.path.join(cache_dir, DB_NAME)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        self.conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sections (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0}
+
+    key = staticmethod(section_key)
+
+    def get(self, key):
+        """The refined body stored under key, or None."""
+        with self._lock:
+            row = self.conn.execute("SELECT body FROM sections WHERE key=?", (key,)).fetchone()
+            self.stats["hits" if row else "misses"] += 1
+        return row[0] if row else None
+
+    def put(self, key, body):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sections (key, body, created_at) VALUES (?,?,?)",
+                (key, body, datetime.now().isoformat())
+            )
+            self.conn.commit()
+            self.stats["stores"] += 1
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM sections")
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
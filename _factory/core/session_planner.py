@@ -15,6 +15,17 @@ def plan_sessions(persona_dict, tools_list, llm_caller):
     Returns:
         Dict with total_sessions, justification, and sessions list.
     """
+    prompt, session_floor, allow_extra = _prompt(persona_dict, tools_list)
+    return _constrain(llm_caller(prompt), session_floor, allow_extra)
+
+
+async def aplan_sessions(persona_dict, tools_list, llm_caller):
+    """plan_sessions with an async llm_caller."""
+    prompt, session_floor, allow_extra = _prompt(persona_dict, tools_list)
+    return _constrain(await llm_caller(prompt), session_floor, allow_extra)
+
+
+def _prompt(persona_dict, tools_list):
     maturity = persona_dict.get("marketMaturityScore", 30)
     priorities = persona_dict.get("topPriorities", [])
     decision_style = persona_dict.get("decisionStyle", "Balanced")
@@ -73,8 +84,10 @@ Return ONLY a JSON object:
   ]
 }}
 """
-    result = llm_caller(prompt)
+    return prompt, session_floor, allow_extra
+
 
+def _constrain(result, session_floor, allow_extra):
     if not isinstance(result, dict) or "sessions" not in result:
         return _fallback_plan(session_floor)
 
@@ -0,0 +1,169 @@
+"""
+Stage Graph — declarative build stages scheduled by their inputs and outputs.
+Each stage names the artifacts it consumes and produces; a stage starts as soon as
+every stage producing one of its inputs has finished, so independent stages run
+concurrently on a thread pool. A running stage can emit() one of its outputs early, so
+consumers of that output start before the rest of the stage is done. After a run, report() gives per-stage timings and
+marks the critical path: the chain of stages that determined total wall time.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class StageError(Exception):
+    pass
+
+
+class Stage:
+    def __init__(self, name, run, inputs=(), outputs=()):
+        self.name = name
+        self.run = run
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.deps = set()
+        self.started = None
+        self.finished = None
+        self.status = "pending"
+
+
+class StageGraph:
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.stages = {}
+        self._origin = None
+        self._ready = set()
+        self._lock = threading.Lock()
+        self._wake = Future()
+
+    def add(self, name, run, inputs=(), outputs=()):
+        if name in self.stages:
+            raise StageError(f"Duplicate stage: {name}")
+        self.stages[name] = Stage(name, run, inputs, outputs)
+        return self
+
+    def _resolve(self):
+        producers = {}
+        for stage in self.stages.values():
+            for output in stage.outputs:
+                if output in producers:
+                    raise StageError(f"'{output}' is produced by both {producers[output]} and {stage.name}")
+                producers[output] = stage.name
+        for stage in self.stages.values():
+            missing = [i for i in stage.inputs if i not in producers]
+            if missing:
+                raise StageError(f"Stage {stage.name} needs {missing}, which no stage produces")
+            stage.deps = {producers[i] for i in stage.inputs}
+
+        # Kahn's algorithm — every stage must be reachable in topological order
+        remaining = {name: set(stage.deps) for name, stage in self.stages.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise StageError(f"Cycle between stages: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def emit(self, output):
+        """Mark one of a running stage's outputs ready before the stage finishes."""
+        with self._lock:
+            self._ready.add(output)
+            if not self._wake.done():
+                self._wake.set_result(None)
+
+    def run(self):
+        """
+        Run every stage, each as soon as all of its inputs are ready: emitted, or
+        produced by a stage that has finished.
+
+        If a stage raises, no further stages are started; stages already running
+        are allowed to finish and the first error is re-raised.
+        """
+        self._resolve()
+        self._origin = time.perf_counter()
+        running, error = {}, None
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage") as pool:
+            while True:
+                with self._lock:
+                    ready = set(self._ready)
+                    self._wake = Future()
+                if error is None:
+                    for stage in self.stages.values():
+                        if stage.status == "pending" and set(stage.inputs) <= ready:
+                            stage.status = "running"
+                            running[pool.submit(self._execute, stage)] = stage
+                if not running:
+                    break
+                finished, _ = wait(list(running) + [self._wake], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future, None)
+                    if stage is None:
+                        continue
+                    try:
+                        future.result()
+                        stage.status = "done"
+                        with self._lock:
+                            self._ready.update(stage.outputs)
+                    except Exception as e:
+                        stage.status = "failed"
+                        error = error or e
+        if error is not None:
+            raise error
+        return self.report()
+
+    def _execute(self, stage):
+        stage.started = time.perf_counter()
+        try:
+            stage.run()
+        finally:
+            stage.finished = time.perf_counter()
+
+    def critical_path(self):
+        """Stage names from the first stage to the last one to finish, following the dependency that finished last."""
+        finished = [s for s in self.stages.values() if s.finished is not None]
+        if not finished:
+            return []
+        stage = max(finished, key=lambda s: s.finished)
+        path = [stage.name]
+        while stage.deps:
+            stage = max((self.stages[d] for d in stage.deps), key=lambda s: s.finished or 0)
+            path.append(stage.name)
+        return path[::-1]
+
+    def report(self):
+        """
+        Returns:
+            dict: "stages" (name, status, start_s, duration_s, critical) in start
+            order, "wall_s", "busy_s" (sum of stage durations) and "critical_path".
+        """
+        critical = self.critical_path()
+        rows = []
+        for stage in sorted(self.stages.values(), key=lambda s: (s.started is None, s.started or 0)):
+            ran = stage.started is not None and stage.finished is not None
+            rows.append({
+                "name": stage.name,
+                "status": stage.status,
+                "start_s": round(stage.started - self._origin, 3) if ran else None,
+                "duration_s": round(stage.finished - stage.started, 3) if ran else None,
+                "critical": stage.name in critical,
+            })
+        ends = [s.finished for s in self.stages.values() if s.finished is not None]
+        return {
+            "stages": rows,
+            "wall_s": round(max(ends) - self._origin, 3) if ends else 0.0,
+            "busy_s": round(sum(r["duration_s"] or 0 for r in rows), 3),
+            "critical_path": critical,
+        }
+
+    @staticmethod
+    def format_report(report):
+        lines = [f"{'Stage':<16} {'Start':>8} {'Duration':>9}  Critical"]
+        for row in report["stages"]:
+            start = f"{row['start_s']:.2f}s" if row["start_s"] is not None else "-"
+            duration = f"{row['duration_s']:.2f}s" if row["duration_s"] is not None else row["status"]
+            lines.append(f"{row['name']:<16} {start:>8} {duration:>9}  {'*' if row['critical'] else ''}")
+        lines.append(f"Wall {report['wall_s']:.2f}s | stage time {report['busy_s']:.2f}s | "
+                     f"critical path: {' -> '.join(report['critical_path'])}")
+        return "\n".join(lines)
@@ -0,0 +1,100 @@
+"""
+Template Cache — persistent Jinja bytecode cache plus memoized path templates.
+Compiled template code is stored under _factory/cache/jinja/ keyed by template name
+and source hash, so warm builds load code instead of re-parsing and compiling.
+"""
+import os
+import time
+from functools import lru_cache
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from jinja2.bccache import Bucket
+
+BYTECODE_DIR = os.path.join("_factory", "cache", "jinja")
+
+
+class TimedBytecodeCache(FileSystemBytecodeCache):
+    """
+    FileSystemBytecodeCache keyed by content hash that also measures compile time.
+
+    Each miss records how long Jinja took to compile the template in a sidecar
+    file; later hits credit that time as saved.
+    """
+
+    def __init__(self, directory=BYTECODE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(directory)
+        self.stats = {"hits": 0, "misses": 0, "compile_ms": 0.0, "saved_ms": 0.0}
+        self._pending = {}
+
+    def get_bucket(self, environment, name, filename, source):
+        checksum = self.get_source_checksum(source)
+        key = self.get_cache_key(f"{name}:{checksum}", filename)
+        bucket = Bucket(environment, key, checksum)
+        self.load_bytecode(bucket)
+        if bucket.code is None:
+            self.stats["misses"] += 1
+            self._pending[key] = time.perf_counter()
+        else:
+            self.stats["hits"] += 1
+            self.stats["saved_ms"] += self._read_compile_ms(bucket)
+        return bucket
+
+    def set_bucket(self, bucket):
+        started = self._pending.pop(bucket.key, None)
+        super().set_bucket(bucket)
+        if started is not None:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats["compile_ms"] += elapsed_ms
+            try:
+                with open(self._timing_filename(bucket), "w") as f:
+                    f.write(f"{elapsed_ms:.3f}")
+            except OSError:
+                pass
+
+    def _timing_filename(self, bucket):
+        return self._get_cache_filename(bucket) + ".ms"
+
+    def _read_compile_ms(self, bucket):
+        try:
+            with open(self._timing_filename(bucket)) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return 0.0
+
+    def snapshot(self):
+        return dict(self.stats)
+
+    def delta(self, before):
+        return {k: self.stats[k] - before[k] for k in self.stats}
+
+
+def make_environment(template_dir, bytecode_dir=BYTECODE_DIR):
+    """
+    Jinja Environment over template_dir backed by the persistent bytecode cache.
+    keep_trailing_newline makes a rendered file end exactly like its template, as
+    files without Jinja syntax copied verbatim do.
+    """
+    return Environment(
+        loader=FileSystemLoader(template_dir),
+        bytecode_cache=TimedBytecodeCache(bytecode_dir),
+        keep_trailing_newline=True,
+    )
+
+
+@lru_cache(maxsize=None)
+def compile_string(env, source):
+    """Compile an inline template once per Environment."""
+    return env.from_string(source)
+
+
+def render_path(env, rel_path, context):
+    """Render a template-relative path; paths without Jinja syntax skip compilation."""
+    if "{" not in rel_path:
+        return rel_path
+    return compile_string(env, rel_path).render(context)
+
+
+def bytecode_stats(env):
+    """Current bytecode cache counters for env, or None if it has no timed cache."""
+    bcc = env.bytecode_cache
+    return bcc.snapshot() if isinstance(bcc, TimedBytecodeCache) else None
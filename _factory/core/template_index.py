@@ -0,0 +1,192 @@
+"""
+Template Index — persisted description of the template tree for Pass 1.
+Replaces the per-build os.walk: each entry records the session, file kind, content hash,
+whether the file contains Jinja syntax and which context variables and templates it uses.
+The index is rebuilt only when a directory mtime changes; entries whose own stat changed
+are refreshed in place.
+Output-path templates are not stored compiled: Jinja template objects do not survive a
+JSON round trip, so entries record path_has_jinja and template_cache.render_path compiles
+each templated path once per Environment.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from jinja2 import Environment, meta
+
+INDEX_PATH = os.path.join("_factory", "cache", "template_index.json")
+INDEX_VERSION = 2
+
+RENDERABLE_EXTENSIONS = ('.md', '.py', '.txt', '.json', '.yaml', '.sh')
+SKIP_DIRS = ('.venv', '__pycache__', 'node_modules', 'libs')
+JINJA_MARKERS = re.compile(r"\{\{|\{%|\{#")
+
+
+def session_of(rel_path):
+    """Session number from a top-level 'NN_' directory, or None for shared files."""
+    top = rel_path.split(os.sep)[0]
+    if rel_path != top and len(top) >= 2 and top[:2].isdigit():
+        return int(top[:2])
+    return None
+
+
+class TemplateIndex:
+    def __init__(self, template_dir, index_path=INDEX_PATH):
+        self.template_dir = template_dir
+        self.index_path = index_path
+        self.dirs = {}
+        self.entries = []
+        self.skipped_dirs = []
+        self.rebuilt = False
+        self._parser = Environment()
+        self._by_path = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = None
+        if (data and data.get("version") == INDEX_VERSION
+                and data.get("template_dir") == self.template_dir
+                and self._dirs_unchanged(data.get("dirs", {}))):
+            self.dirs = data["dirs"]
+            self.entries = data["entries"]
+        else:
+            self.rebuild()
+
+    def _dirs_unchanged(self, dirs):
+        if not dirs:
+            return False
+        for rel_dir, mtime_ns in dirs.items():
+            try:
+                if os.stat(os.path.join(self.template_dir, rel_dir)).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def rebuild(self):
+        self._by_path = None
+        self.dirs = {}
+        self.entries = []
+        self.skipped_dirs = []
+        for root, dirs, files in os.walk(self.template_dir):
+            rel_root = os.path.relpath(root, self.template_dir)
+            self.dirs[rel_root] = os.stat(root).st_mtime_ns
+            kept = sorted(d for d in dirs if not d.startswith('.') and d not in SKIP_DIRS)
+            self.skipped_dirs.extend(d for d in dirs if d not in kept)
+            dirs[:] = kept
+            for file in sorted(files):
+                if file.startswith('.'):
+                    continue
+                rel_path = os.path.relpath(os.path.join(root, file), self.template_dir)
+                self.entries.append(self._describe(rel_path))
+        self.rebuilt = True
+        self.save()
+
+    def _describe(self, rel_path):
+        full_path = os.path.join(self.template_dir, rel_path)
+        st = os.stat(full_path)
+        with open(full_path, "rb") as f:
+            data = f.read()
+        kind = "text" if rel_path.endswith(RENDERABLE_EXTENSIONS) else "binary"
+        source = data.decode("utf-8", errors="ignore") if kind == "text" else ""
+        has_jinja = bool(JINJA_MARKERS.search(source))
+        variables, references = self._analyze(source) if has_jinja else ([], [])
+        return {
+            "path": rel_path,
+            "session": session_of(rel_path),
+            "kind": kind,
+            "hash": hashlib.sha256(data).hexdigest(),
+            "has_jinja": has_jinja,
+            "path_has_jinja": bool(JINJA_MARKERS.search(rel_path)),
+            "variables": variables,
+            "references": references,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        }
+
+    def _analyze(self, source):
+        """
+        Undeclared variables and referenced template names for one source.
+        Either is None when it cannot be determined statically (parse error or
+        dynamic include), which makes dependents hash the full context.
+        """
+        try:
+            ast = self._parser.parse(source)
+        except Exception:
+            return None, None
+        variables = sorted(meta.find_undeclared_variables(ast))
+        references = list(meta.find_referenced_templates(ast))
+        if any(ref is None for ref in references):
+            return variables, None
+        return variables, sorted(set(references))
+
+    def dependencies(self, entry):
+        """
+        Context variables and template paths the rendered output of entry depends on,
+        following includes/extends transitively.
+
+        Returns:
+            (variables, paths): sorted variable names (None means the whole context)
+            and sorted template-relative paths of referenced templates.
+        """
+        if self._by_path is None:
+            self._by_path = {e["path"]: e for e in self.entries}
+        variables, paths, seen = set(), set(), set()
+        stack = [entry]
+        while stack:
+            current = stack.pop()
+            if current["path"] in seen:
+                continue
+            seen.add(current["path"])
+            if current.get("variables") is None or current.get("references") is None:
+                return None, sorted(paths)
+            variables.update(current["variables"])
+            for ref in current["references"]:
+                ref_entry = self._by_path.get(os.path.normpath(ref))
+                if ref_entry is None:
+                    return None, sorted(paths)
+                paths.add(ref_entry["path"])
+                stack.append(ref_entry)
+        return sorted(variables), sorted(paths)
+
+    def select(self, allowed_sessions):
+        """
+        Entries outside excluded sessions, in walk order.
+        Excluded sessions are never stat'ed; included entries whose size or mtime
+        changed since indexing are re-described before being returned.
+        """
+        allowed = set(allowed_sessions)
+        selected = []
+        changed = False
+        for i, entry in enumerate(self.entries):
+            if entry["session"] is not None and entry["session"] not in allowed:
+                continue
+            try:
+                st = os.stat(os.path.join(self.template_dir, entry["path"]))
+            except FileNotFoundError:
+                continue
+            if (st.st_size, st.st_mtime_ns) != (entry["size"], entry["mtime_ns"]):
+                entry = self.entries[i] = self._describe(entry["path"])
+                self._by_path = None
+                changed = True
+            selected.append(entry)
+        if changed:
+            self.save()
+        return selected
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "template_dir": self.template_dir,
+                "dirs": self.dirs,
+                "entries": self.entries,
+            }, f)
+        os.replace(tmp_path, self.index_path)
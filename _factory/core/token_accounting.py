@@ -0,0 +1,127 @@
+"""
+Token Accounting — real token counts from provider usage metadata, estimates only for pre-flight.
+Gemini reports usageMetadata and Ollama prompt_eval_count / eval_count on every
+response; budgets and cost reports are charged those counts. Before a call, when
+no count exists yet, TokenEstimator predicts one: a local token count of the text
+(tiktoken's cl100k_base when installed, otherwise ~4 characters per token), cached
+per text, scaled by a per-key factor learned from the real counts of earlier calls
+and persisted to _factory/cache/token_calibration.json.
+"""
+import json
+import os
+import threading
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CALIBRATION_PATH = os.path.join("_factory", "cache", "token_calibration.json")
+# Prefix of the JSON usage line a refiner subprocess prints for the worker
+USAGE_MARKER = "TOKEN_USAGE "
+CHARS_PER_TOKEN = 4
+# Weight of the newest observation in a key's running factor
+SMOOTHING = 0.2
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Encoding files unavailable offline
+        return None
+
+
+@lru_cache(maxsize=4096)
+def local_count(text):
+    """Local token count of text; a provider-neutral baseline that calibration corrects per model."""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def usage_from_gemini(usage_metadata):
+    """(input_tokens, output_tokens) from a Gemini usageMetadata dict, or None when absent."""
+    if not usage_metadata:
+        return None
+    return usage_metadata.get("promptTokenCount", 0), usage_metadata.get("candidatesTokenCount", 0)
+
+
+def usage_from_ollama(response):
+    """(input_tokens, output_tokens) from a final Ollama chat response, or None when it has no counts."""
+    prompt_count, output_count = response.get("prompt_eval_count"), response.get("eval_count")
+    if prompt_count is None and output_count is None:
+        return None
+    # Ollama leaves prompt_eval_count out when the whole prompt came from its cache
+    return prompt_count or 0, output_count or 0
+
+
+class TokenEstimator:
+    def __init__(self, path=CALIBRATION_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.factors = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.factors = json.load(f)
+            except (OSError, ValueError):
+                self.factors = {}
+
+    def factor(self, key, prior=1.0):
+        entry = self.factors.get(key)
+        return entry["factor"] if entry else prior
+
+    def estimate(self, text, key=None, prior=1.0):
+        """
+        Predicted real tokens for work on text. key names what is being predicted
+        (a model, or model and purpose); prior is the factor used until key has
+        been observed.
+        """
+        return int(round(local_count(text) * self.factor(key, prior)))
+
+    def observe(self, key, baseline, actual):
+        """Fold one real count into key's factor; baseline is the local count (or text) the estimate was based on."""
+        if isinstance(baseline, str):
+            baseline = local_count(baseline)
+        if baseline <= 0 or actual <= 0:
+            return
+        ratio = actual / baseline
+        with self._lock:
+            entry = self.factors.get(key)
+            if entry is None:
+                self.factors[key] = {"factor": ratio, "samples": 1}
+            else:
+                entry["factor"] = (1 - SMOOTHING) * entry["factor"] + SMOOTHING * ratio
+                entry["samples"] += 1
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self.factors, indent=2, sort_keys=True)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_estimator():
+    """Process-wide estimator backed by the calibration file."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = TokenEstimator()
+        return _default
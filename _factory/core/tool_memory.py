@@ -7,6 +7,7 @@ TTL-based expiry with revision notification lifecycle:
 """
 import json
 import os
+import threading
 from datetime import datetime, timedelta
 
 
@@ -17,6 +18,7 @@ class ToolMemory:
     def __init__(self, memory_path=None):
         self.path = memory_path or MEMORY_PATH
         self.data = self._load()
+        self._lock = threading.Lock()
 
     def _load(self):
         if os.path.exists(self.path):
@@ -26,8 +28,11 @@ class ToolMemory:
 
     def _save(self):
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        with open(self.path, "w") as f:
-            json.dump(self.data, f, indent=2)
+        # Snapshot first so concurrent builds can remember() while another saves
+        snapshot = dict(self.data)
+        with self._lock:
+            with open(self.path, "w") as f:
+                json.dump(snapshot, f, indent=2)
 
     def _key(self, industry, use_cases):
         uc = "|".join(sorted(use_cases)) if use_cases else ""
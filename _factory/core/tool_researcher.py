@@ -1,6 +1,9 @@
 """
 Tool Researcher — discovers low-code AI tools via SearXNG (primary) / Tavily (fallback) + LLM curation.
+aresearch_tools is the async form used by cold builds: it searches each use case
+concurrently and merges the results before the single curation call.
 """
+import asyncio
 import os
 import sys
 
@@ -18,39 +21,32 @@ def _import_search():
     return search
 
 
-def research_tools(industry, use_cases, llm_caller):
-    """
-    Research and select 2-3 low-code AI tools for the given industry.
+def _query(industry, use_cases_str):
+    return f"top low code AI tools for {industry} {use_cases_str} deployable in github codespaces or visual interfaces"
 
-    Args:
-        industry:   Industry name string.
-        use_cases:  List of use case strings.
-        llm_caller: Callable that takes a prompt string and returns parsed JSON.
 
-    Returns:
-        List of dicts: [{name, url, setup_requirements, reason}]
-    """
-    use_cases_str = ", ".join(use_cases) if use_cases else "general AI applications"
-    query = f"top low code AI tools for {industry} {use_cases_str} deployable in github codespaces or visual interfaces"
-
-    # Search: SearXNG → Tavily → LLM knowledge
-    search_context = ""
-    try:
-        search_fn = _import_search()
-        results = search_fn(query, mode="research", max_results=5)
+def _search_context(responses):
+    """Merge search responses (one per query) into the prompt's research section."""
+    sources, answers, snippets, seen = [], [], [], set()
+    for results in responses:
         source = results.get("source", "unknown")
-        snippets = []
-        for r in results.get("results", []):
-            snippets.append(f"- {r['title']}: {r['content'][:200]}")
+        if source not in sources:
+            sources.append(source)
         if results.get("answer"):
-            snippets.insert(0, f"Summary: {results['answer']}")
-        search_context = "\n".join(snippets)
-        if search_context:
-            search_context = f"[Source: {source}]\n{search_context}"
-    except Exception:
-        search_context = "Web search unavailable. Use your training knowledge."
+            answers.append(f"Summary: {results['answer']}")
+        for r in results.get("results", []):
+            key = r.get("url") or r["title"]
+            if key not in seen:
+                seen.add(key)
+                snippets.append(f"- {r['title']}: {r['content'][:200]}")
+    search_context = "\n".join(answers + snippets)
+    if search_context:
+        search_context = f"[Source: {', '.join(sources)}]\n{search_context}"
+    return search_context
+
 
-    prompt = f"""You are an AI curriculum tool researcher.
+def _prompt(industry, use_cases_str, search_context):
+    return f"""You are an AI curriculum tool researcher.
 
 Industry: {industry}
 Use Cases: {use_cases_str}
@@ -67,9 +63,66 @@ Select exactly 2-3 tools for this curriculum. Rules:
 Return ONLY a JSON array:
 [{{"name": "...", "url": "...", "setup_requirements": "...", "reason": "..."}}]
 """
-    result = llm_caller(prompt)
+
+
+def _tools(result):
     if isinstance(result, list):
         return result
     if isinstance(result, dict) and "tools" in result:
         return result["tools"]
     return []
+
+
+def research_tools(industry, use_cases, llm_caller):
+    """
+    Research and select 2-3 low-code AI tools for the given industry.
+
+    Args:
+        industry:   Industry name string.
+        use_cases:  List of use case strings.
+        llm_caller: Callable that takes a prompt string and returns parsed JSON.
+
+    Returns:
+        List of dicts: [{name, url, setup_requirements, reason}]
+    """
+    use_cases_str = ", ".join(use_cases) if use_cases else "general AI applications"
+
+    # Search: SearXNG → Tavily → LLM knowledge
+    search_context = ""
+    try:
+        search_fn = _import_search()
+        search_context = _search_context([search_fn(_query(industry, use_cases_str), mode="research", max_results=5)])
+    except Exception:
+        search_context = "Web search unavailable. Use your training knowledge."
+
+    return _tools(llm_caller(_prompt(industry, use_cases_str, search_context)))
+
+
+async def aresearch_tools(industry, use_cases, llm_caller, concurrency=3):
+    """
+    research_tools with one web search per use case, run concurrently (at most
+    `concurrency` at a time), so each use case gets its own results without
+    adding a round trip per use case. llm_caller is an async callable.
+    """
+    use_cases_str = ", ".join(use_cases) if use_cases else "general AI applications"
+    queries = [_query(industry, use_case) for use_case in use_cases] or [_query(industry, use_cases_str)]
+
+    try:
+        search_fn = _import_search()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def search_one(query):
+            async with slots:
+                try:
+                    return await asyncio.to_thread(search_fn, query, mode="research", max_results=5)
+                except Exception:
+                    return None
+
+        responses = [r for r in await asyncio.gather(*(search_one(q) for q in queries)) if r]
+        if not responses:
+            raise RuntimeError("every search failed")
+        search_context = _search_context(responses)
+    except Exception:
+        search_context = "Web search unavailable. Use your training knowledge."
+
+    return _tools(await llm_caller(_prompt(industry, use_cases_str, search_context)))
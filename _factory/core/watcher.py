@@ -0,0 +1,185 @@
+"""
+Watcher — file change notification for --watch builds.
+Uses Linux inotify through ctypes when available and falls back to periodic stat
+polling elsewhere. Both report the same shape: a dict of changed path -> kind
+("modified", "created" or "deleted"), collected until the tree has been quiet for
+a short debounce window so one editor save yields one rebuild.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+try:
+    from _factory.core.template_index import SKIP_DIRS
+except ImportError:
+    from core.template_index import SKIP_DIRS
+
+DEBOUNCE_S = 0.05
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _ignored(name):
+    """Hidden files, editor swap/backup files and atomic-write temp files."""
+    return name.startswith(".") or name.endswith(("~", ".tmp", ".swp")) or name in SKIP_DIRS
+
+
+def _walk_dirs(root):
+    for current, dirs, _ in os.walk(root):
+        dirs[:] = [d for d in dirs if not _ignored(d)]
+        yield current
+
+
+class InotifyWatcher:
+    kind = "inotify"
+
+    def __init__(self, roots, files=()):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify unavailable")
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        # Single files are watched through their directory so editors that save by rename still register
+        self._files = {}
+        for root in roots:
+            for path in _walk_dirs(os.path.abspath(root)):
+                self._add(path)
+        for path in files:
+            directory = os.path.dirname(os.path.abspath(path))
+            self._files.setdefault(directory, set()).add(os.path.basename(path))
+            self._add(directory, watch_files=False)
+
+    def _add(self, path, watch_files=True):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        previous = self._dirs.get(wd)
+        self._dirs[wd] = (path, watch_files or (previous is not None and previous[1]))
+
+    def _read(self, changes):
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(buf, offset)
+            name = buf[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            if wd not in self._dirs or not name:
+                continue
+            directory, watch_files = self._dirs[wd]
+            name = os.fsdecode(name)
+            if _ignored(name):
+                continue
+            if not watch_files and name not in self._files.get(directory, ()):
+                continue
+            path = os.path.join(directory, name)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                if mask & IN_ISDIR:
+                    try:
+                        for sub in _walk_dirs(path):
+                            self._add(sub)
+                    except OSError:
+                        pass  # Removed again before it could be watched
+                changes[path] = "created" if changes.get(path) != "deleted" else "modified"
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                changes[path] = "deleted"
+            else:
+                changes.setdefault(path, "modified")
+
+    def changes(self, timeout=None):
+        """Block up to timeout seconds (None = forever) and return the debounced changes."""
+        changes = {}
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changes
+        while True:
+            self._read(changes)
+            if not select.select([self.fd], [], [], DEBOUNCE_S)[0]:
+                return changes
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    kind = "polling"
+
+    def __init__(self, roots, files=(), interval=0.5):
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.files = [os.path.abspath(p) for p in files]
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        paths = list(self.files)
+        for root in self.roots:
+            for directory in _walk_dirs(root):
+                try:
+                    names = os.listdir(directory)
+                except FileNotFoundError:
+                    continue
+                paths.extend(os.path.join(directory, name) for name in names
+                             if not _ignored(name) and not os.path.isdir(os.path.join(directory, name)))
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def _diff(self, before, after):
+        changes = {p: "deleted" for p in before if p not in after}
+        for path, key in after.items():
+            if path not in before:
+                changes[path] = "created"
+            elif before[path] != key:
+                changes[path] = "modified"
+        return changes
+
+    def changes(self, timeout=None):
+        """Poll every interval for up to timeout seconds (None = forever) and return the changes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self._scan()
+            changes = self._diff(self._snapshot, current)
+            self._snapshot = current
+            if changes or (deadline is not None and time.monotonic() >= deadline):
+                return changes
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+def make_watcher(roots, files=(), poll_interval=0.5):
+    """inotify watcher when the platform supports it, otherwise a polling watcher."""
+    try:
+        return InotifyWatcher(roots, files)
+    except (OSError, AttributeError):
+        return PollingWatcher(roots, files, interval=poll_interval)
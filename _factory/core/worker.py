@@ -1,37 +1,98 @@
 import asyncio
+import contextvars
+import importlib.util
 import os
 import sys
 import json
-from datetime import datetime
+from contextlib import asynccontextmanager
+
+try:
+    from _factory.core.adaptive_concurrency import AdaptiveConcurrency
+    from _factory.core.rate_limiter import child_env
+    from _factory.core.refinement_queue import LEASE_SECONDS
+    from _factory.core.section_cache import SectionCache
+    from _factory.core.token_accounting import USAGE_MARKER, default_estimator, local_count
+except ImportError:
+    from core.adaptive_concurrency import AdaptiveConcurrency
+    from core.rate_limiter import child_env
+    from core.refinement_queue import LEASE_SECONDS
+    from core.section_cache import SectionCache
+    from core.token_accounting import USAGE_MARKER, default_estimator, local_count
+
+# Before a refinement has been calibrated, assume prompt plus rewrite cost twice the file's tokens
+REFINE_PRIOR = 2.0
+# Estimator key calibrating a batch prompt's real input tokens against its sections' local count
+BATCH_PROMPT_KEY = "{model}:batch_prompt"
 
 
 class TokenBudget:
-    def __init__(self, total_tokens, defer_after_tokens, tokens_per_minute):
+    """
+    Pass 2 token limits. A job reserves an estimate before it starts, so concurrent
+    jobs cannot overrun total_tokens between them, and is charged the provider's
+    real counts when it finishes; the estimate is charged only when none came back.
+    Charges are also kept per industry, so a budget shared by several builds can be
+    reported back to each of them (usage_for).
+    Pacing is not the budget's job: every LLM call waits on the shared rate limiter.
+    """
+
+    def __init__(self, total_tokens, defer_after_tokens, estimator=None):
         self.total_tokens = total_tokens
         self.defer_after_tokens = defer_after_tokens
-        self.tokens_per_minute = tokens_per_minute
         self.used_tokens = 0
-        self.minute_bucket = 0
-        self.bucket_reset_time = datetime.now()
-
-    @staticmethod
-    def estimate_tokens(text):
-        return len(text) // 4
-
-    def can_proceed(self):
-        now = datetime.now()
-        if (now - self.bucket_reset_time).total_seconds() > 60:
-            self.minute_bucket = 0
-            self.bucket_reset_time = now
-        if self.used_tokens >= self.defer_after_tokens:
-            return False
-        if self.minute_bucket >= self.tokens_per_minute:
+        self.reserved_tokens = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.estimated_tokens = 0
+        self.by_industry = {}
+        self.estimator = estimator or default_estimator()
+
+    def estimate_tokens(self, text, key=None, prior=1.0):
+        return self.estimator.estimate(text, key, prior)
+
+    def reserve(self, tokens):
+        """Pre-flight: hold tokens for a job about to start; False when they would overrun total_tokens."""
+        committed = self.used_tokens + self.reserved_tokens
+        # An oversized job still runs when nothing else is committed
+        if committed and committed + tokens > self.total_tokens:
             return False
+        self.reserved_tokens += tokens
         return True
 
-    def record_usage(self, tokens):
+    def settle(self, reserved, usage, key=None, baseline=0, industry=None):
+        """
+        Release a reservation and charge the job (to industry, when given): usage is
+        {input_tokens, output_tokens, calls} from the provider, or None to charge the
+        reserved estimate. Real counts also calibrate key's estimates against baseline
+        (the local count they were based on).
+
+        Returns:
+            int: tokens charged
+        """
+        self.reserved_tokens -= reserved
+        if usage is None:
+            self.record_usage(reserved, exact=False, industry=industry)
+            return reserved
+        if usage.get("calls") and key:
+            self.estimator.observe(key, baseline, usage["input_tokens"] + usage["output_tokens"])
+        self.record_usage(usage["input_tokens"], usage["output_tokens"], industry=industry)
+        return usage["input_tokens"] + usage["output_tokens"]
+
+    def record_usage(self, input_tokens, output_tokens=0, exact=True, industry=None):
+        tokens = input_tokens + output_tokens
         self.used_tokens += tokens
-        self.minute_bucket += tokens
+        share = self.by_industry.setdefault(industry, {"input": 0, "output": 0, "estimated": 0})
+        if exact:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            share["input"] += input_tokens
+            share["output"] += output_tokens
+        else:
+            self.estimated_tokens += tokens
+            share["estimated"] += tokens
+
+    def usage_for(self, industry):
+        """{input, output, estimated} tokens charged to one industry's jobs."""
+        return dict(self.by_industry.get(industry, {"input": 0, "output": 0, "estimated": 0}))
 
     def is_exhausted(self):
         return self.used_tokens >= self.total_tokens
@@ -42,82 +103,467 @@ class TokenBudget:
             "total": self.total_tokens,
             "remaining": max(0, self.total_tokens - self.used_tokens),
             "deferred": self.used_tokens >= self.defer_after_tokens,
+            "input": self.input_tokens,
+            "output": self.output_tokens,
+            "estimated": self.estimated_tokens,
         }
 
 
-async def refine_file_async(job, industry_name, refiner_script, model, semaphore, budget, logger):
+# StreamMetrics of the LLM calls made by the refinement running in the current task
+_call_metrics = contextvars.ContextVar("refiner_call_metrics", default=None)
+
+
+def usage_of(calls):
+    """{input_tokens, output_tokens, calls} over StreamMetrics, or None if any call came back without counts."""
+    if any(m.output_tokens is None for m in calls):
+        return None
+    return {
+        "input_tokens": sum(m.input_tokens or 0 for m in calls),
+        "output_tokens": sum(m.output_tokens for m in calls),
+        "calls": len(calls),
+    }
+
+
+def parse_usage(stdout):
+    """The usage a refiner subprocess reported on its last USAGE_MARKER line, or None."""
+    for line in reversed(stdout.splitlines()):
+        if line.startswith(USAGE_MARKER):
+            try:
+                usage = json.loads(line[len(USAGE_MARKER):])
+            except ValueError:
+                return None
+            return usage if usage.get("exact", True) else None
+    return None
+
+
+class InProcessRefiner:
+    """
+    Runs the context_refiner skill as async tasks on the worker's event loop through
+    one pooled client, with a SectionCache so unchanged sections skip the LLM.
+    Responses stream; each call's time to first token and tokens/s are logged.
+    Batches are packed with the calibrated TokenEstimator (BATCH_PROMPT_KEY).
+    """
+
+    def __init__(self, module, model, concurrency, logger, estimator=None):
+        self.module = module
+        self.client = module.RefinerClient(model=model, max_connections=concurrency, on_metrics=self._metrics)
+        self.cache = SectionCache()
+        self.logger = logger
+        self.estimator = estimator or default_estimator()
+        self.streams = []
+
+    def _log(self, message):
+        self.logger.log(message.strip(), level="DEBUG")
+
+    def _metrics(self, metrics):
+        self.streams.append(metrics.as_dict())
+        self.logger.log(f"LLM stream {metrics.summary()}", level="DEBUG", metadata=self.streams[-1])
+        calls = _call_metrics.get()
+        if calls is not None:
+            calls.append(metrics)
+
+    async def refine(self, file_path, industry_name, industry_slug):
+        """Refine one file; returns its token usage (see usage_of)."""
+        calls = []
+        token = _call_metrics.set(calls)
+        try:
+            await self.module.refine_file(file_path, industry_name, industry_slug, self.client.call,
+                                          log=self._log, cache=self.cache, model=self.client.model,
+                                          stream=self.client.stream)
+        finally:
+            _call_metrics.reset(token)
+        return usage_of(calls)
+
+    @property
+    def prompt_key(self):
+        return BATCH_PROMPT_KEY.format(model=self.client.model)
+
+    def section_tokens(self, job, calibrated=True):
+        """Prompt tokens of job's target sections: calibrated for packing, or the local count they scale."""
+        try:
+            if calibrated:
+                return self.module.estimate_section_tokens(job["file_path"], self.estimator, self.prompt_key)
+            return self.module.estimate_section_tokens(job["file_path"])
+        except OSError:
+            return 0
+
+    def pack(self, jobs, max_tokens):
+        """Group jobs of the same industry into batches whose target sections fit max_tokens."""
+        groups = {}
+        for job in jobs:
+            groups.setdefault((job.get("industry_name"), job["industry_slug"]), []).append(job)
+        batches = []
+        for group in groups.values():
+            by_id = {job["id"]: job for job in group}
+            items = [(job["id"], self.section_tokens(job)) for job in group]
+            batches.extend([by_id[job_id] for job_id in batch] for batch in self.module.pack_batches(items, max_tokens))
+        return batches
+
+    async def refine_batch(self, file_paths, industry_name, industry_slug):
+        calls = []
+        token = _call_metrics.set(calls)
+        try:
+            await self.module.refine_batch(file_paths, industry_name, industry_slug, self.client.call,
+                                           log=self._log, cache=self.cache, model=self.client.model,
+                                           stream=self.client.stream)
+        finally:
+            _call_metrics.reset(token)
+        return usage_of(calls)
+
+    async def aclose(self):
+        await self.client.aclose()
+        ttfts = [m["ttft_ms"] for m in self.streams if m["ttft_ms"] is not None]
+        rates = [m["tokens_per_second"] for m in self.streams if m["tokens_per_second"] is not None]
+        if ttfts:
+            summary = {"calls": len(self.streams), "avg_ttft_ms": round(sum(ttfts) / len(ttfts), 1),
+                       "max_ttft_ms": max(ttfts),
+                       "avg_tokens_per_second": round(sum(rates) / len(rates), 1) if rates else None}
+            self.logger.log(f"Refiner streams: {summary['calls']} calls, first token avg {summary['avg_ttft_ms']:.0f}ms "
+                            f"(max {summary['max_ttft_ms']:.0f}ms)", metadata=summary)
+        stats = self.cache.stats
+        if stats["hits"] or stats["misses"]:
+            self.logger.log(f"Section cache: {stats['hits']} hits, {stats['misses']} misses, "
+                            f"{stats['stores']} new refinements stored", metadata=stats)
+        self.cache.close()
+
+
+_refiner_modules = {}
+
+
+def load_refiner_module(refiner_script):
+    """Import the refiner script once per process; raises ImportError when its dependencies are missing."""
+    path = os.path.abspath(refiner_script)
+    if path not in _refiner_modules:
+        spec = importlib.util.spec_from_file_location("context_refiner", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _refiner_modules[path] = module
+    return _refiner_modules[path]
+
+
+@asynccontextmanager
+async def open_refiner(refiner_script, model, concurrency, logger):
+    """
+    Yield an InProcessRefiner for the duration of a drain, or None to run one
+    subprocess per file. REFINER_MODE=subprocess forces the subprocess path,
+    which isolates each refinement in its own interpreter.
+    """
+    refiner = None
+    if os.environ.get("REFINER_MODE", "inprocess") != "subprocess":
+        try:
+            refiner = InProcessRefiner(load_refiner_module(refiner_script), model, concurrency, logger)
+        except (ImportError, AttributeError) as e:
+            logger.log(f"In-process refiner unavailable ({e}); using one subprocess per file.", level="WARNING")
+    try:
+        yield refiner
+    finally:
+        if refiner is not None:
+            await refiner.aclose()
+
+
+async def refine_file_async(job, industry_name, refiner_script, model, semaphore, budget, logger, cancel_event=None,
+                            refiner=None):
     async with semaphore:
         basename = os.path.basename(job["file_path"])
 
+        if cancel_event is not None and cancel_event.is_set():
+            return {"status": "deferred", "job_id": job["id"]}
+
         if budget.is_exhausted():
             logger.log(f"Budget exhausted — deferring: {basename}", level="WARNING")
             return {"status": "deferred", "job_id": job["id"]}
 
-        if not budget.can_proceed():
-            await asyncio.sleep(2)
-
         try:
             with open(job["file_path"], "r") as f:
                 content = f.read()
         except FileNotFoundError:
             return {"status": "failed", "job_id": job["id"], "error": "file not found"}
 
-        estimated_tokens = TokenBudget.estimate_tokens(content) * 2
+        key = f"{model}:refine"
+        estimated_tokens = budget.estimate_tokens(content, key, prior=REFINE_PRIOR)
+        if not budget.reserve(estimated_tokens):
+            logger.log(f"Budget cannot cover ~{estimated_tokens} tokens — deferring: {basename}", level="WARNING")
+            return {"status": "deferred", "job_id": job["id"]}
+
+        probe = semaphore.probe()
+        if refiner is not None:
+            usage = None
+            try:
+                usage = await refiner.refine(job["file_path"], job.get("industry_name") or industry_name,
+                                             job["industry_slug"])
+            except Exception as e:
+                semaphore.observe(probe, failed=True)
+                logger.log(f"Refinement failed — {basename}: {type(e).__name__}: {e}", level="WARNING")
+                return {"status": "failed", "job_id": job["id"], "error": f"{type(e).__name__}: {e}"}
+            finally:
+                tokens = budget.settle(estimated_tokens, usage, key, local_count(content), job["industry_slug"])
+            semaphore.observe(probe, tokens)
+            return {"status": "done", "job_id": job["id"], "tokens": tokens}
 
-        env = os.environ.copy()
+        env = child_env()
         env["REFINER_MODEL"] = model
 
         proc = await asyncio.create_subprocess_exec(
             sys.executable, refiner_script,
-            job["file_path"], industry_name, job["industry_slug"],
+            job["file_path"], job.get("industry_name") or industry_name, job["industry_slug"],
             env=env,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
         stdout, stderr = await proc.communicate()
-        budget.record_usage(estimated_tokens)
+        tokens = budget.settle(estimated_tokens, parse_usage(stdout.decode(errors="replace")), key, local_count(content),
+                               job["industry_slug"])
+        semaphore.observe(probe, tokens, failed=proc.returncode != 0)
 
         if proc.returncode == 0:
-            return {"status": "done", "job_id": job["id"], "tokens": estimated_tokens}
+            return {"status": "done", "job_id": job["id"], "tokens": tokens}
         else:
+            logger.log(f"Refinement failed — {basename}: exit code {proc.returncode}", level="WARNING")
             return {"status": "failed", "job_id": job["id"], "error": stderr.decode().strip()}
 
 
-async def drain_queue(queue, industry_name, refiner_script, model, token_budget_config, logger, concurrency=3):
-    budget = TokenBudget(
+async def refine_batch_async(jobs, industry_name, semaphore, budget, logger, refiner, cancel_event=None):
+    """
+    Refine a batch of jobs with one in-process call; returns one result per job. The
+    batch's real token usage is split across its jobs in proportion to their size.
+    """
+    async with semaphore:
+        if cancel_event is not None and cancel_event.is_set():
+            return [{"status": "deferred", "job_id": job["id"]} for job in jobs]
+
+        if budget.is_exhausted():
+            logger.log(f"Budget exhausted — deferring batch of {len(jobs)} files", level="WARNING")
+            return [{"status": "deferred", "job_id": job["id"]} for job in jobs]
+
+        key = f"{refiner.client.model}:refine_batch"
+        results, ready = [], []
+        for job in jobs:
+            try:
+                with open(job["file_path"], "r") as f:
+                    ready.append((job, local_count(f.read())))
+            except FileNotFoundError:
+                results.append({"status": "failed", "job_id": job["id"], "error": "file not found"})
+        if not ready:
+            return results
+
+        baseline = sum(count for _, count in ready)
+        estimated_tokens = round(baseline * budget.estimator.factor(key, REFINE_PRIOR))
+        if not budget.reserve(estimated_tokens):
+            logger.log(f"Budget cannot cover ~{estimated_tokens} tokens — deferring batch of {len(ready)} files",
+                       level="WARNING")
+            return results + [{"status": "deferred", "job_id": job["id"]} for job, _ in ready]
+
+        first = ready[0][0]
+        # Measured before the files are rewritten; calibrates the estimates pack() uses
+        sections = sum(refiner.section_tokens(job, calibrated=False) for job, _ in ready)
+        cache_hits = refiner.cache.stats["hits"]
+        probe = semaphore.probe()
+        usage = None
+        try:
+            usage = await refiner.refine_batch([job["file_path"] for job, _ in ready],
+                                               first.get("industry_name") or industry_name, first["industry_slug"])
+        except Exception as e:
+            semaphore.observe(probe, failed=True)
+            return results + [{"status": "failed", "job_id": job["id"], "error": f"{type(e).__name__}: {e}"}
+                              for job, _ in ready]
+        finally:
+            tokens = budget.settle(estimated_tokens, usage, key, baseline, first["industry_slug"])
+        if usage and usage.get("calls") and refiner.cache.stats["hits"] == cache_hits:
+            # Only whole prompts calibrate: sections served from the cache were never sent
+            refiner.estimator.observe(refiner.prompt_key, sections, usage["input_tokens"])
+        semaphore.observe(probe, tokens)
+        return results + [{"status": "done", "job_id": job["id"], "tokens": round(tokens * count / max(baseline, 1))}
+                          for job, count in ready]
+
+
+def make_concurrency(concurrency):
+    """The AdaptiveConcurrency gating Pass 2 jobs: concurrency itself, or a fixed one of that size."""
+    if isinstance(concurrency, AdaptiveConcurrency):
+        return concurrency
+    return AdaptiveConcurrency(concurrency, floor=concurrency, ceiling=concurrency)
+
+
+def make_budget(token_budget_config):
+    return TokenBudget(
         total_tokens=token_budget_config["total_tokens"],
         defer_after_tokens=token_budget_config["defer_after_tokens"],
-        tokens_per_minute=token_budget_config["tokens_per_minute"],
     )
 
-    semaphore = asyncio.Semaphore(concurrency)
-    tasks = []
 
+def record_result(queue, result):
+    if isinstance(result, Exception):
+        return
+    if result["status"] == "done":
+        queue.mark_done(result["job_id"])
+    elif result["status"] == "failed":
+        queue.mark_failed(result["job_id"], result.get("error", "unknown"))
+    elif result["status"] == "deferred":
+        queue.reset_to_pending(result["job_id"])
+
+
+async def run_jobs(queue, jobs, refinement, on_result=None):
+    """
+    Await refinement (of jobs) and write its results to queue as soon as it ends; an
+    unexpected exception fails the jobs instead of leaving them in_progress.
+    on_result, if given, is called with each result once it is written.
+
+    Returns:
+        list: the job results.
+    """
+    try:
+        results = await refinement
+    except Exception as e:
+        results = [{"status": "failed", "job_id": job["id"], "error": f"{type(e).__name__}: {e}"} for job in jobs]
+    results = results if isinstance(results, list) else [results]
+    for result in results:
+        record_result(queue, result)
+        if on_result is not None:
+            on_result(result)
+    return results
+
+
+async def keep_leases(queue, interval=LEASE_SECONDS / 3):
+    """Renew the leases of queue's claimed jobs until cancelled, so long refinements are not reclaimed."""
+    while True:
+        await asyncio.sleep(interval)
+        queue.heartbeat()
+
+
+def claim_batch_jobs(queue, refiner, batch_tokens, carry=None):
+    """
+    Claim pending jobs until their target sections fill batch_tokens. A claimed job
+    that would overflow the batch is returned as the carry for the next one.
+
+    Returns:
+        tuple: (jobs, carry)
+    """
+    jobs, tokens = [], 0
     while True:
-        job = queue.next_job()
+        job, carry = carry or queue.claim_next(), None
         if job is None:
-            break
-        if budget.is_exhausted():
-            logger.log("Token budget exhausted. Remaining jobs deferred to next run.", level="WARNING")
-            break
-        queue.mark_in_progress(job["id"])
-        task = asyncio.create_task(
-            refine_file_async(job, industry_name, refiner_script, model, semaphore, budget, logger)
-        )
-        tasks.append(task)
+            return jobs, None
+        job_tokens = refiner.section_tokens(job)
+        if jobs and tokens + job_tokens > batch_tokens:
+            return jobs, job
+        jobs.append(job)
+        tokens += job_tokens
 
-    results = await asyncio.gather(*tasks, return_exceptions=True)
 
-    for result in results:
-        if isinstance(result, Exception):
-            continue
-        if result["status"] == "done":
-            queue.mark_done(result["job_id"])
-        elif result["status"] == "failed":
-            queue.mark_failed(result["job_id"], result.get("error", "unknown"))
-        elif result["status"] == "deferred":
-            queue.reset_to_pending(result["job_id"])
+async def consume_stream(job_ids, queue, industry_name, refiner_script, model, budget, logger, concurrency=3,
+                         cancel_event=None, refiner=None):
+    """
+    Refine jobs as their ids arrive on job_ids, an asyncio.Queue closed with a None
+    sentinel. Each id is claimed on queue first, so a job is refined at most once
+    even if it is also reachable through drain_queue. concurrency is as for drain_queue.
+
+    Returns:
+        int: number of jobs claimed from the stream.
+    """
+    semaphore = make_concurrency(concurrency)
+    heartbeat = asyncio.create_task(keep_leases(queue))
+
+    tasks = []
+    try:
+        while True:
+            job_id = await job_ids.get()
+            if job_id is None:
+                break
+            job = queue.claim(job_id)
+            if job is not None:
+                tasks.append(asyncio.create_task(run_jobs(queue, [job], refine_file_async(
+                    job, industry_name, refiner_script, model, semaphore, budget, logger, cancel_event, refiner))))
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        heartbeat.cancel()
+    return len(tasks)
+
+
+async def drain_queue(queue, industry_name, refiner_script, model, token_budget_config, logger, concurrency=3,
+                      cancel_event=None, budget=None, refiner=None, on_result=None):
+    """
+    Refine every pending job. Jobs are claimed as workers free up, as many at once
+    as there are free slots (a prompt's worth at a time when batching), held under leases renewed by a heartbeat, and
+    each result is written to queue the moment it is known, so a killed run loses
+    only the jobs in flight: their leases expire and the next run reclaims them.
+    Setting cancel_event (a threading.Event) stops new refinements from starting;
+    unclaimed jobs stay pending. Pass budget to continue spending an existing
+    TokenBudget, and refiner (from open_refiner) to refine in-process instead of
+    one subprocess per file. With an in-process refiner and
+    token_budget_config["batch_tokens"] set, the target sections of several files
+    share one prompt of up to that many tokens. concurrency is a fixed number of
+    jobs in flight, or an AdaptiveConcurrency that tunes it from the jobs'
+    latency, errors and 429s. on_result is called with each job's result as soon as
+    it is written (see run_jobs).
+    """
+    budget = budget or make_budget(token_budget_config)
+    batch_tokens = token_budget_config.get("batch_tokens", 0) if refiner is not None else 0
+
+    semaphore = make_concurrency(concurrency)
+    reclaimed = queue.reclaimed + queue.reclaim_expired()
+    queue.reclaimed = 0
+    if reclaimed:
+        logger.log(f"Reclaimed {reclaimed} interrupted jobs whose lease had expired", level="WARNING")
+
+    heartbeat = asyncio.create_task(keep_leases(queue))
+    running = {}
+    carry = None
+    claimed = batches = 0
+    deferred = False
+
+    def on_done(task):
+        nonlocal deferred
+        jobs = running.pop(task)
+        if not task.cancelled() and task.exception() is None:
+            deferred = deferred or any(r["status"] == "deferred" for r in task.result())
+        elif task.cancelled():
+            for job in jobs:
+                queue.reset_to_pending(job["id"])
+
+    def start(jobs, refinement):
+        task = asyncio.create_task(run_jobs(queue, jobs, refinement, on_result))
+        running[task] = jobs
+        task.add_done_callback(on_done)
+
+    try:
+        while True:
+            while len(running) >= semaphore.limit:
+                await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            if cancel_event is not None and cancel_event.is_set():
+                logger.log("Refinement cancelled. Remaining jobs left pending.", level="WARNING")
+                break
+            if budget.is_exhausted() or deferred:
+                logger.log("Token budget exhausted. Remaining jobs deferred to next run.", level="WARNING")
+                break
+            if batch_tokens:
+                jobs, carry = claim_batch_jobs(queue, refiner, batch_tokens, carry)
+                if not jobs:
+                    break
+                for batch in refiner.pack(jobs, batch_tokens):
+                    start(batch, refine_batch_async(batch, industry_name, semaphore, budget, logger, refiner,
+                                                    cancel_event))
+                    batches += 1
+            else:
+                jobs = queue.claim_batch(semaphore.limit - len(running))
+                if not jobs:
+                    break
+                for job in jobs:
+                    start([job], refine_file_async(job, industry_name, refiner_script, model, semaphore, budget,
+                                                   logger, cancel_event, refiner))
+            claimed += len(jobs)
+        if running:
+            await asyncio.wait(list(running))
+    finally:
+        heartbeat.cancel()
+        for task in list(running):
+            task.cancel()
+        if running:
+            await asyncio.wait(list(running))
+        if carry is not None:
+            queue.reset_to_pending(carry["id"])
 
+    if batches:
+        logger.log(f"Batched refinement: {claimed} files in {batches} prompts of up to {batch_tokens} tokens")
     queue.clear_done()
-    logger.log(f"Pass 2 complete. Budget: {budget.stats()} | Queue: {queue.stats()}")
+    concurrency_stats = f" | Concurrency: {semaphore.stats()}" if semaphore.adaptive else ""
+    logger.log(f"Pass 2 complete. Budget: {budget.stats()} | Queue: {queue.stats()}{concurrency_stats}")
     return budget.stats()
@@ -21,57 +21,60 @@ class TelemetryLogger:
         print(f"[{level}] {event}")
 
 try:
-    from _factory.core.compiler import FactoryCompiler
+    from _factory.core.compiler import FactoryCompiler, compile_many, load_catalog, watch_builds
 except (ImportError, ModuleNotFoundError):
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    from core.compiler import FactoryCompiler
+    from core.compiler import FactoryCompiler, compile_many, load_catalog, watch_builds
+
+
+def _arg_value(flag, default=None):
+    if flag in sys.argv:
+        idx = sys.argv.index(flag) + 1
+        if idx < len(sys.argv) and not sys.argv[idx].startswith("--"):
+            return sys.argv[idx]
+    return default
+
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python3 factory_compiler.py <manifest.yaml> [--mode local|cloud] [--force]")
+        print("Usage: python3 factory_compiler.py <manifest.yaml> [--mode local|cloud] [--force] [--jobs N] [--pipeline | --dag] [--watch]")
+        print("       python3 factory_compiler.py --catalog [courses.yaml] [--courses id1,id2] [--mode local|cloud] [--force] [--jobs N] [--watch]")
         sys.exit(1)
 
-    engine_mode = "local"
-    if "--mode" in sys.argv:
-        mode_idx = sys.argv.index("--mode") + 1
-        if mode_idx < len(sys.argv):
-            engine_mode = sys.argv[mode_idx]
-
+    engine_mode = _arg_value("--mode", "local")
     force = "--force" in sys.argv
 
-    compiler = FactoryCompiler(sys.argv[1], engine_mode=engine_mode)
+    # Pass 1 render workers — 0 means one per CPU core
+    jobs = int(_arg_value("--jobs", "1")) or os.cpu_count() or 1
+    watch = "--watch" in sys.argv
 
-    # Context cache path — stable across warm builds
-    context_cache_path = os.path.join("_factory", "cache", f"{compiler.slug}_context.json")
-    os.makedirs(os.path.dirname(context_cache_path), exist_ok=True)
+    if "--catalog" in sys.argv:
+        catalog_path = _arg_value("--catalog", os.path.join("_factory", "catalog", "courses.yaml"))
+        course_ids = _arg_value("--courses")
+        load = lambda: load_catalog(catalog_path, course_ids.split(",") if course_ids else None)
+        if watch:
+            watch_builds(load, [catalog_path], engine_mode=engine_mode, jobs=jobs, force=force)
+        else:
+            compile_many(load(), engine_mode=engine_mode, jobs=jobs, force=force)
+        sys.exit(0)
 
-    if force:
-        compiler.logger.log("Force rebuild: cache cleared")
-        compiler.cache.invalidate()
-        compiler.generate_llm_context()
-        with open(context_cache_path, "w") as f:
-            json.dump(compiler.context, f)
-        compiler.run_data_synth()
-    elif os.path.exists(context_cache_path) and len(compiler.cache.hashes) > 0:
-        compiler.logger.log("Warm build: loading cached context, skipping data synthesis")
-        with open(context_cache_path) as f:
-            compiler.context.update(json.load(f))
-    else:
-        compiler.logger.log("Cold build: generating LLM context and data")
-        compiler.generate_llm_context()
-        with open(context_cache_path, "w") as f:
-            json.dump(compiler.context, f)
-        compiler.run_data_synth()
+    if watch:
+        # Pass 1 only: refinement jobs accumulate in the queue for a later --pass 2
+        watch_builds(lambda: [sys.argv[1]], [sys.argv[1]], engine_mode=engine_mode, jobs=jobs, force=force)
+        sys.exit(0)
 
-    pass_arg = None
-    if "--pass" in sys.argv:
-        pass_idx = sys.argv.index("--pass") + 1
-        if pass_idx < len(sys.argv):
-            pass_arg = sys.argv[pass_idx]
+    compiler = FactoryCompiler(sys.argv[1], engine_mode=engine_mode)
+    if "--dag" in sys.argv:
+        # Stage graph: context, synthesis and both passes scheduled by their dependencies
+        compiler.compile_dag(force=force, jobs=jobs)
+        sys.exit(0)
+    compiler.prepare_context(force=force)
 
+    pass_arg = _arg_value("--pass")
     if pass_arg == "1":
-        compiler.compile_pass1()
+        compiler.compile_pass1(jobs=jobs)
     elif pass_arg == "2":
         compiler.compile_pass2()
     else:
-        compiler.compile()
+        # --pipeline overlaps Pass 2 refinement with Pass 1 rendering
+        compiler.compile(jobs=jobs, pipeline="--pipeline" in sys.argv)
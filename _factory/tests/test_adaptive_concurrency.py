@@ -0,0 +1,108 @@
+"""
+Adaptive Concurrency Tests
+Tests: limit enforced -> healthy jobs add slots up to the ceiling -> 429 halves once per wave -> queueing latency backs off -> cache hits leave the baseline alone -> fixed size when floor == ceiling
+"""
+import asyncio
+import os
+import sys
+import time
+
+# Ensure project root is on path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core.adaptive_concurrency import AdaptiveConcurrency
+from _factory.core.rate_limiter import limiter
+
+
+class ListLogger:
+    def __init__(self):
+        self.events = []
+
+    def log(self, event, level="INFO", metadata=None):
+        self.events.append(metadata)
+
+
+def backdate(probe, seconds):
+    return probe[0] - seconds, probe[1]
+
+
+def test_limit_enforced_and_raised_mid_run():
+    slots = AdaptiveConcurrency(2, floor=1, ceiling=4)
+    peak = 0
+
+    async def job():
+        nonlocal peak
+        async with slots:
+            peak = max(peak, slots.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        tasks = [asyncio.create_task(job()) for _ in range(8)]
+        await asyncio.sleep(0.005)
+        assert slots.in_flight == 2 and peak == 2
+        # A raised limit lets waiting jobs in straight away
+        slots._set(4, "test")
+        await asyncio.sleep(0)
+        assert slots.in_flight == 4
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert peak == 4 and slots.in_flight == 0
+
+
+def test_additive_increase_to_ceiling_and_telemetry():
+    logger = ListLogger()
+    slots = AdaptiveConcurrency(2, floor=1, ceiling=4, logger=logger)
+    for _ in range(20):
+        slots.observe(backdate(slots.probe(), 0.1), tokens=100)
+    assert slots.limit == 4
+    assert [(e["from"], e["to"]) for e in logger.events] == [(2, 3), (3, 4)]
+    assert slots.stats()["peak"] == 4
+
+
+def test_throttle_halves_once_per_wave():
+    slots = AdaptiveConcurrency(8, floor=1, ceiling=16)
+    wave = [slots.probe() for _ in range(8)]
+    limiter().throttled("stub-aimd", retry_after=0)
+    for probe in wave:
+        slots.observe(probe, tokens=100)
+    assert slots.limit == 4
+    # Jobs started after the cut count again
+    probe = slots.probe()
+    limiter().throttled("stub-aimd", retry_after=0)
+    slots.observe(probe, tokens=100)
+    assert slots.limit == 2
+
+
+def test_queueing_latency_backs_off_and_errors_count():
+    slots = AdaptiveConcurrency(5, floor=2, ceiling=10)
+    for _ in range(3):
+        slots.observe(backdate(slots.probe(), 0.1), tokens=100)
+    # Same work now takes four times as long: the backend is queueing
+    for _ in range(3):
+        slots.observe(backdate(slots.probe(), 0.4), tokens=100)
+    assert slots.limit == 4
+    assert "latency" in slots.changes[-1]["reason"]
+
+    time.sleep(0.001)
+    for _ in range(3):
+        slots.observe(slots.probe(), failed=True)
+    assert slots.limit == 3 and "error rate" in slots.changes[-1]["reason"]
+
+
+def test_cache_hits_do_not_set_the_latency_baseline():
+    slots = AdaptiveConcurrency(4, floor=1, ceiling=8)
+    for _ in range(3):
+        slots.observe(backdate(slots.probe(), 0.002), tokens=0)
+    for _ in range(20):
+        slots.observe(backdate(slots.probe(), 20), tokens=1500)
+    assert slots.limit > 4
+    assert not any("latency" in change["reason"] for change in slots.changes)
+
+
+def test_fixed_when_floor_equals_ceiling():
+    slots = AdaptiveConcurrency(3, floor=3, ceiling=3)
+    limiter().throttled("stub-aimd", retry_after=0)
+    for _ in range(10):
+        slots.observe(backdate(slots.probe(), 5), tokens=1, failed=True)
+    assert slots.limit == 3 and not slots.adaptive and not slots.changes
@@ -0,0 +1,184 @@
+"""
+Build Cache Tests
+Tests: variable-level invalidation -> include tracking -> stat fast path -> output format bump -> template index selection -> namespaces -> rendered and copied files end alike -> blob store -> writable outputs are private copies
+"""
+import os
+import sys
+
+# Ensure project root is on path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core import cache as build_cache
+from _factory.core.cache import BuildCache
+from _factory.core.template_index import TemplateIndex
+from _factory.core.blob_store import BlobStore
+from _factory.core.render_pool import run_task
+from _factory.core.template_cache import make_environment
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def _index(tmp_path):
+    template_dir = str(tmp_path / "templates")
+    _write(os.path.join(template_dir, "01_intro", "lab.md"), "# {{ industry_name }}\n{% include 'shared/footer.md' %}\n")
+    _write(os.path.join(template_dir, "02_swarm", "swarm.md"), "# Static swarm notes\n")
+    _write(os.path.join(template_dir, "shared", "footer.md"), "Built for {{ region }}\n")
+    return TemplateIndex(template_dir, index_path=str(tmp_path / "cache" / "index.json"))
+
+
+def test_unused_context_change_keeps_hash(tmp_path):
+    index = _index(tmp_path)
+    entry = next(e for e in index.entries if e["path"].endswith("lab.md"))
+    variables, deps = index.dependencies(entry)
+    assert variables == ["industry_name", "region"]
+    assert deps == [os.path.join("shared", "footer.md")]
+
+    src = os.path.join(index.template_dir, entry["path"])
+    dep_paths = [os.path.join(index.template_dir, d) for d in deps]
+    base = {"industry_name": "Finance", "region": "EU", "use_cases": ["a"]}
+    cache = BuildCache(cache_dir=str(tmp_path / "cache"))
+    cache.begin_build(base)
+    cache.record("lab.md", cache.check("lab.md", src, variables, dep_paths)[1])
+
+    cache.begin_build(dict(base, use_cases=["b"], primary_color="#fff"))
+    assert cache.check("lab.md", src, variables, dep_paths)[0]
+    cache.begin_build(dict(base, region="US"))
+    assert not cache.check("lab.md", src, variables, dep_paths)[0]
+
+
+def test_include_edit_invalidates_parent(tmp_path):
+    index = _index(tmp_path)
+    entry = next(e for e in index.entries if e["path"].endswith("lab.md"))
+    variables, deps = index.dependencies(entry)
+    src = os.path.join(index.template_dir, entry["path"])
+    dep_paths = [os.path.join(index.template_dir, d) for d in deps]
+    context = {"industry_name": "Finance", "region": "EU"}
+
+    cache = BuildCache(cache_dir=str(tmp_path / "cache"))
+    cache.begin_build(context)
+    cache.record("lab.md", cache.check("lab.md", src, variables, dep_paths)[1])
+    assert cache.check("lab.md", src, variables, dep_paths)[0]
+    _write(dep_paths[0], "Built for {{ region }} (v2)\n")
+    assert not cache.check("lab.md", src, variables, dep_paths)[0]
+
+
+def test_stat_fast_path_and_touch(tmp_path):
+    src = str(tmp_path / "templates" / "lab.md")
+    _write(src, "# {{ industry_name }}\n")
+    cache_dir = str(tmp_path / "cache")
+    cache = BuildCache(cache_dir=cache_dir)
+    cache.begin_build({"industry_name": "Finance"})
+    cache.record("lab.md", cache.check("lab.md", src, ["industry_name"])[1])
+    cache.save()
+
+    warm = BuildCache(cache_dir=cache_dir)
+    warm.begin_build({"industry_name": "Finance"})
+    # Unchanged stat: a hit without reading the template
+    warm.file_digest = None
+    assert warm.check("lab.md", src, ["industry_name"])[0]
+    del warm.file_digest
+
+    # Touched but unchanged: re-verified by content and refreshed in place
+    st = os.stat(src)
+    os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    hit, entry = warm.check("lab.md", src, ["industry_name"])
+    assert hit and entry[3] == st.st_mtime_ns + 10**9 and warm.hashes["lab.md"] == entry
+
+    # Same size, new content: a miss
+    _write(src, "# {{ industry_slug }}\n")
+    assert not warm.check("lab.md", src, ["industry_name"])[0]
+
+
+def test_output_format_bump_invalidates_entries(tmp_path, monkeypatch):
+    src = str(tmp_path / "templates" / "lab.md")
+    _write(src, "# {{ industry_name }}\n")
+    cache = BuildCache(cache_dir=str(tmp_path / "cache"))
+    cache.begin_build({"industry_name": "Finance"})
+    cache.record("lab.md", cache.check("lab.md", src, ["industry_name"])[1])
+    assert cache.check("lab.md", src, ["industry_name"])[0]
+
+    monkeypatch.setattr(build_cache, "OUTPUT_FORMAT", build_cache.OUTPUT_FORMAT + 1)
+    cache.begin_build({"industry_name": "Finance"})
+    assert not cache.check("lab.md", src, ["industry_name"])[0]
+
+
+def test_index_skips_excluded_sessions(tmp_path):
+    index = _index(tmp_path)
+    selected = [e["path"] for e in index.select([1])]
+    assert os.path.join("01_intro", "lab.md") in selected
+    assert os.path.join("02_swarm", "swarm.md") not in selected
+    static = next(e for e in index.entries if e["path"].endswith("swarm.md"))
+    assert static["has_jinja"] is False and static["variables"] == []
+
+
+def test_namespaces_do_not_evict_each_other(tmp_path):
+    index = _index(tmp_path)
+    src = os.path.join(index.template_dir, "01_intro", "lab.md")
+    cache_dir = str(tmp_path / "cache")
+    for namespace, industry in (("finance", "Finance"), ("healthcare", "Healthcare")):
+        cache = BuildCache(cache_dir=cache_dir, namespace=namespace)
+        cache.begin_build({"industry_name": industry})
+        cache.record("lab.md", cache.check("lab.md", src, ["industry_name"])[1])
+        cache.save()
+
+    finance = BuildCache(cache_dir=cache_dir, namespace="finance")
+    finance.begin_build({"industry_name": "Finance"})
+    assert finance.check("lab.md", src, ["industry_name"])[0]
+    finance.invalidate()
+    assert finance.namespaces() == {"healthcare": 1}
+
+
+def test_rendered_and_copied_files_keep_trailing_newline(tmp_path):
+    index = _index(tmp_path)
+    env = make_environment(index.template_dir, bytecode_dir=str(tmp_path / "jinja"))
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    context = {"industry_name": "Finance", "region": "EMEA"}
+    for entry in index.select([1, 2]):
+        dest = str(tmp_path / "dist" / entry["path"])
+        task = {"rel_path": entry["path"], "src": os.path.join(index.template_dir, entry["path"]),
+                "dest": dest, "render": entry["has_jinja"]}
+        assert run_task(task, env, context, blobs)["status"] == ("rendered" if entry["has_jinja"] else "copied")
+    # Both end exactly like their templates; Jinja used to strip the final newline
+    with open(tmp_path / "dist" / "01_intro" / "lab.md") as f:
+        assert f.read() == "# Finance\nBuilt for EMEA\n\n"
+    with open(tmp_path / "dist" / "02_swarm" / "swarm.md") as f:
+        assert f.read() == "# Static swarm notes\n"
+
+
+def test_blob_store_skips_unchanged_outputs(tmp_path):
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    dest = str(tmp_path / "dist" / "lab.md")
+    assert blobs.write_bytes(b"# Finance\n", dest)
+    mtime = os.stat(dest).st_mtime_ns
+    assert not blobs.write_bytes(b"# Finance\n", dest)
+    assert os.stat(dest).st_mtime_ns == mtime
+    assert blobs.write_bytes(b"# Healthcare\n", dest)
+    with open(dest, "rb") as f:
+        assert f.read() == b"# Healthcare\n"
+    with open(blobs.path(blobs.put_bytes(b"# Finance\n")), "rb") as f:
+        assert f.read() == b"# Finance\n"
+
+
+def test_writable_outputs_never_share_the_blob(tmp_path):
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    linked = str(tmp_path / "dist" / "lab.md")
+    data = str(tmp_path / "dist" / "data" / "flagged_expenses.csv")
+    assert blobs.write_bytes(b"id,amount\n", linked)
+    assert blobs.write_bytes(b"id,amount\n", data, link=False)
+    assert not blobs.write_bytes(b"id,amount\n", data, link=False)
+    # A dist file left linked by an earlier build is replaced by a copy
+    os.remove(data)
+    os.link(blobs.path(blobs.put_bytes(b"id,amount\n")), data)
+    assert blobs.write_bytes(b"id,amount\n", data, link=False)
+
+    # The lab rewrites its output in place, as cleaner.py's to_csv does
+    with open(data, "w") as f:
+        f.write("id,amount\n1,99\n")
+    with open(blobs.path(blobs.put_bytes(b"id,amount\n")), "rb") as f:
+        assert f.read() == b"id,amount\n"
+    with open(linked, "rb") as f:
+        assert f.read() == b"id,amount\n"
@@ -0,0 +1,245 @@
+"""
+Context Refiner Tests
+Tests: batch packing -> calibrated packing estimates -> one tagged prompt for several files -> sections patched back by id -> section cache
+       -> streamed sections patched as they complete, stalled streams keep what arrived
+       -> a failed LLM call reaches the worker and the concurrency controller -> and fails its queue job
+"""
+import asyncio
+import os
+import re
+import sys
+
+import pytest
+
+# Ensure project root is on path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core.adaptive_concurrency import AdaptiveConcurrency
+from _factory.core.llm_stream import SectionStreamParser, StreamStalled, stall_guard
+from _factory.core.refinement_queue import RefinementQueue
+from _factory.core.section_cache import SectionCache
+from _factory.core.token_accounting import TokenEstimator
+from _factory.core.worker import InProcessRefiner, TokenBudget, drain_queue, load_refiner_module, refine_file_async
+
+REFINER_SCRIPT = os.path.join(os.path.dirname(__file__), '..', '..', '.agent', 'skills', 'factory', 'context_refiner.py')
+
+LAB = """# Lab {n}
+
+## Introduction
+Generic introduction for lab {n}.
+
+## Business Value
+Generic value statement for lab {n}.
+
+## Step 1
+Run `python3 lab.py`.
+"""
+
+
+class NullLogger:
+    def log(self, event, level="INFO", metadata=None):
+        pass
+
+
+class FailingClient:
+    """Stands in for RefinerClient when every LLM call fails (circuit open, HTTP error, stall)."""
+    model = "test-model"
+    stream = None
+
+    async def call(self, prompt):
+        raise RuntimeError("circuit open for gemini")
+
+    async def aclose(self):
+        pass
+
+
+def failing_refiner(tmp_path, monkeypatch):
+    monkeypatch.setenv("SECTION_CACHE_DIR", str(tmp_path / "cache"))
+    refiner = InProcessRefiner(load_refiner_module(REFINER_SCRIPT), "test-model", 2, NullLogger())
+    refiner.client = FailingClient()
+    return refiner
+
+
+def test_pack_batches_respects_budget():
+    refiner = load_refiner_module(REFINER_SCRIPT)
+    items = [("a", 400), ("b", 400), ("c", 300), ("d", 1500), ("e", 100)]
+    assert refiner.pack_batches(items, 1000) == [["a", "b"], ["c"], ["d"], ["e"]]
+
+
+def test_pack_uses_calibrated_section_estimates(tmp_path, monkeypatch):
+    refiner = failing_refiner(tmp_path, monkeypatch)
+    refiner.estimator = TokenEstimator(path=None)
+    jobs = []
+    for n in (1, 2):
+        path = tmp_path / f"lab_{n}.md"
+        path.write_text(LAB.format(n=n))
+        jobs.append({"id": n, "file_path": str(path), "industry_slug": "logistics", "industry_name": "Logistics"})
+    local = refiner.section_tokens(jobs[0], calibrated=False)
+    assert refiner.section_tokens(jobs[0]) == local
+
+    budget = 2 * local + 1
+    assert [[j["id"] for j in batch] for batch in refiner.pack(jobs, budget)] == [[1, 2]]
+    # The model's real prompt tokens run at twice the local count: the same files no longer share a prompt
+    refiner.estimator.observe(refiner.prompt_key, local, 2 * local)
+    assert refiner.section_tokens(jobs[0]) == 2 * local
+    assert [[j["id"] for j in batch] for batch in refiner.pack(jobs, budget)] == [[1], [2]]
+    asyncio.run(refiner.aclose())
+
+
+def test_refine_batch_patches_each_file_by_section_id(tmp_path):
+    refiner = load_refiner_module(REFINER_SCRIPT)
+    paths = []
+    for n in (1, 2):
+        path = tmp_path / f"lab_{n}.md"
+        path.write_text(LAB.format(n=n))
+        paths.append(str(path))
+    prompts = []
+
+    async def fake_llm(prompt):
+        prompts.append(prompt)
+        tags = re.findall(r"^## SECTION: \[(f\d+:s\d+)\] (.+)$", prompt, re.M)
+        # Answer in a different order, drop f2:s2 and mangle one echoed heading
+        reply = []
+        for section_id, heading in reversed(tags):
+            if section_id == "f2:s2":
+                continue
+            heading = "## Intro" if section_id == "f1:s1" else heading
+            reply.append(f"## SECTION: [{section_id}] {heading}\nRefined {section_id}.\n## END_SECTION")
+        return "\n".join(reply)
+
+    counts = asyncio.run(refiner.refine_batch(paths, "Logistics", "logistics", fake_llm, log=lambda m: None))
+
+    assert len(prompts) == 1
+    assert counts == {paths[0]: 2, paths[1]: 1}
+    first, second = (open(p).read() for p in paths)
+    assert "## Introduction\nRefined f1:s1." in first
+    assert "## Business Value\nRefined f1:s2." in first
+    assert "## Introduction\nRefined f2:s1." in second
+    assert "Generic value statement for lab 2." in second
+    assert "Run `python3 lab.py`." in first and "Run `python3 lab.py`." in second
+
+
+def test_section_cache_only_sends_unseen_sections(tmp_path):
+    refiner = load_refiner_module(REFINER_SCRIPT)
+    cache = SectionCache(str(tmp_path / "cache"))
+    sent = []
+
+    async def fake_llm(prompt):
+        tags = re.findall(r"^## SECTION: \[(f\d+:s\d+)\] (.+)$", prompt, re.M)
+        sent.append([heading for _, heading in tags])
+        return "\n".join(f"## SECTION: [{i}] {h}\nRefined {h[3:]}.\n## END_SECTION" for i, h in tags)
+
+    def render(value_line):
+        path = tmp_path / "lab.md"
+        path.write_text(LAB.format(n=1).replace("Generic value statement for lab 1.", value_line))
+        asyncio.run(refiner.refine_file(str(path), "Logistics", "logistics", fake_llm, tone="Practical & Applied",
+                                        log=lambda m: None, cache=cache, model="test-model"))
+        return path.read_text()
+
+    first = render("Generic value statement for lab 1.")
+    again = render("Generic value statement for lab 1.")
+    edited = render("Edited value statement.")
+
+    assert sent == [["## Introduction", "## Business Value"], ["## Business Value"]]
+    assert first == again
+    assert "## Introduction\nRefined Introduction." in edited
+    assert cache.stats == {"hits": 3, "misses": 3, "stores": 3}
+
+
+def test_stream_parser_handles_split_markers():
+    parser = SectionStreamParser()
+    text = ("Sure!\n## SECTION: [f1:s1] ## Intro\nBody one.\n## END_SECTION\n"
+            "## SECTION: [f1:s2] ## Value\nBody two.\n## SECTION: [f1:s3] ## Last\nBody three.")
+    sections = []
+    for i in range(0, len(text), 7):
+        sections += parser.feed(text[i:i + 7])
+    assert [s["body"] for s in sections] == ["Body one.", "Body two."]
+    assert parser.close() == [{"heading": "[f1:s3] ## Last", "body": "Body three."}]
+
+
+def test_streamed_batch_writes_files_as_sections_complete(tmp_path):
+    refiner = load_refiner_module(REFINER_SCRIPT)
+    paths = []
+    for n in (1, 2):
+        path = tmp_path / f"lab_{n}.md"
+        path.write_text(LAB.format(n=n))
+        paths.append(str(path))
+    seen_mid_stream = []
+
+    async def stream(prompt):
+        tags = re.findall(r"^## SECTION: \[(f\d+:s\d+)\] (.+)$", prompt, re.M)
+        for section_id, heading in tags:
+            if section_id == "f2:s1":
+                # File 1 is complete, so it is already on disk
+                seen_mid_stream.append(open(paths[0]).read())
+            yield f"## SECTION: [{section_id}] {heading}\nStreamed "
+            yield f"{section_id}.\n## END_SECTION\n"
+            if section_id == "f2:s1":
+                break
+        await asyncio.sleep(10)
+        yield "never"
+
+    async def run():
+        async def slow_stream(prompt):
+            async for text in stall_guard(stream(prompt), stall_timeout=0.2):
+                yield text
+        return await refiner.refine_batch(paths, "Logistics", "logistics", None, log=lambda m: None,
+                                          stream=slow_stream)
+
+    counts = asyncio.run(run())
+    assert "Streamed f1:s2." in seen_mid_stream[0]
+    # The stall after f2:s1 keeps the three sections that arrived
+    assert counts == {paths[0]: 2, paths[1]: 1}
+    assert "Generic value statement for lab 2." in open(paths[1]).read()
+
+
+def test_stall_guard_raises():
+    async def quiet():
+        yield "a"
+        await asyncio.sleep(10)
+
+    async def run():
+        return [text async for text in stall_guard(quiet(), stall_timeout=0.05)]
+
+    with pytest.raises(StreamStalled):
+        asyncio.run(run())
+
+
+def test_llm_failure_reaches_worker_and_controller(tmp_path, monkeypatch):
+    refiner = failing_refiner(tmp_path, monkeypatch)
+    path = tmp_path / "lab.md"
+    path.write_text(LAB.format(n=1))
+    slots = AdaptiveConcurrency(2, floor=1, ceiling=4)
+    job = {"id": 1, "file_path": str(path), "industry_slug": "logistics"}
+
+    async def run():
+        try:
+            return await refine_file_async(job, "Logistics", REFINER_SCRIPT, "test-model", slots,
+                                           TokenBudget(100000, 100000), NullLogger(), refiner=refiner)
+        finally:
+            await refiner.aclose()
+
+    result = asyncio.run(run())
+    assert result["status"] == "failed" and "circuit open" in result["error"]
+    assert list(slots._outcomes) == [True]
+    assert path.read_text() == LAB.format(n=1)
+
+
+def test_failed_refinement_fails_the_queue_job(tmp_path, monkeypatch):
+    refiner = failing_refiner(tmp_path, monkeypatch)
+    path = tmp_path / "lab.md"
+    path.write_text(LAB.format(n=1))
+    queue = RefinementQueue(str(tmp_path / "queue.db"))
+    job_id = queue.enqueue("logistics", str(path), "Logistics")
+
+    async def run():
+        try:
+            await drain_queue(queue, "Logistics", REFINER_SCRIPT, "test-model",
+                              {"total_tokens": 100000, "defer_after_tokens": 100000}, NullLogger(), refiner=refiner)
+        finally:
+            await refiner.aclose()
+
+    asyncio.run(run())
+    row = queue.conn.execute("SELECT status, error, attempts FROM jobs WHERE id=?", (job_id,)).fetchone()
+    assert row["status"] == "failed" and "circuit open" in row["error"] and row["attempts"] == 1
+    assert queue.stats()["failed"] == 1 and queue.stats()["done"] == 0
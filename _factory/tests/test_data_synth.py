@@ -0,0 +1,136 @@
+"""
+Data Synth Tests
+Tests: concurrent chunks -> chunks fit the output limit -> truncated rows regenerated -> header/ID reconciliation -> dirty pass -> written CSVs -> id column numbering -> cached spec mode
+"""
+import csv
+import os
+import re
+import sys
+import threading
+import time
+
+# Ensure project root is on path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core.data_synth import synthesize, chunk_ranges, rows_per_chunk, _chunk_prompt
+from _factory.core.data_spec import synthesize_from_spec
+
+COLUMNS = ["id", "date", "category", "value", "notes", "status"]
+
+
+def test_chunks_run_concurrently_and_merge(tmp_path):
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def fake_llm(prompt):
+        first, last = map(int, re.search(r"from (\d+) to (\d+)", prompt).groups())
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        # Preamble, a header, and ids that collide with the first chunk
+        lines = ["Here is your CSV:", ",".join(COLUMNS)]
+        for i in range(first, last + 1):
+            row_id = i if first == 1 else i - first + 1
+            lines.append(f"{row_id},2024-01-{i % 28 + 1:02d},Freight,{i * 10}.50,Routine shipment,Open")
+        return "\n".join(lines)
+
+    assert chunk_ranges(450, 200) == [(1, 200), (201, 200), (401, 50)]
+    result = synthesize("logistics", "Logistics", COLUMNS, 0.2, 450, str(tmp_path), fake_llm,
+                        chunk_rows=100, concurrency=3)
+
+    assert peak[0] == 3
+    assert result["rows"] == 450 and result["chunks"] == 5
+    assert sum(result["dirty"].values()) == 90
+
+    for name in ("dirty_data.csv", "corporate_expenses.csv"):
+        with open(tmp_path / name, newline="") as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == COLUMNS
+        assert len(rows) == 451
+        assert all(len(r) == len(COLUMNS) for r in rows)
+
+    # Apart from injected duplicates every id is unique
+    ids = [r[0] for r in rows[1:]]
+    assert len(set(ids)) >= 450 - result["dirty"]["duplicate"]
+
+
+def test_chunks_fit_the_output_token_limit():
+    assert rows_per_chunk(COLUMNS) == 100
+    assert rows_per_chunk(COLUMNS + ["region", "owner", "amount", "due_date"]) == 61
+    assert rows_per_chunk(COLUMNS, chunk_rows=40) == 40
+
+
+def test_truncated_rows_are_regenerated(tmp_path):
+    calls = []
+
+    def fake_llm(prompt):
+        first, last = map(int, re.search(r"from (\d+) to (\d+)", prompt).groups())
+        calls.append((first, last))
+        lines = [",".join(COLUMNS)]
+        lines += [f"{i},2024-01-{i % 28 + 1:02d},Freight,{i}.50,Routine shipment,Open" for i in range(first, last + 1)]
+        if len(calls) <= 2:
+            # The response hit the output limit part-way through its last row
+            lines[-1] = lines[-1][:18]
+        return "\n".join(lines)
+
+    result = synthesize("logistics", "Logistics", COLUMNS, 0.0, 30, str(tmp_path), fake_llm, chunk_rows=10,
+                        concurrency=1)
+    with open(tmp_path / "dirty_data.csv", newline="") as f:
+        rows = list(csv.reader(f))[1:]
+
+    assert result["rows"] == 30 and len(rows) == 30
+    assert all(len(r) == len(COLUMNS) and all(r) for r in rows)
+    # Two chunks lost their last row; the first top-up round replaced both
+    assert calls[3:] == [(29, 30)]
+    assert len({r[0] for r in rows}) == 30
+
+
+def test_prompt_numbers_only_the_id_column(tmp_path):
+    prompt = _chunk_prompt("Retail", ["date", "order_id", "value"], 201, 50)
+    assert "Number the order_id column sequentially from 201 to 250." in prompt
+    assert "Number the" not in _chunk_prompt("Retail", ["date", "region", "value"], 1, 50)
+
+    def fake_llm(prompt):
+        return "\n".join(["date,region,value"] + [f"2024-01-0{i % 9 + 1},North,7" for i in range(20)])
+
+    result = synthesize("retail", "Retail", ["date", "region", "value"], 0.0, 20, str(tmp_path), fake_llm)
+    with open(tmp_path / "dirty_data.csv", newline="") as f:
+        rows = list(csv.reader(f))
+    # No id column, so the first column is left as the model wrote it
+    assert result["rows"] == 20 and rows[1][0] == "2024-01-01"
+
+
+def test_spec_mode_caches_spec_and_is_reproducible(tmp_path):
+    calls = []
+
+    def fake_llm(prompt):
+        calls.append(prompt)
+        return {
+            "id": {"type": "id", "prefix": "TX-"},
+            "value": {"type": "float", "min": 10, "max": 500, "distribution": "lognormal"},
+            "category": {"type": "category", "values": ["Freight", "Customs"], "weights": [3, 1]},
+            "notes": {"type": "bogus"},
+        }
+
+    spec_dir = str(tmp_path / "specs")
+    outputs = []
+    for build in ("a", "b"):
+        result = synthesize_from_spec("logistics", "Logistics", COLUMNS, 0.2, 2000, str(tmp_path / build),
+                                      fake_llm, spec_dir=spec_dir)
+        assert result["rows"] == 2000
+        assert sum(result["dirty"].values()) == 400
+        outputs.append((tmp_path / build / "dirty_data.csv").read_bytes())
+
+    # One LLM call for the spec; the second build reuses it and reproduces the table
+    assert len(calls) == 1
+    assert outputs[0] == outputs[1]
+    with open(tmp_path / "a" / "dirty_data.csv", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == COLUMNS and len(rows) == 2001
+    assert rows[1][0].startswith("TX-")
+    # Category cells come from the vocabulary, apart from blanks, case changes and swapped letters
+    vocabulary = {"".join(sorted("freight")), "".join(sorted("customs")), ""}
+    assert {"".join(sorted(r[2].lower())) for r in rows[1:]} <= vocabulary
@@ -0,0 +1,149 @@
+"""
+HTTP Client Tests
+Tests: Retry-After honoured -> retries exhausted, charged once -> circuit opens and fails fast -> 4xx not retried -> pooled connection reuse -> streamed lines
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Ensure project root is on path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core.http_client import (
+    AsyncHttpClient, CircuitOpenError, HttpClient, HttpError, RetryPolicy, breaker, parse_retry_after,
+)
+from _factory.core.rate_limiter import limiter
+
+FAST = RetryPolicy(attempts=3, base_delay=0.01, max_delay=0.05)
+
+
+@pytest.fixture
+def stub():
+    """Local server answering POSTs from a script of (status, headers) tuples; the last entry repeats."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            server.calls += 1
+            server.ports.add(self.client_address[1])
+            status, headers = server.script[min(server.calls, len(server.script)) - 1]
+            body = json.dumps({"ok": status < 400, "call": server.calls}).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.calls, server.ports, server.script = 0, set(), [(200, {})]
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1/generate"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+
+def test_retry_after_then_success_on_one_connection(stub):
+    stub.script = [(429, {"Retry-After": "0"}), (503, {}), (200, {})]
+    throttles = limiter().stats()["throttled"]
+    client = HttpClient(retry=FAST)
+    try:
+        assert client.post_json(stub.url, {"q": 1}, provider="stub-retry") == {"ok": True, "call": 3}
+        for _ in range(3):
+            client.post_json(stub.url, {"q": 2}, provider="stub-retry")
+    finally:
+        client.close()
+    assert stub.calls == 6
+    # Error responses with a body do not cost the keep-alive connection
+    assert len(stub.ports) == 1
+    assert breaker("stub-retry").state == "closed"
+    # Only the 429 slowed the rate limiter down
+    assert limiter().stats()["throttled"] == throttles + 1
+
+
+def test_retries_exhausted_and_client_errors_not_retried(stub):
+    limiter().configure({"stub-exhaust": {"tpm": 60000}})
+    bucket = limiter().limits["stub-exhaust"].tokens
+    client = HttpClient(retry=FAST)
+    try:
+        stub.script = [(500, {}), (200, {})]
+        level = bucket.level
+        client.post_json(stub.url, {}, provider="stub-exhaust", tokens=1000)
+        # The failed attempt gave its tokens back: the request is charged once
+        assert level - bucket.level == pytest.approx(1000, abs=50)
+
+        stub.calls, stub.script = 0, [(500, {})]
+        level = bucket.level
+        with pytest.raises(HttpError) as error:
+            client.post_json(stub.url, {}, provider="stub-exhaust", tokens=1000)
+        assert error.value.status == 500
+        assert stub.calls == FAST.attempts
+        assert bucket.level >= level
+
+        stub.calls, stub.script = 0, [(400, {})]
+        with pytest.raises(HttpError):
+            client.post_json(stub.url, {}, provider="stub-exhaust")
+        assert stub.calls == 1
+    finally:
+        client.close()
+
+
+def test_circuit_opens_then_recovers_after_trial(stub):
+    stub.script = [(502, {})]
+    circuit = breaker("stub-circuit")
+    circuit.failure_threshold, circuit.reset_after = 2, 0.2
+
+    async def run():
+        client = AsyncHttpClient(retry=FAST)
+        try:
+            with pytest.raises(CircuitOpenError):
+                await client.post_json(stub.url, {}, provider="stub-circuit")
+            calls = stub.calls
+            # Open: later calls fail fast without reaching the server
+            with pytest.raises(CircuitOpenError):
+                await client.post_json(stub.url, {}, provider="stub-circuit")
+            assert stub.calls == calls == 2
+
+            await asyncio.sleep(0.25)
+            assert circuit.state == "half-open"
+            stub.script = [(200, {})]
+            stub.calls = 0
+            assert (await client.post_json(stub.url, {}, provider="stub-circuit"))["ok"]
+            assert circuit.state == "closed"
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_stream_lines_retries_before_first_byte(stub):
+    stub.script = [(503, {}), (200, {})]
+
+    async def run():
+        client = AsyncHttpClient(retry=FAST)
+        try:
+            return [line async for line in client.stream_lines(stub.url, {}, provider="stub-stream")]
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == ['{"ok": true, "call": 2}']
@@ -0,0 +1,94 @@
+"""
+Rate Limiter Tests
+Tests: request bucket paces bursts -> token estimates settled against real counts -> 429 slows down and pauses -> recovery -> unlimited providers pass -> reconfiguring keeps learned rates
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Ensure project root is on path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core import rate_limiter
+from _factory.core.rate_limiter import RateLimiter
+
+
+def test_request_bucket_paces_a_burst():
+    # 600 rpm: a full bucket holds 60 requests, refilled at 9 per second
+    limiter = RateLimiter({"gemini": {"rpm": 600}})
+
+    async def burst():
+        await asyncio.gather(*(limiter.aacquire("gemini", "flash") for _ in range(62)))
+
+    t0 = time.monotonic()
+    asyncio.run(burst())
+    elapsed = time.monotonic() - t0
+    assert 0.15 <= elapsed < 1.0
+    assert limiter.stats()["calls"] == 62 and limiter.stats()["waits"] == 2
+
+
+def test_model_limits_and_settle():
+    limiter = RateLimiter({"gemini": {"rpm": 10 ** 6}, "gemini/pro": {"tpm": 6000}})
+    bucket = limiter.limits["gemini/pro"].tokens
+    limiter.acquire("gemini", "pro", tokens=500)
+    assert round(bucket.level) == 100
+    # The provider counted far fewer tokens than estimated: the difference is credited back
+    limiter.settle("gemini", "pro", 500, (80, 20))
+    assert round(bucket.level) == 500
+    limiter.settle("gemini", "pro", 100, None)
+    assert round(bucket.level) == 500
+    # Other models only share the provider's limits
+    limiter.acquire("gemini", "flash", tokens=10 ** 6)
+    assert round(bucket.level) == 500
+
+
+def test_throttle_pauses_then_recovers(monkeypatch):
+    limiter = RateLimiter({"gemini": {"rpm": 1000, "tpm": 100000}})
+    limiter.throttled("gemini", "flash", retry_after=0.2)
+    assert limiter.stats()["rates"]["gemini"] == {"rpm": 500, "tpm": 50000}
+
+    t0 = time.monotonic()
+    limiter.acquire("gemini", "flash", tokens=10)
+    assert time.monotonic() - t0 >= 0.19
+
+    # Successes inside the quiet period change nothing; after it, rates climb back to the configured limit
+    limiter.succeeded("gemini", "flash")
+    assert limiter.stats()["rates"]["gemini"]["rpm"] == 500
+    monkeypatch.setattr(rate_limiter, "RECOVER_AFTER", 0.0)
+    for _ in range(10):
+        limiter.succeeded("gemini", "flash")
+    assert limiter.stats()["rates"]["gemini"] == {"rpm": 1000, "tpm": 100000}
+    assert limiter.limits["gemini"].throttled_at is None
+
+
+def test_unlimited_provider_passes_until_throttled():
+    limiter = RateLimiter({})
+    t0 = time.monotonic()
+    for _ in range(1000):
+        limiter.acquire("ollama", "qwen", tokens=10 ** 6)
+    assert time.monotonic() - t0 < 0.5
+    limiter.throttled("ollama", "qwen", retry_after=0.1)
+    t0 = time.monotonic()
+    limiter.acquire("ollama", "qwen")
+    assert time.monotonic() - t0 >= 0.09
+    assert limiter.stats()["rates"] == {}
+
+
+def test_reconfigure_keeps_learned_rates_and_leaves_environ(monkeypatch):
+    monkeypatch.delenv(rate_limiter.LIMITS_ENV, raising=False)
+    limiter = RateLimiter({"gemini": {"rpm": 600, "tpm": 100000}})
+    limiter.throttled("gemini", retry_after=0)
+    assert limiter.stats()["rates"]["gemini"] == {"rpm": 300, "tpm": 50000}
+
+    # Every new compiler reapplies its manifest's limits
+    limiter.configure({"gemini": {"rpm": 600, "tpm": 100000}})
+    assert limiter.stats()["rates"]["gemini"] == {"rpm": 300, "tpm": 50000}
+    limiter.configure({"gemini": {"rpm": 900, "tpm": 100000}})
+    assert limiter.stats()["rates"]["gemini"] == {"rpm": 900, "tpm": 100000}
+
+    monkeypatch.setattr(rate_limiter, "_limiter", limiter)
+    env = rate_limiter.child_env({"PATH": "/bin"})
+    assert json.loads(env[rate_limiter.LIMITS_ENV]) == {"gemini": {"rpm": 900, "tpm": 100000}}
+    assert rate_limiter.LIMITS_ENV not in os.environ
@@ -0,0 +1,155 @@
+"""
+Refinement Queue Tests
+Tests: atomic leased claims -> heartbeat renews -> expired / dead-owner / pre-lease jobs reclaimed -> killed worker resumes without redoing finished jobs -> a lost lease cannot write results -> bulk enqueue / batch claims -> trigger-kept counts -> industry-scoped queues
+"""
+import os
+import subprocess
+import sys
+import time
+
+# Ensure project root is on path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core.refinement_queue import HOSTNAME, RefinementQueue
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def fill(queue, count):
+    return [queue.enqueue("retail", f"/tmp/lab_{i}.md", "Retail") for i in range(count)]
+
+
+def test_claims_are_leased_and_exclusive(tmp_path):
+    db = str(tmp_path / "queue.db")
+    first, second = RefinementQueue(db), RefinementQueue(db)
+    ids = fill(first, 3)
+    a, b = first.claim_next(), second.claim_next()
+    assert (a["id"], b["id"]) == (ids[0], ids[1])
+    assert a["lease_owner"] == first.owner and a["attempts"] == 1
+    # A claimed job cannot be claimed again
+    assert second.claim(ids[0]) is None
+    assert second.claim(ids[2])["lease_owner"] == second.owner
+    assert first.claim_next() is None
+
+    before = first._get(ids[0])["lease_expires"]
+    time.sleep(0.01)
+    assert first.heartbeat() == 1
+    assert first._get(ids[0])["lease_expires"] > before
+
+
+def test_reclaim_expired_dead_and_legacy(tmp_path):
+    db = str(tmp_path / "queue.db")
+    queue = RefinementQueue(db)
+    expired, dead, live, legacy = fill(queue, 4)
+    queue.claim(expired, lease=-1)
+    queue.claim(dead)
+    queue.conn.execute("UPDATE jobs SET lease_owner=? WHERE id=?", (f"{HOSTNAME}:999999999:x", dead))
+    queue.claim(live)
+    queue.conn.execute("UPDATE jobs SET status='in_progress' WHERE id=?", (legacy,))
+    queue.conn.commit()
+
+    reopened = RefinementQueue(db)
+    assert reopened.reclaimed == 3
+    assert reopened._get(live)["status"] == "in_progress"
+    assert [reopened.claim_next()["id"] for _ in range(3)] == [expired, dead, legacy]
+
+
+def test_killed_worker_resumes_without_redoing_finished_jobs(tmp_path):
+    db = str(tmp_path / "queue.db")
+    ids = fill(RefinementQueue(db), 5)
+    # A worker finishes two jobs, holds a third, and is killed
+    script = (
+        "import os, sys\n"
+        f"sys.path.insert(0, {ROOT!r})\n"
+        "from _factory.core.refinement_queue import RefinementQueue\n"
+        f"queue = RefinementQueue({db!r})\n"
+        "for _ in range(2):\n"
+        "    queue.mark_done(queue.claim_next()['id'])\n"
+        "queue.claim_next()\n"
+        "os._exit(9)\n"
+    )
+    assert subprocess.run([sys.executable, "-c", script]).returncode == 9
+
+    queue = RefinementQueue(db)
+    assert queue.reclaimed == 1
+    assert queue.stats() == {"pending": 3, "done": 2, "failed": 0, "in_progress": 0, "total": 5}
+    resumed = [queue.claim_next()["id"] for _ in range(3)]
+    assert resumed == ids[2:]
+    assert queue._get(ids[2])["attempts"] == 2
+
+
+def test_expired_holder_cannot_overwrite_new_owner(tmp_path):
+    db = str(tmp_path / "queue.db")
+    stale, fresh = RefinementQueue(db), RefinementQueue(db)
+    job_id = fill(stale, 1)[0]
+    stale.claim(job_id, lease=-1)
+    assert fresh.reclaim_expired() == 1
+    assert fresh.claim_next()["id"] == job_id
+
+    # The first worker finishes late: every write is refused
+    assert not stale.mark_done(job_id)
+    assert not stale.mark_failed(job_id, "late")
+    assert not stale.reset_to_pending(job_id)
+    assert stale._get(job_id)["status"] == "in_progress"
+    assert fresh.mark_failed(job_id, "boom")
+    assert fresh._get(job_id)["error"] == "boom" and not stale.mark_done(job_id)
+
+
+def test_enqueue_many_and_claim_batch(tmp_path):
+    db = str(tmp_path / "queue.db")
+    first, second = RefinementQueue(db), RefinementQueue(db)
+    held = first.enqueue("retail", "/tmp/lab_1.md", "Retail")
+    ids = first.enqueue_many([("retail", f"/tmp/lab_{i}.md", "Retail") for i in (0, 1, 2, 0, 3)])
+    # Files already queued, in the store or earlier in the same call, reuse their job
+    assert ids[1] == held and ids[3] == ids[0] and len(set(ids)) == 4
+
+    a, b = first.claim_batch(2), second.claim_batch(5)
+    assert [job["id"] for job in a] == [held, ids[0]]
+    assert [job["id"] for job in b] == [ids[2], ids[4]]
+    assert all(job["lease_owner"] == second.owner and job["attempts"] == 1 for job in b)
+    assert first.claim_batch(3) == [] and first.claim_next() is None
+
+
+def test_counts_follow_every_change(tmp_path):
+    db = str(tmp_path / "queue.db")
+    queue = RefinementQueue(db)
+    ids = fill(queue, 6)
+    queue.claim_batch(4)
+    queue.mark_done(ids[0])
+    queue.mark_failed(ids[1], "boom")
+    queue.reset_to_pending(ids[2])
+    queue.clear_done()
+    expected = {"pending": 3, "in_progress": 1, "done": 0, "failed": 1, "total": 5}
+    assert queue.stats() == expected and queue.pending_count() == 3
+
+    # A queue from before the counters existed is counted when first opened
+    queue.conn.executescript("DROP TRIGGER jobs_count_insert; DROP TABLE job_counts;")
+    queue.conn.execute("INSERT INTO jobs (industry_slug, file_path, industry_name, status) VALUES ('r','/x','R','failed')")
+    queue.conn.commit()
+    assert RefinementQueue(db).stats() == dict(expected, failed=2, total=6)
+
+    # Later opens trust the triggers and only read: they succeed while another writer holds the lock
+    queue.conn.execute("BEGIN IMMEDIATE")
+    try:
+        assert RefinementQueue(db).stats() == dict(expected, failed=2, total=6)
+    finally:
+        queue.conn.rollback()
+
+
+def test_industry_scope_limits_claims_counts_and_clears(tmp_path):
+    db = str(tmp_path / "queue.db")
+    shared = RefinementQueue(db)
+    retail = shared.enqueue_many([("retail", f"/tmp/retail_{i}.md", "Retail") for i in range(3)])
+    finance = shared.enqueue_many([("finance", f"/tmp/finance_{i}.md", "Finance") for i in range(2)])
+
+    scoped = RefinementQueue(db, industries=["finance"])
+    assert scoped.pending_count() == 2 and shared.pending_count() == 5
+    assert [job["id"] for job in scoped.claim_batch(5)] == finance
+    assert scoped.claim_next() is None
+    for job_id in finance:
+        scoped.mark_done(job_id)
+    shared.mark_done(shared.claim_next()["id"])
+    scoped.clear_done()
+    assert scoped.stats()["total"] == 0
+    assert shared.stats() == {"pending": 2, "in_progress": 0, "done": 1, "failed": 0, "total": 3}
+    assert RefinementQueue(db, industries=["retail", "finance"]).claim_next()["id"] == retail[1]
@@ -0,0 +1,78 @@
+"""
+Stage Graph Tests
+Tests: dependency order -> concurrent independent stages -> critical path -> emitted outputs start consumers early -> cycle detection
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Ensure project root is on path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core.stage_graph import StageGraph, StageError
+
+
+def test_independent_stages_overlap_and_critical_path():
+    started = {}
+    both_running = threading.Barrier(2, timeout=2)
+
+    def stage(name, sleep=0.0, barrier=False):
+        def run():
+            started[name] = time.perf_counter()
+            if barrier:
+                both_running.wait()
+            time.sleep(sleep)
+        return run
+
+    graph = StageGraph(max_workers=4)
+    graph.add("dna", stage("dna", 0.05, barrier=True), outputs=("dna",))
+    graph.add("synth", stage("synth", 0.01, barrier=True), outputs=("data",))
+    graph.add("pass1", stage("pass1"), inputs=("dna", "data"), outputs=("markdown",))
+    report = graph.run()
+
+    assert started["pass1"] >= max(started["dna"], started["synth"])
+    assert report["critical_path"] == ["dna", "pass1"]
+    assert [r["name"] for r in report["stages"]][-1] == "pass1"
+
+
+def test_emitted_output_starts_its_consumer_before_the_producer_ends():
+    docs_ran = threading.Event()
+    order = []
+
+    graph = StageGraph(max_workers=4)
+
+    def pass2():
+        graph.emit("refined_01")
+        # Session 01's documentation runs while the rest of Pass 2 is still going
+        assert docs_ran.wait(timeout=2)
+        order.append("pass2")
+
+    def docs(session):
+        def run():
+            order.append(f"docs_{session}")
+            if session == "01":
+                docs_ran.set()
+        return run
+
+    graph.add("pass2", pass2, outputs=("refined", "refined_01", "refined_02"))
+    graph.add("docs_01", docs("01"), inputs=("refined_01",))
+    graph.add("docs_02", docs("02"), inputs=("refined_02",))
+    graph.run()
+
+    assert order == ["docs_01", "pass2", "docs_02"]
+
+
+def test_cycle_and_missing_input_are_rejected():
+    graph = StageGraph()
+    graph.add("a", lambda: None, inputs=("b_out",), outputs=("a_out",))
+    graph.add("b", lambda: None, inputs=("a_out",), outputs=("b_out",))
+    with pytest.raises(StageError, match="Cycle"):
+        graph.run()
+
+    graph = StageGraph()
+    graph.add("pass2", lambda: None, inputs=("markdown",))
+    with pytest.raises(StageError, match="no stage produces"):
+        graph.run()
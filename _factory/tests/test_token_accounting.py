@@ -0,0 +1,69 @@
+"""
+Token Accounting Tests
+Tests: provider usage parsing -> estimator calibration persisted -> budget reserves estimates, charges real counts -> shared budget reports per industry
+"""
+import os
+import sys
+
+# Ensure project root is on path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core.token_accounting import TokenEstimator, local_count, usage_from_gemini, usage_from_ollama
+from _factory.core.worker import TokenBudget, parse_usage
+
+TEXT = "Refine the introduction for the logistics industry. " * 20
+
+
+def test_usage_parsing():
+    assert usage_from_gemini({"promptTokenCount": 120, "candidatesTokenCount": 40}) == (120, 40)
+    assert usage_from_gemini(None) is None
+    assert usage_from_ollama({"prompt_eval_count": 90, "eval_count": 30, "done": True}) == (90, 30)
+    assert usage_from_ollama({"eval_count": 30}) == (0, 30)
+    assert usage_from_ollama({"done": True}) is None
+    assert parse_usage('✨ Refining lab.md\nTOKEN_USAGE {"input_tokens": 5, "output_tokens": 2, "calls": 1}') == \
+        {"input_tokens": 5, "output_tokens": 2, "calls": 1}
+    assert parse_usage('TOKEN_USAGE {"input_tokens": 5, "output_tokens": 2, "calls": 1, "exact": false}') is None
+
+
+def test_estimator_learns_from_real_counts(tmp_path):
+    path = str(tmp_path / "calibration.json")
+    estimator = TokenEstimator(path)
+    baseline = local_count(TEXT)
+    assert estimator.estimate(TEXT, "qwen:refine", prior=2.0) == baseline * 2
+
+    # The provider keeps reporting 3x the local count
+    for _ in range(20):
+        estimator.observe("qwen:refine", TEXT, baseline * 3)
+    estimator.save()
+    reloaded = TokenEstimator(path)
+    assert abs(reloaded.estimate(TEXT, "qwen:refine") - baseline * 3) <= 1
+    assert reloaded.estimate(TEXT, "other") == baseline
+
+
+def test_budget_reserves_estimates_and_charges_actuals(tmp_path):
+    budget = TokenBudget(total_tokens=1000, defer_after_tokens=1000,
+                         estimator=TokenEstimator(str(tmp_path / "calibration.json")))
+    assert budget.reserve(600)
+    # A second job that could overrun the total waits for the next run
+    assert not budget.reserve(500)
+    charged = budget.settle(600, {"input_tokens": 150, "output_tokens": 50, "calls": 1}, "m:refine", 100)
+    assert charged == 200 and budget.reserved_tokens == 0
+    assert budget.reserve(500)
+    # No counts came back: the estimate is charged and reported as such
+    assert budget.settle(500, None) == 500
+    assert budget.stats()["used"] == 700
+    assert (budget.input_tokens, budget.output_tokens, budget.estimated_tokens) == (150, 50, 500)
+    assert budget.estimator.factor("m:refine") == 2.0
+
+
+def test_shared_budget_reports_each_industry(tmp_path):
+    budget = TokenBudget(total_tokens=10 ** 6, defer_after_tokens=10 ** 6,
+                         estimator=TokenEstimator(str(tmp_path / "calibration.json")))
+    budget.reserve(300)
+    budget.settle(100, {"input_tokens": 80, "output_tokens": 20, "calls": 1}, industry="retail")
+    budget.settle(100, {"input_tokens": 30, "output_tokens": 10, "calls": 1}, industry="finance")
+    budget.settle(100, None, industry="retail")
+    assert budget.usage_for("retail") == {"input": 80, "output": 20, "estimated": 100}
+    assert budget.usage_for("finance") == {"input": 30, "output": 10, "estimated": 0}
+    assert budget.usage_for("legal") == {"input": 0, "output": 0, "estimated": 0}
+    assert budget.stats()["used"] == 240
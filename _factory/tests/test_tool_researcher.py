@@ -0,0 +1,68 @@
+"""
+Tool Researcher Tests
+Tests: one search per use case -> searches run concurrently -> results merged and deduplicated -> single async curation call
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+# Ensure project root is on path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from _factory.core import tool_researcher
+from _factory.core.session_planner import aplan_sessions
+
+
+def test_research_fans_out_per_use_case(monkeypatch):
+    queries, in_flight, peak = [], [0], [0]
+    lock = threading.Lock()
+
+    def fake_search(query, mode="general", max_results=5):
+        with lock:
+            queries.append(query)
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        if "audit" in query:
+            raise RuntimeError("search backend down")
+        return {"source": "searxng", "answer": "", "results": [
+            {"title": "n8n", "url": "https://n8n.io", "content": "Workflow automation"},
+            {"title": query[:20], "url": query, "content": "Use case result"},
+        ]}
+
+    monkeypatch.setattr(tool_researcher, "_import_search", lambda: fake_search)
+    prompts = []
+
+    async def fake_llm(prompt):
+        prompts.append(prompt)
+        return {"tools": [{"name": "n8n"}]}
+
+    use_cases = ["fraud detection", "invoice matching", "audit trails"]
+    tools = asyncio.run(tool_researcher.aresearch_tools("Finance", use_cases, fake_llm, concurrency=3))
+
+    assert tools == [{"name": "n8n"}]
+    assert len(queries) == 3 and peak[0] == 3
+    assert len(prompts) == 1
+    # The shared hit appears once; the failed search is skipped
+    assert prompts[0].count("- n8n: Workflow automation") == 1
+    assert prompts[0].count("Use case result") == 2
+    assert "Use Cases: fraud detection, invoice matching, audit trails" in prompts[0]
+
+
+def test_research_without_search_and_async_planning(monkeypatch):
+    def no_search():
+        raise ImportError("requests")
+
+    monkeypatch.setattr(tool_researcher, "_import_search", no_search)
+
+    async def fake_llm(prompt):
+        return None
+
+    tools = asyncio.run(tool_researcher.aresearch_tools("Finance", [], fake_llm))
+    plan = asyncio.run(aplan_sessions({"marketMaturityScore": 30}, tools, fake_llm))
+    assert tools == []
+    assert plan["total_sessions"] == 8 and len(plan["sessions"]) == 8
@@ -2,13 +2,17 @@ import streamlit as st
 import os
 import yaml
 import subprocess
-import time
 import sys
 import json
 from pathlib import Path
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
+try:
+    from _factory.core.build_server import ensure_server, submit_build, submit_timeline, job_status, cancel_job
+except ImportError:
+    from core.build_server import ensure_server, submit_build, submit_timeline, job_status, cancel_job
+
 st.set_page_config(page_title="AI Curriculum Factory | Control Tower", layout="wide", page_icon="🛡️")
 st.title("🛡️ Curriculum Factory | Mission Control")
 st.markdown("---")
@@ -23,6 +27,46 @@ def load_catalog():
     return data.get("courses", [])
 
 
+@st.fragment(run_every=1)
+def build_monitor():
+    """Poll the build server for the submitted job without blocking the rest of the page."""
+    job_id = st.session_state.get("build_job")
+    if not job_id:
+        return
+    job = job_status(job_id)
+    if job is None:
+        st.warning("The build server no longer knows this job (was it restarted?).")
+        return
+    if job["status"] in ("queued", "running"):
+        stage = job["stage"] or "waiting"
+        st.info(f"[{job['status'].upper()}] {job['label']} · stage: {stage} · {job['last_event'] or 'queued'}")
+        if st.button("⛔ Cancel Build", key=f"cancel_{job_id}"):
+            cancel_job(job_id)
+    elif job["status"] == "done":
+        st.success(f"Build for '{job['label']}' completed successfully!")
+        if not st.session_state.get(f"celebrated_{job_id}"):
+            st.session_state[f"celebrated_{job_id}"] = True
+            st.balloons()
+    elif job["status"] == "cancelled":
+        st.warning(f"Build for '{job['label']}' was cancelled.")
+    else:
+        st.error(f"Build failed: {job['error']}. Check the Mission Feed for details.")
+
+
+@st.fragment(run_every=2)
+def timeline_monitor():
+    job_id = st.session_state.get("timeline_job")
+    if not job_id:
+        return
+    job = job_status(job_id)
+    if job is None or job["status"] == "failed":
+        st.error("Failed to generate timeline.")
+    elif job["status"] == "done":
+        st.markdown(job["result"]["markdown"])
+    else:
+        st.info("Extracting DNA Milestone...")
+
+
 # Sidebar
 st.sidebar.header("🚀 Mission Configuration")
 engine_mode = st.sidebar.selectbox("LLM Engine", ["Local (Ollama)", "Turbo (Gemini)"], index=0)
@@ -193,33 +237,14 @@ with tab1:
         with open(manifest_path, 'w') as f:
             yaml.dump(manifest_data, f)
 
-        if os.path.exists("_factory/logs/events.jsonl"):
-            os.remove("_factory/logs/events.jsonl")
-
         st.info(f"Launching Build: {industry} | {len(sessions)} sessions | {mode_val.upper()} mode")
 
-        with st.spinner("Factory Engine Running..."):
-            compiler_path = "_factory/factory_compiler.py"
-            env = os.environ.copy()
-            process = subprocess.Popen(
-                [sys.executable, compiler_path, manifest_path, "--mode", mode_val],
-                env=env
-            )
-            log_placeholder = st.empty()
-            while process.poll() is None:
-                if os.path.exists("_factory/logs/events.jsonl"):
-                    with open("_factory/logs/events.jsonl", "r") as f:
-                        lines = f.readlines()
-                        if lines:
-                            last_event = json.loads(lines[-1])
-                            log_placeholder.info(f"Current Activity: {last_event['event']}")
-                time.sleep(1)
-
-            if process.returncode == 0:
-                st.success(f"Build for '{industry}' completed successfully!")
-                st.balloons()
-            else:
-                st.error("Build failed. Check the Mission Feed for details.")
+        if ensure_server():
+            st.session_state['build_job'] = submit_build(manifest_data, mode=mode_val)["id"]
+        else:
+            st.error("Could not start the build server. See _factory/logs/build_server.log.")
+
+    build_monitor()
 
 with tab2:
     st.subheader("Live Mission Feed (Telemetry)")
@@ -235,18 +260,11 @@ with tab2:
 with tab3:
     st.subheader(f"Historical Evolution: {industry}")
     if st.button("Generate Timeline"):
-        from _factory.core.compiler import FactoryCompiler
-        temp_manifest = "_factory/manifests/temp.yaml"
-        with open(temp_manifest, 'w') as f:
-            yaml.dump({"industry": industry}, f)
-        comp = FactoryCompiler(temp_manifest, engine_mode=mode_val)
-        with st.spinner("Extracting DNA Milestone..."):
-            prompt = f"Generate a 2011-2026 AI evolution timeline for {industry}. Markdown table: Year | Milestone | Impact."
-            content = comp.call_llm(prompt)
-            if content:
-                st.markdown(content)
-            else:
-                st.error("Failed to generate timeline.")
+        if ensure_server():
+            st.session_state['timeline_job'] = submit_timeline(industry, mode=mode_val)["id"]
+        else:
+            st.error("Could not start the build server. See _factory/logs/build_server.log.")
+    timeline_monitor()
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("**Status:** Operational")
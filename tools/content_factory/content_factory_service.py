@@ -1,9 +1,20 @@
 import os
+import sys
 from pathlib import Path
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+try:
+    from _factory.core.rate_limiter import limiter
+    from _factory.core.token_accounting import local_count
+except ImportError:
+    limiter = None
 
 class DiagramOpportunity(BaseModel):
     title: str
@@ -40,6 +51,26 @@ class ContentFactoryService:
         3. Maintain a professional, enterprise-focused tone.
         """
 
+    def _generate(self, prompt: str, config: types.GenerateContentConfig):
+        """generate_content behind the factory's shared Gemini rate limits."""
+        if limiter is None:
+            return self.client.models.generate_content(model=self.model_id, contents=prompt, config=config)
+        tokens = local_count(prompt)
+        limiter().acquire("gemini", self.model_id, tokens)
+        try:
+            response = self.client.models.generate_content(model=self.model_id, contents=prompt, config=config)
+        except errors.APIError as e:
+            if e.code == 429:
+                limiter().throttled("gemini", self.model_id)
+            limiter().settle("gemini", self.model_id, tokens, (0, 0))
+            raise
+        usage = response.usage_metadata
+        if usage is not None:
+            limiter().settle("gemini", self.model_id, tokens,
+                             (usage.prompt_token_count or 0, usage.candidates_token_count or 0))
+        limiter().succeeded("gemini", self.model_id)
+        return response
+
     def compress_context(self, content: str) -> str:
         """
         Compresses large markdown content into a high-density, context-rich summary
@@ -54,10 +85,9 @@ class ContentFactoryService:
         CONTENT:
         {content}
         """
-        response = self.client.models.generate_content(
-            model=self.model_id,
-            contents=prompt,
-            config=types.GenerateContentConfig(
+        response = self._generate(
+            prompt,
+            types.GenerateContentConfig(
                 temperature=0.0, # Deterministic summary
             )
         )
@@ -105,10 +135,9 @@ class ContentFactoryService:
         {markdown_content}
         """
 
-        response = self.client.models.generate_content(
-            model=self.model_id,
-            contents=prompt,
-            config=types.GenerateContentConfig(
+        response = self._generate(
+            prompt,
+            types.GenerateContentConfig(
                 system_instruction=self.system_instruction,
                 response_mime_type="application/json",
                 response_schema=coursewareDocument.model_json_schema(),